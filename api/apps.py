@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.contrib.contenttypes.models import ContentType
+        from taggit.models import TaggedItem
+        from .cache import register_invalidation
+
+        def tagged_object_tags(item):
+            content_type = ContentType.objects.get_for_id(item.content_type_id)
+            label = f'{content_type.app_label}.{content_type.model}'
+            return [label, f'{label}:{item.object_id}']
+
+        # Tags are written after the tagged object itself; refresh its entries
+        register_invalidation(TaggedItem, tagged_object_tags)
@@ -0,0 +1,253 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+TAG_PREFIX = 'apicache:tag:'
+RESPONSE_PREFIX = 'apicache:resp:'
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def get_tag_versions(tags):
+    """
+    Current version of each tag. Unknown tags are seeded with a timestamp so
+    an evicted counter never comes back at a version that was used before.
+    """
+    cache = get_cache()
+    keys = [TAG_PREFIX + tag for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_tags(tags):
+    cache = get_cache()
+    for tag in set(tags):
+        try:
+            cache.incr(TAG_PREFIX + tag)
+        except ValueError:
+            cache.set(TAG_PREFIX + tag, time.time_ns(), timeout=None)
+
+
+def model_tags(instance):
+    label = instance._meta.label_lower
+    return [label, f'{label}:{instance.pk}']
+
+
+_invalidations = {}
+
+
+def register_invalidation(model, tags=model_tags):
+    """Bump ``tags(instance)`` once the transaction saving/deleting ``model`` commits."""
+    _invalidations[model] = tags
+
+    def handler(sender, instance, raw=False, **kwargs):
+        if raw:
+            return
+        instance_tags = tags(instance)
+        transaction.on_commit(lambda: bump_tags(instance_tags))
+
+    uid = f'api_cache_{model._meta.label}'
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=f'{uid}_save')
+    post_delete.connect(handler, sender=model, weak=False, dispatch_uid=f'{uid}_delete')
+
+
+def invalidate_instances(instances):
+    """The ``register_invalidation`` bump for objects written with bulk queries, which send no signals."""
+    instance_tags = set()
+    for instance in instances:
+        tags = _invalidations.get(type(instance))
+        if tags is not None:
+            instance_tags.update(tags(instance))
+    if instance_tags:
+        transaction.on_commit(lambda: bump_tags(instance_tags))
+
+
+class CachedResponseMixin:
+    """
+    Caches the serialized data of read actions under a key built from the
+    host, path, query string, language, renderer, auth class and the current
+    versions of the view's cache tags. Saving a tagged model bumps its tag
+    version (see ``register_invalidation``), which orphans exactly the keys
+    that depended on it.
+
+    List actions depend on the model's collection tag, detail actions on the
+    instance tag; ``cache_tags`` adds tags for embedded relations.
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_tags = ()
+    cache_timeout = None
+
+    def get_cache_tags(self):
+        label = self.get_queryset().model._meta.label_lower
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        tags = [f'{label}:{lookup}'] if lookup is not None else [label]
+        return tags + list(self.cache_tags)
+
+    def get_auth_class(self):
+        user = self.request.user
+        if user.is_staff:
+            return 'staff'
+        return 'user' if user.is_authenticated else 'anon'
+
+    def get_response_cache_key(self):
+        request = self.request
+        tags = self.get_cache_tags()
+        parts = [
+            request.get_host(),
+            request.path,
+            '&'.join(sorted(request.GET.urlencode().split('&'))),
+            getattr(request, 'LANGUAGE_CODE', settings.LANGUAGE_CODE),
+            request.accepted_renderer.format,
+            self.get_auth_class(),
+            *(f'{tag}={version}' for tag, version in zip(tags, get_tag_versions(tags))),
+        ]
+        return RESPONSE_PREFIX + hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._response_cache_key = None
+        if request.method != 'GET' or self.action not in self.cache_actions:
+            return
+
+        self._response_cache_key = self.get_response_cache_key()
+        cached = get_cache().get(self._response_cache_key)
+        if cached is not None:
+            # Authentication, permissions and content negotiation have run;
+            # swap the handler so dispatch() returns the cached payload.
+            data, status = cached
+            self.get = lambda *args, **kwargs: self._cached_response(data, status)
+
+    def _cached_response(self, data, status):
+        self._response_cache_key = None
+        response = Response(data, status=status)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        key = getattr(self, '_response_cache_key', None)
+        if key and response.status_code == 200 and hasattr(response, 'data'):
+            timeout = self.cache_timeout or getattr(settings, 'API_CACHE_TIMEOUT', 300)
+            get_cache().set(key, (response.data, response.status_code), timeout)
+            response['X-Cache'] = 'MISS'
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    Answers conditional GET/HEAD requests (``If-None-Match`` /
+    ``If-Modified-Since``) with 304 before the serializer runs.
+
+    Views that also use ``CachedResponseMixin`` derive the ETag from the
+    response cache key, which already carries their tag versions, so no
+    query is needed. Other views aggregate ``max(updated_at)`` and ``count``
+    of the filtered rows plus of each lookup in ``conditional_related``
+    (embedded children with their own ``updated_at``); the aggregate runs
+    before the handler only when the request has a conditional header, and
+    after it for the validators of a 200 response.
+
+    ``Last-Modified`` is only sent for aggregated detail actions: a deleted
+    row never raises ``max(updated_at)``, so list clients must revalidate by
+    ETag.
+    """
+    conditional_actions = ('list', 'retrieve')
+    conditional_related = ()
+    last_modified_field = 'updated_at'
+
+    def get_conditional_lookup(self):
+        return self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+
+    def get_conditional_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup = self.get_conditional_lookup()
+        if lookup is not None:
+            queryset = queryset.filter(**{self.lookup_field: lookup})
+        return queryset
+
+    def has_conditional_headers(self):
+        return 'HTTP_IF_NONE_MATCH' in self.request.META or 'HTTP_IF_MODIFIED_SINCE' in self.request.META
+
+    def make_etag(self, parts):
+        return 'W/' + quote_etag(hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest())
+
+    def get_conditional_validators(self):
+        """Return ``(etag, last_modified)``, or None for a missing detail object."""
+        cache_key = getattr(self, '_response_cache_key', None)
+        if cache_key:
+            return self.make_etag([cache_key, str(self.request.user.pk)]), None
+
+        field = self.last_modified_field
+        lookups = [field] + [f'{related}__{field}' for related in self.conditional_related]
+        aggregates = {'count': Count('pk', distinct=True)}
+        for i, related in enumerate(self.conditional_related):
+            aggregates[f'count_{i}'] = Count(f'{related}__pk', distinct=True)
+        for i, lookup in enumerate(lookups):
+            aggregates[f'max_{i}'] = Max(lookup)
+        values = self.get_conditional_queryset().aggregate(**aggregates)
+
+        is_detail = self.get_conditional_lookup() is not None
+        if is_detail and not values['count']:
+            return None
+        timestamps = [values[f'max_{i}'] for i in range(len(lookups)) if values[f'max_{i}']]
+        last_modified = max(timestamps) if is_detail and timestamps else None
+
+        request = self.request
+        parts = [
+            request.path,
+            '&'.join(sorted(request.GET.urlencode().split('&'))),
+            getattr(request, 'LANGUAGE_CODE', settings.LANGUAGE_CODE),
+            request.accepted_renderer.format,
+            str(request.user.pk),
+            *(f'{key}={value}' for key, value in sorted(values.items())),
+        ]
+        if hasattr(self, 'get_cache_tags'):
+            parts.extend(str(version) for version in get_tag_versions(self.get_cache_tags()))
+        return self.make_etag(parts), last_modified
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._conditional_validators = None
+        self._conditional_pending = request.method in ('GET', 'HEAD') and self.action in self.conditional_actions
+        if not self._conditional_pending:
+            return
+        if not getattr(self, '_response_cache_key', None) and not self.has_conditional_headers():
+            # Nothing to compare against: the validators are computed for the response instead
+            return
+
+        self._conditional_pending = False
+        self._conditional_validators = self.get_conditional_validators()
+        if self._conditional_validators is None:
+            return
+        etag, last_modified = self._conditional_validators
+        not_modified = get_conditional_response(
+            request, etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+        if not_modified is not None:
+            # Same trick as CachedResponseMixin: skip the handler (and the serializer).
+            setattr(self, request.method.lower(), lambda *args, **kwargs: not_modified)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, '_conditional_pending', False) and response.status_code == 200:
+            self._conditional_pending = False
+            self._conditional_validators = self.get_conditional_validators()
+        validators = getattr(self, '_conditional_validators', None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return super().finalize_response(request, response, *args, **kwargs)
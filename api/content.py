@@ -0,0 +1,261 @@
+import hashlib
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .cache import invalidate_instances
+
+# Bump to re-render everything on the next save or ``render_content --rebuild``
+PIPELINE_VERSION = 1
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'figcaption', 'figure', 'h2', 'h3', 'h4',
+    'h5', 'h6', 'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span', 'strong', 'sub', 'sup',
+    'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+GLOBAL_ATTRIBUTES = {'dir', 'lang'}
+URL_ATTRIBUTES = {'href', 'src'}
+URL_SCHEMES = {'', 'http', 'https', 'mailto', 'tel'}
+# Dropped together with everything inside them
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template', 'svg', 'math', 'head', 'title'}
+VOID_TAGS = {'br', 'hr', 'img'}
+BLOCK_TAGS = {
+    'blockquote', 'br', 'div', 'figcaption', 'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'li', 'ol', 'p', 'pre', 'table', 'tr', 'ul',
+}
+_WORD_RE = re.compile(r'\w+')
+
+
+def _clean_url(value):
+    value = ''.join(char for char in value.strip() if ord(char) > 32)
+    try:
+        scheme = urlsplit(value).scheme.lower()
+    except ValueError:
+        return None
+    return value if scheme in URL_SCHEMES else None
+
+
+class _Sanitizer(HTMLParser):
+    """Allowlist HTML sanitizer that also collects the plain text and image sources."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html, self.text, self.images, self.open_tags = [], [], [], []
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.skip += 1
+            return
+        if self.skip:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        if tag not in ALLOWED_TAGS:
+            return
+
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set()) | GLOBAL_ATTRIBUTES
+        cleaned = {}
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES:
+                value = _clean_url(value)
+                if not value:
+                    continue
+            cleaned[name] = value
+        if tag == 'img':
+            if 'src' not in cleaned:
+                return
+            self.images.append(cleaned['src'])
+        if tag == 'a' and urlsplit(cleaned.get('href', '')).scheme in ('http', 'https'):
+            cleaned['rel'] = 'nofollow noopener'
+
+        self.html.append('<%s%s>' % (tag, ''.join(f' {name}="{escape(value)}"' for name, value in cleaned.items())))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.skip = max(self.skip - 1, 0)
+            return
+        if self.skip:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        if tag in self.open_tags:
+            while self.open_tags:
+                current = self.open_tags.pop()
+                self.html.append(f'</{current}>')
+                if current == tag:
+                    break
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.html.append(escape(data, quote=False))
+            self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.html.append(f'</{self.open_tags.pop()}>')
+
+
+def sanitize_html(value):
+    """``(html, text, images)`` of editor HTML: allowlisted markup, plain text and image sources."""
+    parser = _Sanitizer()
+    parser.feed(value or '')
+    parser.close()
+    lines = (' '.join(line.split()) for line in ''.join(parser.text).split('\n'))
+    return ''.join(parser.html), '\n'.join(line for line in lines if line), parser.images
+
+
+def make_excerpt(text, length):
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+    cut = text[:length]
+    return (cut.rsplit(' ', 1)[0] if ' ' in cut else cut) + '…'
+
+
+def render(value):
+    """Every derivative of one HTML document, as ``RenderedContent`` field values."""
+    html, text, images = sanitize_html(value)
+    words = len(_WORD_RE.findall(text))
+    return {
+        'html': html,
+        'text': text,
+        'excerpt': make_excerpt(text, getattr(settings, 'CONTENT_EXCERPT_LENGTH', 300)),
+        'word_count': words,
+        'reading_time': math.ceil(words / getattr(settings, 'CONTENT_WORDS_PER_MINUTE', 200)),
+        'images': images,
+    }
+
+
+def source_hash(value):
+    return hashlib.md5(f'{PIPELINE_VERSION}|{value or ""}'.encode('utf-8')).hexdigest()
+
+
+RENDERED_FIELDS = ['html', 'text', 'excerpt', 'word_count', 'reading_time', 'images']
+
+
+class ContentPipeline:
+    """
+    Registry of models with editor HTML fields. Saving a registered object
+    stores a ``RenderedContent`` row per changed field: documents up to
+    ``CONTENT_RENDER_INLINE_LIMIT`` characters are rendered on the spot,
+    longer ones are marked stale (keeping the previous rendering) for
+    ``manage.py render_content`` to pick up.
+    """
+
+    def __init__(self):
+        self._registry = {}
+
+    def register(self, model, *fields):
+        self._registry[model] = fields
+        post_save.connect(self._handle_save, sender=model, dispatch_uid=f'content_pipeline_save_{model._meta.label}')
+
+    def is_registered(self, model):
+        return model in self._registry
+
+    @property
+    def models(self):
+        return list(self._registry)
+
+    def update(self, instance, defer=True):
+        return self.bulk_update([instance], defer=defer)
+
+    def bulk_update(self, instances, defer=False, force=False):
+        """Store the derivatives of ``instances`` (one model) whose sources changed."""
+        from .models import RenderedContent
+
+        if not instances:
+            return 0
+        fields = self._registry[type(instances[0])]
+        content_type = ContentType.objects.get_for_model(instances[0])
+        existing = {}
+        if not force:
+            existing = {
+                (object_id, field): digest for object_id, field, digest in RenderedContent.objects.filter(
+                    content_type=content_type, object_id__in=[instance.pk for instance in instances],
+                ).values_list('object_id', 'field', 'source_hash')
+            }
+
+        limit = getattr(settings, 'CONTENT_RENDER_INLINE_LIMIT', 100000)
+        rendered, stale = [], []
+        for instance in instances:
+            for field in fields:
+                source = getattr(instance, field) or ''
+                digest = source_hash(source)
+                if existing.get((instance.pk, field)) == digest:
+                    continue
+                row = RenderedContent(content_type=content_type, object_id=instance.pk, field=field, source_hash=digest)
+                if defer and len(source) > limit:
+                    row.is_stale = True
+                    stale.append(row)
+                else:
+                    for name, value in render(source).items():
+                        setattr(row, name, value)
+                    rendered.append(row)
+
+        unique_fields = ['content_type', 'object_id', 'field']
+        if rendered:
+            RenderedContent.objects.bulk_create(
+                rendered, update_conflicts=True, unique_fields=unique_fields,
+                update_fields=RENDERED_FIELDS + ['source_hash', 'is_stale', 'updated_at'],
+            )
+        if stale:
+            # The previous rendering stays served until the worker catches up
+            RenderedContent.objects.bulk_create(
+                stale, update_conflicts=True, unique_fields=unique_fields,
+                update_fields=['source_hash', 'is_stale', 'updated_at'],
+            )
+        return len(rendered) + len(stale)
+
+    def render_stale(self, batch_size=50):
+        """Render one batch of stale rows; returns how many rows were settled."""
+        from .models import RenderedContent
+
+        rows = list(RenderedContent.objects.filter(is_stale=True).order_by('pk')[:batch_size])
+        by_type = {}
+        for row in rows:
+            by_type.setdefault(row.content_type_id, []).append(row)
+
+        changed = []
+        for content_type_id, type_rows in by_type.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            instances = model._default_manager.in_bulk([row.object_id for row in type_rows])
+            for row in type_rows:
+                instance = instances.get(row.object_id)
+                if instance is None:
+                    row.delete()
+                    continue
+                source = getattr(instance, row.field) or ''
+                # A save that lands meanwhile changes source_hash and keeps the row stale
+                updated = RenderedContent.objects.filter(pk=row.pk, source_hash=row.source_hash).update(
+                    source_hash=source_hash(source), is_stale=False, updated_at=timezone.now(), **render(source),
+                )
+                if updated:
+                    changed.append(instance)
+        invalidate_instances(changed)
+        return len(rows)
+
+    def _handle_save(self, sender, instance, raw=False, **kwargs):
+        if not raw:
+            self.update(instance)
+
+
+content_pipeline = ContentPipeline()
@@ -0,0 +1,20 @@
+from rest_framework import filters
+
+from .search import search_index
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` backed by the full-text index for registered models, ranked
+    by relevance unless the client asks for an explicit ``?ordering=``.
+    Unregistered models fall back to the regular ``search_fields`` lookup.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not search_index.is_registered(queryset.model):
+            return super().filter_queryset(request, queryset, view)
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        rank = not request.query_params.get(filters.OrderingFilter.ordering_param)
+        return search_index.filter(queryset, query, rank=rank)
@@ -0,0 +1,247 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from PIL import Image, ImageOps, features
+
+from .cache import invalidate_instances
+
+logger = logging.getLogger(__name__)
+
+# Bump to regenerate every rendition on the next save or ``build_image_renditions --force``
+RENDITION_VERSION = 1
+
+# A (width, height) pair is cropped to exactly that size, a single width is scaled to it
+DEFAULT_RENDITIONS = {'thumb': (320, 320), '480w': 480, '960w': 960, '1600w': 1600}
+DEFAULT_FORMATS = ('avif', 'webp', 'jpeg')
+ENCODER_OPTIONS = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+FEATURES = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def get_renditions():
+    return getattr(settings, 'IMAGE_RENDITIONS', DEFAULT_RENDITIONS)
+
+
+def get_formats():
+    return [fmt for fmt in getattr(settings, 'IMAGE_RENDITION_FORMATS', DEFAULT_FORMATS) if features.check(FEATURES[fmt])]
+
+
+def render_rendition(data, label, spec, formats, smallest=False):
+    """
+    Encode one rendition of the image ``data`` in every format; runs in a
+    worker process. Returns ``(width, height, [(label, format, width,
+    height, bytes)])`` where the first pair is the source size. Widths are
+    never upscaled, except that the ``smallest`` one always yields a file.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        source.seek(0)
+        image = ImageOps.exif_transpose(source)
+        width, height = image.size
+        if isinstance(spec, (tuple, list)):
+            resized = ImageOps.fit(image, tuple(spec), Image.Resampling.LANCZOS)
+        elif spec >= width and not smallest:
+            return width, height, []
+        else:
+            resized = image.copy()
+            resized.thumbnail((min(spec, width), height * 10), Image.Resampling.LANCZOS)
+
+    has_alpha = resized.mode in ('RGBA', 'LA', 'PA') or 'transparency' in resized.info
+    outputs = []
+    for fmt in formats:
+        if fmt == 'jpeg':
+            if has_alpha:
+                background = Image.new('RGB', resized.size, 'white')
+                background.paste(resized.convert('RGBA'), mask=resized.convert('RGBA').getchannel('A'))
+                frame = background
+            else:
+                frame = resized.convert('RGB')
+        else:
+            frame = resized.convert('RGBA' if has_alpha else 'RGB')
+        buffer = io.BytesIO()
+        frame.save(buffer, format=fmt.upper(), **ENCODER_OPTIONS.get(fmt, {}))
+        outputs.append((label, fmt, frame.width, frame.height, buffer.getvalue()))
+    return width, height, outputs
+
+
+def rendition_name(source_name, digest, label, fmt):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    extension = 'jpg' if fmt == 'jpeg' else fmt
+    return os.path.join(directory, 'renditions', f'{stem}.{digest}.{label}.{extension}')
+
+
+class ImagePipeline:
+    """
+    Registry of image fields with derivative renditions. When a registered
+    field gets a new file, saving only flags ``<field>_renditions`` as
+    pending; ``render_pending`` (``build_image_renditions --loop``) then
+    encodes every rendition of ``get_renditions()`` in every supported
+    format (in a process pool) and stores them next to the original under a
+    content-hashed name. ``<field>_renditions`` records the result and is
+    all the read path needs.
+    """
+
+    def __init__(self):
+        self._registry = {}
+
+    def register(self, model, field):
+        self._registry[model] = field
+        uid = f'image_pipeline_{model._meta.label}'
+        post_save.connect(self._handle_save, sender=model, dispatch_uid=f'{uid}_save')
+        post_delete.connect(self._handle_delete, sender=model, dispatch_uid=f'{uid}_delete')
+
+    @property
+    def models(self):
+        return list(self._registry)
+
+    def get_field(self, model):
+        return self._registry[model]
+
+    def is_current(self, instance):
+        field = self._registry[type(instance)]
+        renditions = getattr(instance, f'{field}_renditions') or {}
+        name = getattr(instance, field).name
+        return not name or (renditions.get('source') == name and renditions.get('version') == RENDITION_VERSION)
+
+    def mark_pending(self, instance):
+        """Flag ``instance`` for ``render_pending``; the previous files stay listed so they can be cleaned up."""
+        field = self._registry[type(instance)]
+        renditions = getattr(instance, f'{field}_renditions') or {}
+        if renditions.get('pending'):
+            return
+        marked = {**renditions, 'pending': True}
+        type(instance)._default_manager.filter(
+            pk=instance.pk, **{field: getattr(instance, field).name}
+        ).update(**{f'{field}_renditions': marked})
+        setattr(instance, f'{field}_renditions', marked)
+
+    def render_pending(self, batch_size=20, workers=None):
+        """Render one batch of pending images per model; returns how many were settled."""
+        total = 0
+        for model, field in self._registry.items():
+            instances = list(
+                model._default_manager.filter(**{f'{field}_renditions__pending': True}).order_by('pk')[:batch_size]
+            )
+            self.bulk_update(instances, workers=workers)
+            for instance in instances:
+                renditions = getattr(instance, f'{field}_renditions')
+                if not renditions.get('pending'):
+                    continue
+                if self.is_current(instance):
+                    settled = {key: value for key, value in renditions.items() if key != 'pending'}
+                else:
+                    # Unreadable or undecodable: drop the old renditions, the next upload flags it again
+                    self._delete_files(renditions)
+                    settled = {}
+                model._default_manager.filter(
+                    pk=instance.pk, **{field: getattr(instance, field).name}
+                ).update(**{f'{field}_renditions': settled})
+            total += len(instances)
+        return total
+
+    def bulk_update(self, instances, workers=None, force=False):
+        """Generate missing or outdated renditions of ``instances`` (one model); returns how many changed."""
+        instances = [instance for instance in instances if force or not self.is_current(instance)]
+        if not instances:
+            return 0
+        model = type(instances[0])
+        field = self._registry[model]
+        renditions, formats = get_renditions(), get_formats()
+        widths = {label: spec for label, spec in renditions.items() if not isinstance(spec, (tuple, list))}
+        smallest = min(widths, key=widths.get) if widths else None
+        workers = getattr(settings, 'IMAGE_RENDITION_WORKERS', os.cpu_count()) if workers is None else workers
+
+        jobs = {}
+        for instance in instances:
+            file = getattr(instance, field)
+            try:
+                with file.storage.open(file.name, 'rb') as handle:
+                    data = handle.read()
+            except (OSError, ValueError):
+                logger.warning('Cannot read %s of %s #%s', file.name, model._meta.label, instance.pk)
+                continue
+            digest = hashlib.sha1(f'{RENDITION_VERSION}|{sorted(renditions.items())}|'.encode() + data).hexdigest()[:12]
+            jobs[instance.pk] = (instance, file, digest, [
+                (data, label, spec, formats, label == smallest) for label, spec in renditions.items()
+            ])
+
+        results = self._render(jobs, workers)
+        changed = []
+        for pk, (instance, file, digest, _) in jobs.items():
+            outputs = results.get(pk)
+            if outputs is None:
+                continue
+            width, height, files = outputs
+            stored = []
+            for label, fmt, rendition_width, rendition_height, content in files:
+                name = rendition_name(file.name, digest, label, fmt)
+                if not default_storage.exists(name):
+                    name = default_storage.save(name, ContentFile(content))
+                stored.append({'label': label, 'format': fmt, 'width': rendition_width, 'height': rendition_height, 'name': name})
+            data = {'source': file.name, 'version': RENDITION_VERSION, 'width': width, 'height': height, 'files': stored}
+
+            previous = getattr(instance, f'{field}_renditions') or {}
+            # Guarded on the source so a newer upload is never overwritten with stale renditions
+            updated = model._default_manager.filter(pk=pk, **{field: file.name}).update(**{f'{field}_renditions': data})
+            if updated:
+                setattr(instance, f'{field}_renditions', data)
+                self._delete_files(previous, keep={item['name'] for item in stored})
+                changed.append(instance)
+        invalidate_instances(changed)
+        return len(changed)
+
+    def _render(self, jobs, workers):
+        """``{pk: (width, height, files)}``; images Pillow cannot decode are left out."""
+        tasks = [(pk, args) for pk, (_, _, _, task_args) in jobs.items() for args in task_args]
+        results, failed = {}, set()
+
+        def collect(pk, outcome):
+            width, height, files = outcome
+            _, _, collected = results.setdefault(pk, (width, height, []))
+            collected.extend(files)
+
+        if workers and workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                futures = [(pk, pool.submit(render_rendition, *args)) for pk, args in tasks]
+                for pk, future in futures:
+                    try:
+                        collect(pk, future.result())
+                    except Exception:
+                        failed.add(pk)
+        else:
+            for pk, args in tasks:
+                try:
+                    collect(pk, render_rendition(*args))
+                except Exception:
+                    failed.add(pk)
+        for pk in failed:
+            logger.warning('Cannot render renditions of #%s', pk)
+            results.pop(pk, None)
+        return results
+
+    def _delete_files(self, renditions, keep=()):
+        for item in (renditions or {}).get('files', []):
+            if item['name'] not in keep:
+                default_storage.delete(item['name'])
+
+    def _handle_save(self, sender, instance, raw=False, **kwargs):
+        if not raw and not self.is_current(instance):
+            self.mark_pending(instance)
+
+    def _handle_delete(self, sender, instance, **kwargs):
+        renditions = getattr(instance, f'{self._registry[sender]}_renditions')
+        transaction.on_commit(lambda: self._delete_files(renditions))
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.images import image_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or outdated image renditions for all registered image fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=20)
+        parser.add_argument('--workers', type=int, help='Encoder processes (default IMAGE_RENDITION_WORKERS)')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that are up to date')
+        parser.add_argument('--loop', action='store_true', help='Keep rendering newly uploaded images instead of backfilling')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            self.render_pending(options)
+            return
+
+        for model in image_pipeline.models:
+            field = image_pipeline.get_field(model)
+            queryset = model._default_manager.exclude(**{field: ''}).order_by('pk')
+
+            total, last_pk = 0, 0
+            while True:
+                chunk = list(queryset.filter(pk__gt=last_pk)[:options['chunk_size']])
+                if not chunk:
+                    break
+                total += image_pipeline.bulk_update(chunk, workers=options['workers'], force=options['force'])
+                last_pk = chunk[-1].pk
+            self.stdout.write(f'{model._meta.label}: rendered {total} images')
+
+    def render_pending(self, options):
+        while True:
+            total = 0
+            while True:
+                rendered = image_pipeline.render_pending(batch_size=options['chunk_size'], workers=options['workers'])
+                total += rendered
+                if not rendered:
+                    break
+            if total:
+                self.stdout.write(f'Rendered {total} uploaded images')
+            time.sleep(options['interval'])
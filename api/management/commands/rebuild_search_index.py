@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.models import SearchDocument
+from api.search import search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all registered models'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only re-index objects updated after this ISO datetime')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--clear', action='store_true', help='Drop existing documents first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            SearchDocument.objects.all().delete()
+
+        for model in search_index.models:
+            queryset = model._default_manager.order_by('pk')
+            if options['since'] and hasattr(model, 'updated_at'):
+                queryset = queryset.filter(updated_at__gte=options['since'])
+
+            total, last_pk = 0, 0
+            while True:
+                chunk = list(queryset.filter(pk__gt=last_pk)[:options['chunk_size']])
+                if not chunk:
+                    break
+                total += search_index.bulk_update(chunk)
+                last_pk = chunk[-1].pk
+            self.stdout.write(f'{model._meta.label}: indexed {total} objects')
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.content import content_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Render stale editor HTML derivatives (sanitized HTML, text, excerpt, reading time)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='Keep rendering instead of exiting when done')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep between sweeps with --loop')
+        parser.add_argument('--rebuild', action='store_true', help='Re-render every object of the registered models first')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            for model in content_pipeline.models:
+                queryset = model._default_manager.order_by('pk')
+                total, last_pk = 0, 0
+                while True:
+                    chunk = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+                    if not chunk:
+                        break
+                    total += content_pipeline.bulk_update(chunk, force=True)
+                    last_pk = chunk[-1].pk
+                self.stdout.write(f'{model._meta.label}: rendered {total} fields')
+
+        while True:
+            total = 0
+            while True:
+                rendered = content_pipeline.render_stale(batch_size=options['batch_size'])
+                total += rendered
+                if rendered < options['batch_size']:
+                    break
+            if total or not options['loop']:
+                self.stdout.write(f'Rendered {total} stale documents')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
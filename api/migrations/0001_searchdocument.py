@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE api_searchdocument_fts USING fts5("
+    "title, body, content='api_searchdocument', content_rowid='id', tokenize='unicode61')",
+    "CREATE TRIGGER api_searchdocument_fts_ai AFTER INSERT ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER api_searchdocument_fts_ad AFTER DELETE ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchdocument_fts(api_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER api_searchdocument_fts_au AFTER UPDATE ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchdocument_fts(api_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO api_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS api_searchdocument_fts_au',
+    'DROP TRIGGER IF EXISTS api_searchdocument_fts_ad',
+    'DROP TRIGGER IF EXISTS api_searchdocument_fts_ai',
+    'DROP TABLE IF EXISTS api_searchdocument_fts',
+]
+POSTGRES_FORWARD = [
+    "CREATE INDEX api_searchdocument_fts ON api_searchdocument USING GIN (("
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')))",
+]
+POSTGRES_BACKWARD = ['DROP INDEX IF EXISTS api_searchdocument_fts']
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params=None)
+    return run
+
+
+create_fulltext_index = _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+drop_fulltext_index = _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'search document',
+                'verbose_name_plural': 'search documents',
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='api_searchdocument_object_uniq')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_searchdocument'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('field', models.CharField(max_length=100)),
+                ('source_hash', models.CharField(max_length=32)),
+                ('html', models.TextField(blank=True)),
+                ('text', models.TextField(blank=True)),
+                ('excerpt', models.TextField(blank=True)),
+                ('word_count', models.PositiveIntegerField(default=0)),
+                ('reading_time', models.PositiveIntegerField(default=0)),
+                ('images', models.JSONField(blank=True, default=list)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'rendered content',
+                'verbose_name_plural': 'rendered content',
+                'indexes': [models.Index(condition=models.Q(('is_stale', True)), fields=['id'], name='api_renderedcontent_stale_idx')],
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id', 'field'), name='api_renderedcontent_field_uniq')],
+            },
+        ),
+    ]
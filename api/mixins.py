@@ -0,0 +1,213 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .cache import invalidate_instances
+from .content import content_pipeline
+from .query import query_plan_for
+from .serializers import BulkListSerializer
+from .tree import build_tree
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryPlanMixin:
+    """
+    Applies the select/prefetch plan of the action's serializer to the
+    queryset and checks each request against ``query_budgets``.
+
+    Budgets are only measured when ``DEBUG`` or ``API_QUERY_BUDGET_RAISE`` is
+    on; with the latter set (e.g. in test settings) an over-budget request
+    raises ``QueryBudgetExceeded`` instead of logging a warning.
+    """
+    query_budgets = {}
+
+    def get_query_plan(self):
+        return query_plan_for(self.get_serializer_class())
+
+    def filter_queryset(self, queryset):
+        return self.get_query_plan().apply(super().filter_queryset(queryset), defer=False)
+
+    def dispatch(self, request, *args, **kwargs):
+        raise_on_exceed = getattr(settings, 'API_QUERY_BUDGET_RAISE', False)
+        if not self.query_budgets or not (settings.DEBUG or raise_on_exceed):
+            return super().dispatch(request, *args, **kwargs)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = super().dispatch(request, *args, **kwargs)
+        budget = self.query_budgets.get(getattr(self, 'action', None))
+        if budget is not None and len(queries) > budget:
+            message = (
+                f'{type(self).__name__}.{self.action} ran {len(queries)} queries '
+                f'(budget {budget}) for {request.get_full_path()}'
+            )
+            if raise_on_exceed:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class SparseFieldsetMixin(QueryPlanMixin):
+    """
+    Serves ``list_serializer_class`` for list actions and forwards
+    ``?fields=a,b`` / ``?expand=c`` to serializers using
+    ``SparseFieldsetSerializerMixin``. Read querysets are narrowed with
+    ``.only()`` to the columns the pruned serializer actually reads.
+    """
+    list_serializer_class = None
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.list_serializer_class is not None:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def _get_param_list(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return tuple(sorted({item.strip() for item in value.split(',') if item.strip()}))
+
+    def get_sparse_fieldset(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None, ()
+        return self._get_param_list('fields'), self._get_param_list('expand') or ()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_sparse_fieldset()
+        return context
+
+    def get_query_plan(self):
+        fields, expand = self.get_sparse_fieldset()
+        return query_plan_for(self.get_serializer_class(), fields, expand)
+
+    def filter_queryset(self, queryset):
+        queryset = super(QueryPlanMixin, self).filter_queryset(queryset)
+        defer = self.request is not None and self.request.method in SAFE_METHODS
+        return self.get_query_plan().apply(queryset, defer=defer)
+
+
+class TreeMixin:
+    """Read endpoints for ``TreeNode`` models; each loads in a single query."""
+
+    def perform_update(self, serializer):
+        try:
+            super().perform_update(serializer)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({'parent': exc.messages})
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        nodes = self.filter_queryset(self.get_queryset()).order_by('path')
+        data = [dict(node) for node in self.get_serializer(nodes, many=True).data]
+        return Response(build_tree(data))
+
+    @action(detail=True, methods=['get'])
+    def descendants(self, request, pk=None):
+        queryset = self.get_object().descendants()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object().ancestors(), many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def breadcrumb(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object().breadcrumb(), many=True).data)
+
+
+class BulkWriteMixin:
+    """
+    Adds ``<list>/bulk/``: POST a list of objects to create them, PATCH a
+    list of objects carrying their ``id`` to update them, DELETE a list of
+    ids. Items are validated together by ``BulkListSerializer`` and each
+    request commits in one transaction; the response lists the written
+    objects reloaded through the view's queryset.
+    """
+    bulk_max_size = 500
+
+    def get_bulk_queryset(self):
+        """Objects a bulk update or delete may touch."""
+        return self.get_queryset()
+
+    def get_bulk_save_kwargs(self):
+        """Attributes set on every created object, e.g. the parent from the URL."""
+        return {}
+
+    def perform_bulk_save(self, serializer):
+        if serializer.instance is None:
+            return serializer.save(**self.get_bulk_save_kwargs())
+        return serializer.save()
+
+    def perform_bulk_destroy(self, queryset):
+        queryset.delete()
+
+    def bulk_saved(self, instances):
+        """Runs inside the transaction; bulk queries send no signals, so cache tags are bumped here."""
+        invalidate_instances(instances)
+        if instances and content_pipeline.is_registered(type(instances[0])):
+            content_pipeline.bulk_update(instances, defer=True)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request, *args, **kwargs):
+        if request.method == 'DELETE':
+            return self.bulk_destroy(request)
+
+        partial = request.method == 'PATCH'
+        instances = None
+        if partial:
+            items = request.data if isinstance(request.data, list) else []
+            ids = {str(item.get('id')) for item in items if isinstance(item, dict)}
+            instances = list(self.get_bulk_queryset().filter(pk__in=[pk for pk in ids if pk.isdigit()]))
+        serializer = BulkListSerializer(
+            child=self.get_serializer(partial=partial),
+            instance=instances,
+            data=request.data,
+            partial=partial,
+            allow_empty=False,
+            max_length=self.bulk_max_size,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                saved = self.perform_bulk_save(serializer)
+                self.bulk_saved(saved)
+        except IntegrityError:
+            raise serializers.ValidationError({'non_field_errors': [_('The objects conflict with existing ones.')]})
+
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk__in=[obj.pk for obj in saved]).order_by('pk')
+        return Response(
+            self.get_serializer(queryset, many=True).data,
+            status=status.HTTP_200_OK if partial else status.HTTP_201_CREATED,
+        )
+
+    def bulk_destroy(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else request.data
+        if not isinstance(ids, list) or not ids or not all(str(pk).isdigit() for pk in ids):
+            raise serializers.ValidationError({'ids': [_('A list of ids is required.')]})
+        if len(ids) > self.bulk_max_size:
+            raise serializers.ValidationError({'ids': [_('At most %d ids are allowed.') % self.bulk_max_size]})
+
+        queryset = self.get_bulk_queryset().filter(pk__in=ids)
+        with transaction.atomic():
+            missing = {int(pk) for pk in ids} - set(queryset.values_list('pk', flat=True))
+            if missing:
+                raise serializers.ValidationError({'ids': [_('Unknown ids: %s') % ', '.join(map(str, sorted(missing)))]})
+            self.perform_bulk_destroy(queryset)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,3 +1,76 @@
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+
+class DenormalizedFieldsMixin:
+    """
+    For models whose ``denormalized_fields`` are maintained by single-UPDATE
+    ``F()`` writes elsewhere. An ordinary save of an existing row leaves
+    them out, so a stale in-memory copy never overwrites concurrent updates.
+    """
+    denormalized_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.denormalized_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class SearchDocument(models.Model):
+    """
+    Normalized, HTML-free text of a searchable object. The full-text index
+    itself (FTS5 on SQLite, a GIN expression index on PostgreSQL) is created
+    by the migration and kept in sync by the database.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    title = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('search document')
+        verbose_name_plural = _('search documents')
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='api_searchdocument_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} #{self.object_id}"
+
+
+class RenderedContent(models.Model):
+    """
+    Derivatives of one editor HTML field of an object (see api.content):
+    sanitized HTML, plain text, excerpt, reading time in minutes and image
+    sources. ``source_hash`` identifies the source they were made from.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    field = models.CharField(max_length=100)
+    source_hash = models.CharField(max_length=32)
+    html = models.TextField(blank=True)
+    text = models.TextField(blank=True)
+    excerpt = models.TextField(blank=True)
+    word_count = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveIntegerField(default=0)
+    images = models.JSONField(default=list, blank=True)
+    is_stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('rendered content')
+        verbose_name_plural = _('rendered content')
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id', 'field'], name='api_renderedcontent_field_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(is_stale=True), name='api_renderedcontent_stale_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} #{self.object_id} {self.field}"
@@ -0,0 +1,216 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from decimal import InvalidOperation
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def approximate_count(queryset, limit=10000):
+    """
+    Cheap row count for pagination metadata. PostgreSQL returns the planner
+    estimate for the filtered queryset; other backends count exactly but stop
+    at ``limit`` rows.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset[:limit].count()
+
+
+class AnnotationColumn:
+    """Stands in for a model field when the ordering uses an annotation, e.g. a search rank."""
+    null = False
+
+    def __init__(self, name):
+        self.name = self.attname = name
+
+    def to_python(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(value)
+        return value
+
+    def value_to_string(self, obj):
+        return getattr(obj, self.name)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-method pagination over the queryset's ordering plus the primary key.
+
+    Each page is fetched with a ``WHERE (a, b, id) < (...)`` style predicate
+    instead of ``OFFSET``, so deep pages cost the same as the first one when
+    the ordering is backed by an index. NULL sorts as the largest value, as
+    in PostgreSQL, so descending indexes serve ``-published_at`` directly.
+    Counts are only computed on ``?count=true`` and are approximate.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = approximate_count(queryset)
+
+        self.columns = self.get_columns(queryset)
+        values, reverse = self.decode_cursor(request)
+
+        queryset = self.ensure_loaded(queryset)
+        queryset = queryset.order_by(*self.get_order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self.get_seek_filter(values, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_columns(self, queryset):
+        opts = queryset.model._meta
+        ordering = list(queryset.query.order_by or opts.ordering)
+        columns, names = [], set()
+        for item in ordering:
+            if not isinstance(item, str) or '__' in item or item == '?':
+                raise ImproperlyConfigured(
+                    f'KeysetPagination only supports ordering on local fields, got {item!r}'
+                )
+            descending = item.startswith('-')
+            name = item.lstrip('-')
+            if name in queryset.query.annotations:
+                field = AnnotationColumn(name)
+            else:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            if field.name in names:
+                continue
+            names.add(field.name)
+            columns.append((field, descending))
+        if opts.pk.name not in names:
+            columns.append((opts.pk, columns[0][1] if columns else False))
+        return columns
+
+    def ensure_loaded(self, queryset):
+        field_names, defer = queryset.query.deferred_loading
+        if defer or not field_names:
+            return queryset
+        columns = [field.name for field, _ in self.columns if not isinstance(field, AnnotationColumn)]
+        return queryset.only(*field_names, *columns)
+
+    def get_order_by(self, reverse):
+        order_by = []
+        for field, descending in self.columns:
+            expression = F(field.name)
+            if descending != reverse:
+                order_by.append(expression.desc(nulls_first=True) if field.null else expression.desc())
+            else:
+                order_by.append(expression.asc(nulls_last=True) if field.null else expression.asc())
+        return order_by
+
+    def get_seek_filter(self, values, reverse):
+        condition = None
+        for (field, descending), value in reversed(list(zip(self.columns, values))):
+            name = field.name
+            descending = descending != reverse
+            if value is None:
+                # NULL is the largest value: only non-NULLs follow it, and only when descending
+                after = Q(**{f'{name}__isnull': False}) if descending else None
+                equal = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+                if field.null and not descending:
+                    after |= Q(**{f'{name}__isnull': True})
+                equal = Q(**{name: value})
+            tail = equal & condition if condition is not None else None
+            if after is None:
+                condition = tail if tail is not None else Q(pk__in=[])
+            else:
+                condition = after | tail if tail is not None else after
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            raw_values, reverse = payload['v'], bool(payload.get('r'))
+            if len(raw_values) != len(self.columns):
+                raise ValueError
+            values = [
+                None if raw is None else field.to_python(raw)
+                for (field, _), raw in zip(self.columns, raw_values)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeError, DjangoValidationError, InvalidOperation):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, obj, reverse):
+        # value_to_string keeps full precision (DjangoJSONEncoder truncates microseconds)
+        values = [
+            None if getattr(obj, field.attname) is None else field.value_to_string(obj)
+            for field, _ in self.columns
+        ]
+        payload = {'v': values, 'r': 1} if reverse else {'v': values}
+        encoded = urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
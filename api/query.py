@@ -0,0 +1,163 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    """
+    select_related/prefetch_related plan derived from a serializer tree.
+
+    Nested many-serializers become ``Prefetch`` objects whose querysets carry
+    their own (recursive) plan, so a whole serializer tree loads in a fixed
+    number of queries regardless of page size.
+    """
+
+    def __init__(self, select_related=(), prefetch_related=(), only=None):
+        self.select_related = list(dict.fromkeys(select_related))
+        # (lookup, model, nested plan); model/plan are None for plain lookups
+        self.prefetch_related = list(prefetch_related)
+        # Concrete columns the serializer reads, or None when it cannot be known
+        self.only = only
+
+    def __bool__(self):
+        return bool(self.select_related or self.prefetch_related)
+
+    def __repr__(self):
+        return f'<QueryPlan select={self.select_related} prefetch={[p[0] for p in self.prefetch_related]}>'
+
+    def get_prefetches(self):
+        prefetches = []
+        for lookup, model, plan in self.prefetch_related:
+            if model is None:
+                prefetches.append(lookup)
+            else:
+                prefetches.append(Prefetch(lookup, queryset=plan.apply(model._default_manager.all())))
+        return prefetches
+
+    def apply(self, queryset, defer=True):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.get_prefetches())
+        if defer and self.only is not None:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+    def prefixed(self, prefix):
+        return QueryPlan(
+            [f'{prefix}__{lookup}' for lookup in self.select_related],
+            [(f'{prefix}__{lookup}', model, plan) for lookup, model, plan in self.prefetch_related],
+        )
+
+    def merge(self, other):
+        self.select_related = list(dict.fromkeys(self.select_related + other.select_related))
+        seen = {lookup for lookup, _, _ in self.prefetch_related}
+        self.prefetch_related += [p for p in other.prefetch_related if p[0] not in seen]
+
+    @classmethod
+    def for_serializer(cls, serializer, model=None, required=()):
+        model = model or serializer.Meta.model
+        plan = cls()
+        for field in serializer._readable_fields:
+            plan.merge(_plan_field(model, field))
+        plan.only = _only_fields(model, serializer, plan, required)
+        return plan
+
+
+def _follow(model, attrs):
+    """
+    Walk ``attrs`` through ``model`` relations. Returns the chain of forward
+    FK/one-to-one names, the to-many relation field that ended the walk (if any),
+    the model reached and whether every attr was a relation.
+    """
+    chain = []
+    for index, name in enumerate(attrs):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return chain, None, model, False
+        if not field.is_relation or field.related_model is None:
+            return chain, None, model, False
+        if field.many_to_many or field.one_to_many:
+            return chain, field, field.related_model, index == len(attrs) - 1
+        chain.append(name)
+        model = field.related_model
+    return chain, None, model, True
+
+
+def _plan_field(model, field):
+    attrs = field.source_attrs
+    if not attrs:
+        if isinstance(field, serializers.BaseSerializer) and not isinstance(field, serializers.ListSerializer):
+            return QueryPlan.for_serializer(field, model)
+        return QueryPlan()
+
+    chain, many, related_model, consumed = _follow(model, attrs)
+    prefix = '__'.join(chain)
+    select = [prefix] if prefix else []
+
+    if many is not None:
+        lookup = '__'.join(chain + [many.name])
+        child = getattr(field, 'child', None)
+        if consumed and isinstance(child, serializers.ModelSerializer):
+            # Reverse FK prefetches match rows to parents via the child's FK
+            required = [many.field.name] if many.one_to_many else []
+            nested = QueryPlan.for_serializer(child, related_model, required)
+            return QueryPlan(select, [(lookup, related_model, nested)])
+        return QueryPlan(select, [(lookup, None, None)])
+
+    if isinstance(field, serializers.ModelSerializer) and consumed:
+        nested = QueryPlan.for_serializer(field, related_model)
+        plan = nested.prefixed(prefix) if prefix else nested
+        plan.select_related.insert(0, prefix)
+        return plan
+
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and consumed:
+        # The pk-only optimisation reads ``<fk>_id`` without a join
+        chain = chain[:-1]
+    return QueryPlan(['__'.join(chain)] if chain else [])
+
+
+def _only_fields(model, serializer, plan, required):
+    names = set(required)
+    for field in serializer._readable_fields:
+        attrs = field.source_attrs
+        if not attrs:
+            # Method fields and ``source='*'`` may touch any column
+            return None
+        try:
+            model_field = model._meta.get_field(attrs[0])
+        except FieldDoesNotExist:
+            return None
+        if model_field.concrete and not model_field.many_to_many:
+            names.add(model_field.name)
+        elif not model_field.is_relation:
+            return None
+    names.update(lookup.split('__')[0] for lookup in plan.select_related)
+    names.update(lookup.split('__')[0] for lookup, _, _ in plan.prefetch_related if '__' in lookup)
+    return sorted(names)
+
+
+@lru_cache(maxsize=None)
+def _field_names(serializer_class):
+    return frozenset(serializer_class().get_fields())
+
+
+@lru_cache(maxsize=512)
+def _query_plan_for(serializer_class, fields, expand):
+    kwargs = {'fields': fields, 'expand': expand} if fields is not None or expand else {}
+    return QueryPlan.for_serializer(serializer_class(**kwargs))
+
+
+def query_plan_for(serializer_class, fields=None, expand=()):
+    """
+    Cached plan of ``serializer_class`` pruned to ``fields``/``expand``. Names
+    come from the query string, so unknown ones are dropped before the cache
+    lookup and cannot grow it.
+    """
+    names = _field_names(serializer_class)
+    if fields is not None:
+        fields = tuple(sorted(names.intersection(fields)))
+    return _query_plan_for(serializer_class, fields, tuple(sorted(names.intersection(expand))))
@@ -0,0 +1,233 @@
+import re
+from html import unescape
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import (
+    BooleanField, Case, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+
+# Arabic code points folded onto their Persian forms, Persian/Arabic-Indic
+# digits folded to ASCII, ZWNJ joined and diacritics/tatweel dropped.
+_CHAR_MAP = str.maketrans({
+    '\u064a': '\u06cc', '\u0649': '\u06cc',  # Arabic yeh / alef maksura -> Persian yeh
+    '\u0643': '\u06a9',  # Arabic kaf -> Persian keheh
+    '\u0629': '\u0647',  # teh marbuta -> heh
+    '\u0623': '\u0627', '\u0625': '\u0627', '\u0671': '\u0627',  # hamza forms of alef
+    '\u200c': '', '\u200f': '', '\u0640': '',  # ZWNJ, RLM, tatweel
+    **{chr(0x06f0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(code): '' for code in range(0x064b, 0x0653)},  # harakat
+})
+_WORD_RE = re.compile(r'\w+')
+
+
+def strip_html(value):
+    return unescape(strip_tags(value or ''))
+
+
+def normalize_text(value):
+    return ' '.join(_WORD_RE.findall(value.translate(_CHAR_MAP).lower()))
+
+
+def tokenize(value):
+    return normalize_text(value).split()
+
+
+class BaseSearchBackend:
+    # Whether a larger ``rank`` is a better match
+    rank_descending = False
+
+    def documents(self, content_type, query):
+        """
+        ``SearchDocument`` rows of ``content_type`` matching ``query``,
+        annotated with ``rank``; None when the query has no searchable terms.
+        """
+        raise NotImplementedError
+
+    def filter(self, queryset, content_type, query, rank=True):
+        """
+        Narrow ``queryset`` to the matching objects in SQL, so every match
+        stays reachable by pagination and counts. With ``rank`` the objects
+        are annotated with ``search_rank`` and ordered best match first.
+        """
+        documents = self.documents(content_type, query)
+        if documents is None:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=documents.values('object_id'))
+        if rank:
+            score = Subquery(documents.filter(object_id=OuterRef('pk')).values('rank')[:1])
+            queryset = queryset.annotate(search_rank=score).order_by(
+                '-search_rank' if self.rank_descending else 'search_rank'
+            )
+        return queryset
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """Substring match over the normalized documents, title matches first; no index required."""
+
+    def documents(self, content_type, query):
+        from .models import SearchDocument
+
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        documents = SearchDocument.objects.filter(content_type=content_type)
+        in_title = Q()
+        for token in tokens:
+            documents = documents.filter(Q(title__contains=token) | Q(body__contains=token))
+            in_title &= Q(title__contains=token)
+        return documents.annotate(rank=Case(When(in_title, then=Value(0)), default=Value(1), output_field=IntegerField()))
+
+
+class BM25(Func):
+    """bm25() of the FTS5 row behind the ``api_searchdocument`` id given as the expression."""
+    template = (
+        '(SELECT bm25(api_searchdocument_fts, 10.0, 1.0) FROM api_searchdocument_fts '
+        'WHERE api_searchdocument_fts MATCH %%s AND api_searchdocument_fts.rowid = %(expressions)s)'
+    )
+    output_field = FloatField()
+
+    def __init__(self, expression, match):
+        super().__init__(expression)
+        self.match = match
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(compiler, connection, **extra_context)
+        return sql, [self.match, *params]
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 external-content index over ``api_searchdocument`` ranked by bm25."""
+    sql = 'SELECT rowid FROM api_searchdocument_fts WHERE api_searchdocument_fts MATCH %s'
+
+    def documents(self, content_type, query):
+        from .models import SearchDocument
+
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        match = ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+        return SearchDocument.objects.filter(
+            content_type=content_type, pk__in=RawSQL(self.sql, [match]),
+        ).annotate(rank=BM25('pk', match))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector match served by the ``api_searchdocument_fts`` GIN index."""
+    rank_descending = True
+    # Must stay identical to the indexed expression; columns are unqualified so
+    # the fragments keep working when the documents become a subquery
+    vector = (
+        "setweight(to_tsvector('simple', title), 'A') || "
+        "setweight(to_tsvector('simple', body), 'B')"
+    )
+
+    def documents(self, content_type, query):
+        from .models import SearchDocument
+
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        return SearchDocument.objects.filter(
+            RawSQL(f"({self.vector}) @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField()),
+            content_type=content_type,
+        ).annotate(rank=RawSQL(f"ts_rank({self.vector}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField()))
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connection.vendor, BasicSearchBackend)()
+
+
+class SearchIndex:
+    """
+    Registry of searchable models. ``title`` and ``body`` name model
+    attributes; their text is HTML-stripped and normalized before indexing.
+    Registered models are re-indexed on save and dropped on delete.
+    """
+
+    def __init__(self):
+        self._registry = {}
+
+    def register(self, model, title, body=()):
+        self._registry[model] = (title, tuple(body))
+        post_save.connect(self._handle_save, sender=model, dispatch_uid=f'search_index_save_{model._meta.label}')
+        post_delete.connect(self._handle_delete, sender=model, dispatch_uid=f'search_index_delete_{model._meta.label}')
+
+    def is_registered(self, model):
+        return model in self._registry
+
+    @property
+    def models(self):
+        return list(self._registry)
+
+    def build_document(self, instance):
+        title_attr, body_attrs = self._registry[type(instance)]
+        title = normalize_text(strip_html(getattr(instance, title_attr)))
+        body = normalize_text(' '.join(strip_html(getattr(instance, attr)) for attr in body_attrs))
+        return title, body
+
+    def update(self, instance):
+        from .models import SearchDocument
+
+        title, body = self.build_document(instance)
+        SearchDocument.objects.update_or_create(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk,
+            defaults={'title': title, 'body': body},
+        )
+
+    def bulk_update(self, instances):
+        from .models import SearchDocument
+
+        documents = []
+        for instance in instances:
+            title, body = self.build_document(instance)
+            documents.append(SearchDocument(
+                content_type=ContentType.objects.get_for_model(instance),
+                object_id=instance.pk, title=title, body=body,
+            ))
+        SearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['content_type', 'object_id'],
+            update_fields=['title', 'body', 'updated_at'],
+        )
+        return len(documents)
+
+    def remove(self, instance):
+        from .models import SearchDocument
+
+        SearchDocument.objects.filter(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk,
+        ).delete()
+
+    def filter(self, queryset, query, rank=True):
+        """``queryset`` narrowed to the objects matching ``query`` (see ``BaseSearchBackend.filter``)."""
+        return get_backend().filter(queryset, ContentType.objects.get_for_model(queryset.model), query, rank)
+
+    def _handle_save(self, sender, instance, raw=False, **kwargs):
+        if not raw:
+            self.update(instance)
+
+    def _handle_delete(self, sender, instance, **kwargs):
+        self.remove(instance)
+
+
+search_index = SearchIndex()
@@ -0,0 +1,221 @@
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+
+from .content import RENDERED_FIELDS, render
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Drops fields not listed in ``fields`` and any ``Meta.expandable_fields``
+    not listed in ``expand``. Both come from the constructor kwargs or, for
+    read requests, from the ``fields``/``expand`` keys of the context.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        if request is not None and request.method in SAFE_METHODS:
+            fields = fields if fields is not None else self.context.get('fields')
+            expand = expand if expand is not None else self.context.get('expand')
+        expand = set(expand or ())
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+
+        for name in list(self.fields):
+            if name in expandable and name not in expand:
+                self.fields.pop(name)
+            elif fields is not None and name not in fields and name not in expand:
+                self.fields.pop(name)
+
+
+class RenderedContentField(serializers.Field):
+    """
+    Read-only derivatives of an editor HTML field (see api.content), taken
+    from the object's ``rendered_content`` so the query plan prefetches them.
+    ``parts`` narrows the output, e.g. to ``['excerpt', 'reading_time']``.
+    """
+
+    def __init__(self, field, parts=None, **kwargs):
+        kwargs['source'] = 'rendered_content'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.content_field = field
+        self.parts = parts or RENDERED_FIELDS
+
+    def to_representation(self, manager):
+        row = next((row for row in manager.all() if row.field == self.content_field), None)
+        if row is None or (row.is_stale and not row.html):
+            # Not rendered yet (e.g. saved with a bulk query)
+            values = render(getattr(manager.instance, self.content_field))
+        else:
+            values = {name: getattr(row, name) for name in RENDERED_FIELDS}
+        return {name: values[name] for name in self.parts}
+
+
+class ImageRenditionsField(serializers.Field):
+    """
+    The renditions recorded by api.images for ``source`` (a
+    ``<field>_renditions`` column) as URLs: every rendition by label and
+    format, plus a ``srcset`` string per format over the width renditions.
+    Empty until the renditions of the current file exist, so clients keep
+    the original as fallback.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def to_representation(self, renditions):
+        sizes, srcset = {}, {}
+        if (renditions or {}).get('pending'):
+            # The files are those of the previous upload
+            renditions = {}
+        for item in (renditions or {}).get('files', []):
+            url = self.url(item['name'])
+            size = sizes.setdefault(item['label'], {'width': item['width'], 'height': item['height']})
+            size[item['format']] = url
+            if item['label'].endswith('w'):
+                srcset.setdefault(item['format'], []).append(f"{url} {item['width']}w")
+        return {'sizes': sizes, 'srcset': {fmt: ', '.join(entries) for fmt, entries in srcset.items()}}
+
+
+class _PrefetchedRelation:
+    """Stands in for a related field's queryset so each item resolves from one ``in_bulk``."""
+
+    def __init__(self, model, objects):
+        self.model = model
+        self.objects = objects
+
+    def get(self, pk):
+        try:
+            return self.objects[str(pk)]
+        except KeyError:
+            raise self.model.DoesNotExist
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    Validates and writes a list of ``child`` objects with a constant number
+    of queries: primary key relations are fetched with one ``in_bulk`` per
+    field, unique fields are checked with one query per field, creates use
+    ``bulk_create`` and updates ``bulk_update``.
+
+    For updates pass ``instance`` (an iterable of objects); every item then
+    needs the ``id`` of one of them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instance_map = {str(obj.pk): obj for obj in self.instance or ()}
+        self.matched_instances = []
+
+    def _related_fields(self):
+        return [
+            field for field in self.child.fields.values()
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and not field.read_only
+        ]
+
+    def _unique_fields(self):
+        fields = {}
+        for field in self.child.fields.values():
+            validators = [v for v in field.validators if isinstance(v, UniqueValidator)]
+            if validators and not field.read_only:
+                fields[field] = validators
+        return fields
+
+    def _prefetch(self, data, field):
+        ids = set()
+        for item in data:
+            value = item.get(field.field_name) if isinstance(item, dict) else None
+            if value is not None and str(value).isdigit():
+                ids.add(int(value))
+        queryset = field.get_queryset()
+        objects = {str(pk): obj for pk, obj in queryset.in_bulk(ids).items()} if ids else {}
+        return _PrefetchedRelation(queryset.model, objects)
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            pk = data.get('id') if isinstance(data, dict) else None
+            instance = self.instance_map.get(str(pk))
+            if instance is None:
+                raise serializers.ValidationError({'id': [_('Unknown or missing id.')]})
+            self.child.instance = instance
+            self.child.initial_data = data
+            self.matched_instances.append(instance)
+        return super().run_child_validation(data)
+
+    def to_internal_value(self, data):
+        related = self._related_fields()
+        unique = self._unique_fields()
+        saved = [(field, field.queryset) for field in related]
+        if isinstance(data, list):
+            for field in related:
+                field.queryset = self._prefetch(data, field)
+        for field in unique:
+            field.validators = [v for v in field.validators if v not in unique[field]]
+        self.matched_instances = []
+        try:
+            validated = super().to_internal_value(data)
+        finally:
+            for field, queryset in saved:
+                field.queryset = queryset
+            for field, validators in unique.items():
+                field.validators += validators
+        self._check_unique(validated, unique)
+        return validated
+
+    def _check_unique(self, validated, unique):
+        errors = {}
+        updating = [obj.pk for obj in self.matched_instances]
+        for field, validators in unique.items():
+            values = [item.get(field.source) for item in validated]
+            queryset = validators[0].queryset
+            taken = set(
+                queryset.filter(**{f'{field.source}__in': [v for v in values if v is not None]})
+                .exclude(pk__in=updating).values_list(field.source, flat=True)
+            )
+            seen = set()
+            for index, value in enumerate(values):
+                if value is None:
+                    continue
+                if value in taken or value in seen:
+                    errors.setdefault(index, {})[field.field_name] = [validators[0].message]
+                seen.add(value)
+        if errors:
+            if not api_settings.LIST_SERIALIZER_ERRORS_AS_DICT:
+                errors = [errors.get(index, {}) for index in range(len(validated))]
+            raise serializers.ValidationError(errors)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create([model(**attrs) for attrs in validated_data])
+
+    def update(self, instances, validated_data):
+        fields = set()
+        for instance, attrs in zip(self.matched_instances, validated_data):
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+                fields.add(name)
+        if fields:
+            # bulk_update skips pre_save(), so auto_now fields are stamped here
+            model = self.child.Meta.model
+            for model_field in model._meta.concrete_fields:
+                if getattr(model_field, 'auto_now', False):
+                    now = timezone.now()
+                    for instance in self.matched_instances:
+                        setattr(instance, model_field.attname, now)
+                    fields.add(model_field.name)
+            model.objects.bulk_update(self.matched_instances, sorted(fields))
+        return self.matched_instances
@@ -1,3 +1,308 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+from base64 import urlsafe_b64encode
+from datetime import timedelta
 
-# Create your tests here.
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from blog.models import Category, Post
+from users.models import User
+from .content import content_pipeline, render, sanitize_html
+from .images import image_pipeline
+from .cache import get_cache
+from .models import RenderedContent, SearchDocument
+from .search import SQLiteSearchBackend, get_backend
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def png(name):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'red').save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(
+            CACHES=LOCMEM_CACHES, MEDIA_ROOT=media_root,
+            IMAGE_RENDITIONS={'thumb': (16, 16), '32w': 32}, IMAGE_RENDITION_FORMATS=['jpeg'],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.category = Category.objects.create(name='c', slug='c')
+
+    def create_post(self, image):
+        return Post.objects.create(
+            title='p', slug='p', summary='s', content='<p>c</p>', featured_image=image,
+            author=self.author, category=self.category,
+        )
+
+    def renditions(self, post):
+        return Post.objects.values_list('featured_image_renditions', flat=True).get(pk=post.pk)
+
+    def test_upload_is_only_flagged_and_rendered_by_the_worker(self):
+        post = self.create_post(png('a.png'))
+        self.assertEqual(self.renditions(post), {'pending': True})
+
+        self.assertEqual(image_pipeline.render_pending(workers=1), 1)
+        renditions = self.renditions(post)
+        self.assertNotIn('pending', renditions)
+        self.assertEqual(renditions['source'], post.featured_image.name)
+        self.assertEqual(sorted(item['label'] for item in renditions['files']), ['32w', 'thumb'])
+        self.assertEqual(image_pipeline.render_pending(workers=1), 0)
+
+    def test_undecodable_upload_is_not_retried(self):
+        post = self.create_post(SimpleUploadedFile('a.png', b'not an image', content_type='image/png'))
+        self.assertEqual(image_pipeline.render_pending(workers=1), 1)
+        self.assertEqual(self.renditions(post), {})
+        self.assertEqual(image_pipeline.render_pending(workers=1), 0)
+
+
+def cursor(values, reverse=False):
+    payload = {'v': values, 'r': 1} if reverse else {'v': values}
+    return urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        author = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        category = Category.objects.create(name='c', slug='c')
+        now = timezone.now()
+        # Two posts share a date so the primary key has to break the tie
+        for i, days in enumerate([1, 2, 2, 3, 4]):
+            Post.objects.create(
+                title=f'p{i}', slug=f'p{i}', summary='s', content='<p>c</p>', featured_image='',
+                author=author, category=category, is_published=True, published_at=now - timedelta(days=days),
+            )
+        self.expected = list(Post.objects.order_by('-published_at', '-pk').values_list('pk', flat=True))
+
+    def walk(self, url, link):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.append([post['id'] for post in response.data['results']])
+            url, pages = response.data[link], pages + 1
+            self.assertLess(pages, 10)
+        return ids
+
+    def test_forward_and_backward_pages_cover_every_row_once(self):
+        forward = self.walk('/api/blog/posts/?page_size=2', 'next')
+        self.assertEqual(forward, [self.expected[0:2], self.expected[2:4], self.expected[4:]])
+
+        last = self.client.get('/api/blog/posts/?page_size=2').data['next']
+        last = self.client.get(last).data['next']
+        backward = self.walk(self.client.get(last).data['previous'], 'previous')
+        self.assertEqual(backward, [self.expected[2:4], self.expected[0:2]])
+
+    def test_malformed_cursors_are_not_found(self):
+        for value in ['not base64!', cursor(['2024-01-01T00:00:00+00:00']), cursor(['not a date', 1]),
+                      cursor([{'x': 1}, 1], reverse=True), urlsafe_b64encode(b'[1]').decode('ascii')]:
+            response = self.client.get('/api/blog/posts/', {'cursor': value})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, value)
+        response = self.client.get('/api/blog/posts/', {'cursor': cursor([1, 'x']), 'ordering': 'approved_comment_count'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SanitizerTests(SimpleTestCase):
+    def assertSanitized(self, value, html):
+        self.assertEqual(sanitize_html(value)[0], html)
+
+    def test_script_urls_are_dropped(self):
+        for href in ['javascript:alert(1)', 'JavaScript:alert(1)', 'jav&#x61;script:alert(1)',
+                     '&#106;avascript:alert(1)', ' java\tscript:alert(1)', 'data:text/html,x', 'vbscript:x']:
+            self.assertSanitized(f'<a href="{href}">x</a>', '<a>x</a>')
+        self.assertSanitized('<img src="javascript:alert(1)">', '')
+
+    def test_event_handlers_and_unknown_attributes_are_dropped(self):
+        self.assertSanitized('<img src=x onerror=alert(1)>', '<img src="x">')
+        self.assertSanitized('<p onclick="x" style="color:red" dir=rtl>hi</p>', '<p dir="rtl">hi</p>')
+
+    def test_dangerous_elements_are_dropped_with_their_content(self):
+        self.assertSanitized('<svg><script>alert(1)</script><text>t</text></svg>after', 'after')
+        self.assertSanitized('<style>p{}</style><p>a</p><script>b</script>', '<p>a</p>')
+        self.assertSanitized('<iframe src="https://e.com"></iframe><h1>T</h1>', 'T')
+
+    def test_text_and_attributes_are_escaped(self):
+        self.assertSanitized('&lt;script&gt;', '&lt;script&gt;')
+        self.assertSanitized('<img src="/a.png" alt="&quot;><script>">', '<img src="/a.png" alt="&quot;&gt;&lt;script&gt;">')
+
+    def test_unbalanced_markup_is_repaired(self):
+        self.assertSanitized('<p><b>bold', '<p><b>bold</b></p>')
+        self.assertSanitized('<ul><li>a<li>b</ul>c</div>', '<ul><li>a<li>b</li></li></ul>c')
+
+    def test_external_links_get_rel(self):
+        self.assertSanitized('<a href="https://e.com">e</a>', '<a href="https://e.com" rel="nofollow noopener">e</a>')
+        self.assertSanitized('<a href="/local">l</a>', '<a href="/local">l</a>')
+
+    @override_settings(CONTENT_EXCERPT_LENGTH=12, CONTENT_WORDS_PER_MINUTE=2)
+    def test_derivatives(self):
+        values = render('<h2>Title</h2><p>one  two<br>three <img src="/a.png"></p><script>hidden words</script>')
+        self.assertEqual(values['text'], 'Title\none two\nthree')
+        self.assertEqual(values['excerpt'], 'Title one…')
+        self.assertEqual((values['word_count'], values['reading_time']), (4, 2))
+        self.assertEqual(values['images'], ['/a.png'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CONTENT_RENDER_INLINE_LIMIT=20)
+class ContentPipelineTests(TestCase):
+    def setUp(self):
+        self.post = Post.objects.create(
+            title='p', slug='p', summary='s', content='<p>first long document</p>', featured_image='',
+            author=User.objects.create_user('alice', 'alice@example.com', 'pw'),
+            category=Category.objects.create(name='c', slug='c'),
+        )
+
+    def rendered(self):
+        return RenderedContent.objects.get(object_id=self.post.pk, field='content')
+
+    def test_long_documents_are_rendered_by_the_worker(self):
+        self.assertTrue(self.rendered().is_stale)
+        self.assertEqual(content_pipeline.render_stale(), 1)
+        row = self.rendered()
+        self.assertEqual((row.is_stale, row.text), (False, 'first long document'))
+
+    def test_a_save_during_rendering_keeps_the_row_stale(self):
+        def render_and_save(value):
+            # Another request saves new content while the worker renders the old one
+            self.post.content = '<p>second long document</p>'
+            self.post.save()
+            return render(value)
+
+        with mock.patch('api.content.render', render_and_save):
+            content_pipeline.render_stale()
+        row = self.rendered()
+        self.assertTrue(row.is_stale)
+        self.assertNotEqual(row.text, 'first long document')
+        content_pipeline.render_stale()
+        self.assertEqual(self.rendered().text, 'second long document')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.category = Category.objects.create(name='c', slug='c')
+        self.body = self.create_post('body', 'Other', '<p>a guide to kettles</p>')
+        self.title = self.create_post('title', 'Kettle guide', '<p>nothing else</p>')
+        self.persian = self.create_post('persian', 'كتاب', '<p>text</p>')
+        self.create_post('unrelated', 'Teapots', '<p>porcelain</p>')
+        get_cache().clear()
+
+    def create_post(self, slug, title, content):
+        return Post.objects.create(
+            title=title, slug=slug, summary='s', content=content, featured_image='', author=self.author,
+            category=self.category, is_published=True, published_at=timezone.now() - timedelta(days=1),
+        )
+
+    def search(self, query, **params):
+        response = self.client.get('/api/blog/posts/', {'search': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['id'] for post in response.data['results']]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('kettle'), [self.title.pk, self.body.pk])
+        self.assertEqual(self.search('gui ket'), [self.title.pk, self.body.pk])
+        self.assertEqual(self.search('porcelain kettle'), [])
+
+    @override_settings(SEARCH_BACKEND='api.search.BasicSearchBackend')
+    def test_basic_backend_ranks_title_matches_first(self):
+        self.assertEqual(self.search('kettle'), [self.title.pk, self.body.pk])
+
+    def test_sqlite_uses_the_fts_index(self):
+        self.assertIsInstance(get_backend(), SQLiteSearchBackend)
+        # Arabic letter forms are folded onto their Persian equivalents
+        self.assertEqual(self.search('کتاب'), [self.persian.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.title.title = 'Renamed'
+            self.title.save()
+        self.assertEqual(self.search('kettle'), [self.body.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.body.delete()
+        self.assertEqual(self.search('kettle'), [])
+
+    def test_every_match_is_reachable_by_pagination(self):
+        ids, url = [], '/api/blog/posts/?search=kettle&page_size=1'
+        while url:
+            response = self.client.get(url)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [self.title.pk, self.body.pk])
+        self.assertEqual(self.search('kettle', ordering='published_at'), [self.body.pk, self.title.pk])
+
+    def test_rebuild_since_only_reindexes_recent_objects(self):
+        Post.objects.filter(pk=self.body.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        SearchDocument.objects.all().delete()
+        out = io.StringIO()
+        call_command('rebuild_search_index', since=(timezone.now() - timedelta(days=1)).isoformat(), stdout=out)
+        self.assertIn('blog.Post: indexed 3 objects', out.getvalue())
+        self.assertEqual(self.search('kettle'), [self.title.pk])
+        get_cache().clear()
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('kettle'), [self.title.pk, self.body.pk])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.author = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.staff = User.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True)
+        category = Category.objects.create(name='c', slug='c')
+        self.post = Post.objects.create(
+            title='public', slug='public', summary='s', content='<p>c</p>', featured_image='', author=self.author,
+            category=category, is_published=True, published_at=timezone.now() - timedelta(days=1),
+        )
+        Post.objects.create(
+            title='draft', slug='draft', summary='s', content='<p>c</p>', featured_image='', author=self.author,
+            category=category,
+        )
+
+    def get(self, url, user=None, **headers):
+        self.client.force_authenticate(user)
+        return self.client.get(url, **headers)
+
+    def titles(self, response):
+        return sorted(post['title'] for post in response.data['results'])
+
+    def test_staff_responses_are_not_served_to_other_users(self):
+        url = '/api/blog/posts/'
+        response = self.get(url, self.staff)
+        self.assertEqual((response['X-Cache'], self.titles(response)), ('MISS', ['draft', 'public']))
+        for user in (None, self.author):
+            response = self.get(url, user)
+            self.assertEqual((response['X-Cache'], self.titles(response)), ('MISS', ['public']))
+        self.assertEqual(self.get(url, self.staff)['X-Cache'], 'HIT')
+        self.assertEqual(self.titles(self.get(url)), ['public'])
+
+    def test_saving_a_post_invalidates_its_responses(self):
+        detail, listing = f'/api/blog/posts/{self.post.pk}/', '/api/blog/posts/'
+        for url in (detail, listing):
+            self.get(url)
+            self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+        etag = self.get(detail)['ETag']
+        self.assertEqual(self.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'renamed'
+            self.post.save()
+        response = self.get(detail)
+        self.assertEqual((response['X-Cache'], response.data['title']), ('MISS', 'renamed'))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.titles(self.get(listing)), ['renamed'])
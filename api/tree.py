@@ -0,0 +1,116 @@
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.utils.translation import gettext_lazy as _
+
+STEP = 6
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def encode_segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        digits = ALPHABET[remainder] + digits
+    return digits.rjust(STEP, '0')
+
+
+def decode_segment(segment):
+    return int(segment, 36)
+
+
+def path_upper_bound(path):
+    """Smallest path that sorts after every descendant of ``path``."""
+    return path[:-STEP] + encode_segment(decode_segment(path[-STEP:]) + 1)
+
+
+def subtree_filter(path, prefix='path', include_self=True):
+    """Keyword arguments selecting the subtree rooted at ``path`` as one index range."""
+    lower = f'{prefix}__gte' if include_self else f'{prefix}__gt'
+    return {lower: path, f'{prefix}__lt': path_upper_bound(path)}
+
+
+def rebuild_tree_paths(model):
+    """Recompute every path top-down; usable from migrations with historical models."""
+    paths = {}
+    pending = list(model._default_manager.order_by('pk').values_list('pk', 'parent_id'))
+    while pending:
+        remaining = []
+        for pk, parent_id in pending:
+            if parent_id is None:
+                paths[pk] = encode_segment(pk)
+            elif parent_id in paths:
+                paths[pk] = paths[parent_id] + encode_segment(pk)
+            else:
+                remaining.append((pk, parent_id))
+        if len(remaining) == len(pending):
+            raise ValueError(f'{model._meta.label} contains a parent cycle')
+        pending = remaining
+    objects = [model(pk=pk, path=path) for pk, path in paths.items()]
+    model._default_manager.bulk_update(objects, ['path'], batch_size=500)
+
+
+def build_tree(nodes, children_key='children'):
+    """Nest serialized nodes (dicts with ``id``/``parent``) ordered by path, in O(n)."""
+    by_id, roots = {}, []
+    for node in nodes:
+        node[children_key] = []
+        by_id[node['id']] = node
+    for node in nodes:
+        parent = by_id.get(node['parent'])
+        (parent[children_key] if parent else roots).append(node)
+    return roots
+
+
+class TreeNode(models.Model):
+    """
+    Adjacency-list node (``parent``) with a materialized path of fixed-width
+    base36 primary keys, so subtrees and ancestor chains load in one query.
+    """
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+
+    class Meta:
+        abstract = True
+
+    @property
+    def depth(self):
+        return len(self.path) // STEP - 1
+
+    def get_ancestor_ids(self):
+        return [decode_segment(self.path[i:i + STEP]) for i in range(0, len(self.path) - STEP, STEP)]
+
+    def ancestors(self):
+        return type(self)._default_manager.filter(pk__in=self.get_ancestor_ids()).order_by('path')
+
+    def breadcrumb(self):
+        return type(self)._default_manager.filter(pk__in=self.get_ancestor_ids() + [self.pk]).order_by('path')
+
+    def descendants(self, include_self=False):
+        return type(self)._default_manager.filter(**subtree_filter(self.path, include_self=include_self)).order_by('path')
+
+    def save(self, *args, **kwargs):
+        manager = type(self)._default_manager
+        parent_path = ''
+        if self.parent_id:
+            parent_path = manager.filter(pk=self.parent_id).values_list('path', flat=True).get()
+            name = self._meta.verbose_name
+            if self.path and parent_path.startswith(self.path):
+                raise ValidationError(
+                    _('A %(name)s cannot be moved under itself or its descendants.') % {'name': name}
+                )
+            if len(parent_path) + STEP > self._meta.get_field('path').max_length:
+                raise ValidationError(_('The %(name)s tree cannot be nested any deeper.') % {'name': name})
+
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            old_path, new_path = self.path, parent_path + encode_segment(self.pk)
+            if old_path == new_path:
+                return
+            if old_path:
+                manager.filter(**subtree_filter(old_path)).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1))
+                )
+            else:
+                manager.filter(pk=self.pk).update(path=new_path)
+            self.path = new_path
@@ -8,12 +8,12 @@ class PostMetaInline(admin.TabularInline):
 
 @admin.register(Post)
 class PostAdmin(ModelAdmin):
-    list_display = ['title', 'author', 'category', 'is_published', 'published_at', 'created_at']
+    list_display = ['title', 'author', 'category', 'is_published', 'published_at', 'approved_comment_count', 'created_at']
     list_filter = ['is_published', 'category', 'author', 'created_at']
     search_fields = ['title', 'content', 'summary']
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'published_at'
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['went_live_at', 'created_at', 'updated_at']
     inlines = [PostMetaInline]
     
     fieldsets = (
@@ -24,7 +24,7 @@ class PostAdmin(ModelAdmin):
             'fields': ('author', 'category', 'tags')
         }),
         ('Publication', {
-            'fields': ('is_published', 'published_at')
+            'fields': ('is_published', 'published_at', 'went_live_at')
         }),
         ('SEO', {
             'fields': ('_meta_title', '_meta_description', '_meta_keywords'),
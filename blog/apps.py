@@ -4,3 +4,21 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        from api.cache import register_invalidation
+        from api.content import content_pipeline
+        from api.images import image_pipeline
+        from api.search import search_index
+        from .models import Category, Comment, Post, PostMeta
+        from . import signals  # noqa: F401
+
+        search_index.register(Post, title='title', body=['summary', 'content'])
+        content_pipeline.register(Post, 'content')
+        image_pipeline.register(Post, 'featured_image')
+
+        register_invalidation(Post)
+        register_invalidation(Category)
+        # Comments move the counters shown on post lists
+        register_invalidation(Comment, lambda comment: ['blog.post', f'blog.post:{comment.post_id}'])
+        register_invalidation(PostMeta, lambda meta: [f'blog.post:{meta.post_id}'])
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.publishing import publish_due_posts
+
+
+class Command(BaseCommand):
+    help = 'Take scheduled posts live once their published_at has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Keep publishing instead of exiting when done')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds to sleep between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                published = publish_due_posts(batch_size=options['batch_size'])
+                total += published
+                if published < options['batch_size']:
+                    break
+            if total or not options['loop']:
+                self.stdout.write(f'Published {total} scheduled posts')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_tags
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute approved comment counts and last comment times of posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('posts', nargs='*', type=int, help='Post ids (default: all posts)')
+
+    def handle(self, *args, **options):
+        ids = options['posts'] or list(Post.objects.order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for start in range(0, len(ids), options['batch_size']):
+            total += Post.rebuild_comment_stats(Post.objects.filter(pk__in=ids[start:start + options['batch_size']]))
+        bump_tags(['blog.post'] + [f'blog.post:{pk}' for pk in ids])
+        self.stdout.write(f'Rebuilt comment stats of {total} posts')
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+from api.tree import rebuild_tree_paths
+
+
+def populate_paths(apps, schema_editor):
+    rebuild_tree_paths(apps.get_model('blog', 'Comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_category_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='blog_comment_thread_idx'),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def populate_comment_stats(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    approved = Q(comments__is_approved=True)
+    rows = Post.objects.order_by().values('pk').annotate(
+        count=Count('comments', filter=approved),
+        last=Max('comments__created_at', filter=approved),
+    ).filter(count__gt=0)
+    for row in rows:
+        Post.objects.filter(pk=row['pk']).update(approved_comment_count=row['count'], last_comment_at=row['last'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_comment_path'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='approved_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['is_published', '-approved_comment_count', '-id'], name='blog_post_comment_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['is_published', '-last_comment_at', '-id'], name='blog_post_last_comment_idx'),
+        ),
+        migrations.RunPython(populate_comment_stats, migrations.RunPython.noop),
+    ]
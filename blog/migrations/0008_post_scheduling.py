@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:23
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def backfill_publication(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.filter(is_published=True, published_at__isnull=True).update(published_at=F('created_at'))
+    Post.objects.filter(is_published=True, published_at__lte=timezone.now()).update(went_live_at=F('published_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_post_comment_stats'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='went_live_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True), ('went_live_at__isnull', True)), fields=['published_at', 'id'], name='blog_post_scheduled_idx'),
+        ),
+        migrations.RunPython(backfill_publication, migrations.RunPython.noop),
+    ]
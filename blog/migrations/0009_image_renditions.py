@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='featured_image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
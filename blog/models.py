@@ -1,13 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.fields import GenericRelation
 from taggit.managers import TaggableManager
 from ckeditor.fields import RichTextField
 from meta.models import ModelMeta
+from api.models import DenormalizedFieldsMixin
+from api.tree import TreeNode
 
 User = get_user_model()
 
-class Category(models.Model):
+class Category(TreeNode):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
@@ -20,17 +26,31 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Post(ModelMeta, models.Model):
+class PostQuerySet(models.QuerySet):
+    def published(self, now=None):
+        """Posts that are live: published and due. Served by ``blog_post_published_idx``."""
+        return self.filter(is_published=True, published_at__lte=now or timezone.now())
+
+class Post(ModelMeta, DenormalizedFieldsMixin, models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     summary = models.TextField()
     content = RichTextField()
     featured_image = models.ImageField(upload_to='blog/featured_images/')
+    featured_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='posts')
     tags = TaggableManager()
+    rendered_content = GenericRelation('api.RenderedContent')
     is_published = models.BooleanField(default=False)
+    # A future published_at schedules a published post; blog.publishing announces it once due
     published_at = models.DateTimeField(null=True, blank=True)
+    went_live_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Approved comment aggregates, maintained by Post.apply_comment()
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+    denormalized_fields = ('approved_comment_count', 'last_comment_at')
     
     # SEO Fields
     _meta_title = models.CharField(max_length=200, blank=True)
@@ -40,13 +60,80 @@ class Post(ModelMeta, models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = PostQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('post')
         verbose_name_plural = _('posts')
         ordering = ['-published_at', '-created_at']
+        indexes = [
+            models.Index(
+                fields=['is_published', '-published_at', '-created_at', '-id'],
+                name='blog_post_published_idx',
+            ),
+            models.Index(
+                fields=['is_published', '-approved_comment_count', '-id'],
+                name='blog_post_comment_count_idx',
+            ),
+            models.Index(
+                fields=['is_published', '-last_comment_at', '-id'],
+                name='blog_post_last_comment_idx',
+            ),
+            # Only scheduled posts that have not gone live yet
+            models.Index(
+                fields=['published_at', 'id'],
+                condition=Q(is_published=True, went_live_at__isnull=True),
+                name='blog_post_scheduled_idx',
+            ),
+        ]
         
     def __str__(self):
         return self.title
+    
+    @property
+    def is_live(self):
+        return self.is_published and self.published_at is not None and self.published_at <= timezone.now()
+    
+    def save(self, *args, **kwargs):
+        if self.is_published and self.published_at is None:
+            self.published_at = timezone.now()
+        # Saving already invalidates caches; only posts that become due later are left to the scheduler
+        self.went_live_at = (self.went_live_at or timezone.now()) if self.is_live else None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'published_at', 'went_live_at'}
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def apply_comment(cls, post_id, created_at, delta):
+        """
+        Add (``delta=1``) or remove (``delta=-1``) one approved comment in a
+        single UPDATE, so concurrent comments never lose increments. Removing
+        one recomputes ``last_comment_at`` from the remaining approved comments.
+        """
+        if delta > 0:
+            last_comment_at = Greatest(Coalesce(F('last_comment_at'), Value(created_at)), Value(created_at))
+        else:
+            last_comment_at = Subquery(
+                Comment.objects.filter(post=OuterRef('pk'), is_approved=True)
+                .order_by('-created_at').values('created_at')[:1]
+            )
+        return cls.objects.filter(pk=post_id).update(
+            approved_comment_count=F('approved_comment_count') + delta,
+            last_comment_at=last_comment_at,
+        )
+    
+    @classmethod
+    def rebuild_comment_stats(cls, queryset=None):
+        """Recompute the aggregates from approved comments, e.g. after bulk edits."""
+        queryset = cls.objects.all() if queryset is None else queryset
+        approved = Q(comments__is_approved=True)
+        rows = queryset.order_by().values('pk').annotate(
+            count=Count('comments', filter=approved),
+            last=Max('comments__created_at', filter=approved),
+        )
+        posts = [cls(pk=row['pk'], approved_comment_count=row['count'], last_comment_at=row['last']) for row in rows]
+        cls.objects.bulk_update(posts, ['approved_comment_count', 'last_comment_at'], batch_size=500)
+        return len(posts)
 
 class PostMeta(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='meta')
@@ -61,7 +148,7 @@ class PostMeta(models.Model):
     def __str__(self):
         return f"{self.post.title} - {self.key}"
 
-class Comment(models.Model):
+class Comment(TreeNode):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
@@ -74,6 +161,32 @@ class Comment(models.Model):
         verbose_name = _('comment')
         verbose_name_plural = _('comments')
         ordering = ['-created_at']
+        indexes = [
+            # A post's threads are contiguous path ranges
+            models.Index(fields=['post', 'path'], name='blog_comment_thread_idx'),
+        ]
         
     def __str__(self):
-        return f"Comment by {self.user.username} on {self.post.title}" 
\ No newline at end of file
+        return f"Comment by {self.user.username} on {self.post.title}"
+    
+    def save(self, *args, **kwargs):
+        # Deletes (including cascades) are handled by the post_delete receiver in blog.signals
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                # Locked whether approved or not, so concurrent approvals of one comment count it once
+                row = (
+                    Comment.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list('post_id', 'created_at', 'is_approved')
+                    .first()
+                )
+                if row and row[2]:
+                    previous = row[:2]
+            super().save(*args, **kwargs)
+            current = (self.post_id, self.created_at) if self.is_approved else None
+            if previous != current:
+                if previous:
+                    Post.apply_comment(*previous, -1)
+                if current:
+                    Post.apply_comment(*current, 1) 
\ No newline at end of file
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.utils import timezone
+
+from api.cache import invalidate_instances
+from .models import Post
+
+
+def publish_due_posts(batch_size=500, now=None):
+    """
+    Take one batch of scheduled posts whose ``published_at`` has passed live;
+    returns how many were processed.
+
+    ``Post.objects.published()`` already hides posts until they are due, so
+    this only stamps ``went_live_at`` and invalidates the cached listings and
+    details that were built while the post was hidden. Rows another worker
+    holds are skipped and stamped rows never match again, so runs are
+    idempotent and several schedulers can run at once.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        posts = list(
+            Post.objects.select_for_update(skip_locked=True)
+            .filter(is_published=True, went_live_at__isnull=True, published_at__lte=now)
+            .order_by('published_at', 'id').only('pk')[:batch_size]
+        )
+        if not posts:
+            return 0
+        Post.objects.filter(pk__in=[post.pk for post in posts], went_live_at__isnull=True).update(went_live_at=now)
+        invalidate_instances(posts)
+    return len(posts)
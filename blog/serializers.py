@@ -1,4 +1,8 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from taggit.serializers import TagListSerializerField, TaggitSerializer
+from api.serializers import ImageRenditionsField, RenderedContentField, SparseFieldsetSerializerMixin
 from .models import Post, Category, PostMeta, Comment
 from django.contrib.auth import get_user_model
 
@@ -10,9 +14,11 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 class CategorySerializer(serializers.ModelSerializer):
+    depth = serializers.IntegerField(read_only=True)
+    
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'parent', 'description']
+        fields = ['id', 'name', 'slug', 'parent', 'depth', 'description']
 
 class PostMetaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,23 +27,33 @@ class PostMetaSerializer(serializers.ModelSerializer):
 
 class CommentSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    parent = serializers.PrimaryKeyRelatedField(queryset=Comment.objects.all(), required=False, allow_null=True)
+    depth = serializers.IntegerField(read_only=True)
     replies = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
         fields = [
-            'id', 'user', 'content', 'is_approved',
+            'id', 'user', 'parent', 'depth', 'content', 'is_approved',
             'created_at', 'updated_at', 'replies'
         ]
         read_only_fields = ['user', 'is_approved', 'created_at', 'updated_at']
     
+    def validate_parent(self, value):
+        if self.instance is not None and value != self.instance.parent:
+            raise serializers.ValidationError(_('A comment cannot be moved.'))
+        post_id = self.context.get('post_id')
+        if value is not None and post_id is not None and str(value.post_id) != str(post_id):
+            raise serializers.ValidationError(_('The parent comment belongs to another post.'))
+        if value is not None and value.depth >= getattr(settings, 'COMMENT_MAX_DEPTH', 8):
+            raise serializers.ValidationError(_('Replies cannot be nested any deeper.'))
+        return value
+    
     def get_replies(self, obj):
-        if obj.parent is None:  # Only get replies for top-level comments
-            replies = Comment.objects.filter(parent=obj, is_approved=True)
-            return CommentSerializer(replies, many=True).data
-        return []
+        # Nested by blog.threads.attach_replies; never queried per comment
+        return CommentSerializer(getattr(obj, 'thread_replies', []), many=True, context=self.context).data
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsetSerializerMixin, TaggitSerializer, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
@@ -46,14 +62,32 @@ class PostSerializer(serializers.ModelSerializer):
         source='category'
     )
     meta = PostMetaSerializer(many=True, read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    tags = TagListSerializerField(required=False)
+    content_rendered = RenderedContentField('content')
+    featured_image_renditions = ImageRenditionsField()
     
     class Meta:
         model = Post
         fields = [
-            'id', 'title', 'slug', 'summary', 'content',
-            'featured_image', 'author', 'category', 'category_id',
+            'id', 'title', 'slug', 'summary', 'content', 'content_rendered',
+            'featured_image', 'featured_image_renditions', 'author', 'category', 'category_id',
             'tags', 'is_published', 'published_at', 'meta',
-            'comments', 'created_at', 'updated_at'
+            'approved_comment_count', 'last_comment_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['slug', 'author', 'approved_comment_count', 'last_comment_at', 'created_at', 'updated_at']
+
+class PostListSerializer(SparseFieldsetSerializerMixin, TaggitSerializer, serializers.ModelSerializer):
+    author = UserSerializer(read_only=True)
+    category = CategorySerializer(read_only=True)
+    tags = TagListSerializerField(read_only=True)
+    content_preview = RenderedContentField('content', parts=['excerpt', 'reading_time'])
+    featured_image_renditions = ImageRenditionsField()
+    
+    class Meta:
+        model = Post
+        fields = [
+            'id', 'title', 'slug', 'summary', 'content_preview', 'featured_image',
+            'featured_image_renditions', 'author', 'category', 'tags', 'is_published', 'published_at',
+            'approved_comment_count', 'last_comment_at', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['slug', 'author', 'created_at', 'updated_at'] 
\ No newline at end of file
+        read_only_fields = fields 
\ No newline at end of file
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Comment, Post
+
+
+@receiver(post_delete, sender=Comment, dispatch_uid='blog_comment_stats_delete')
+def remove_comment_stats(sender, instance, **kwargs):
+    if instance.is_approved:
+        Post.apply_comment(instance.post_id, instance.created_at, -1)
@@ -1,3 +1,127 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.cache import get_cache
+from users.models import User
+from .models import Category, Comment, Post, PostMeta
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_post(author, category, slug, **kwargs):
+    return Post.objects.create(
+        title=kwargs.pop('title', slug), slug=slug, summary='summary', content='<p>content</p>',
+        featured_image='', author=author, category=category, **kwargs
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, API_QUERY_BUDGET_RAISE=True)
+class PostQueryCountTests(APITestCase):
+    """Query counts stay flat however many posts, tags, meta and comments a page holds."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.category = Category.objects.create(name='c', slug='c')
+        self.add_posts(3)
+
+    def add_posts(self, count):
+        for _ in range(count):
+            post = create_post(self.author, self.category, f'p{Post.objects.count()}', is_published=True)
+            post.tags.add('a', 'b')
+            PostMeta.objects.create(post=post, key='k', value='v')
+            Comment.objects.create(post=post, user=self.author, content='hi', is_approved=True)
+        get_cache().clear()
+        return post
+
+    def assertQueriesStayFlat(self, url, expected):
+        for _ in range(2):
+            path = url(self.add_posts(3))
+            with self.assertNumQueries(expected):
+                self.assertEqual(self.client.get(path).status_code, status.HTTP_200_OK)
+
+    def test_list(self):
+        self.assertQueriesStayFlat(lambda post: '/api/blog/posts/', 3)
+
+    def test_retrieve(self):
+        self.assertQueriesStayFlat(lambda post: f'/api/blog/posts/{post.pk}/', 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CommentStatsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.post = create_post(self.user, Category.objects.create(name='c', slug='c'), 'p', is_published=True)
+
+    def test_saving_a_stale_post_keeps_the_comment_stats(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        comment = Comment.objects.create(post=self.post, user=self.user, content='hi', is_approved=True)
+        stale.title = 'renamed'
+        stale.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.title, 'renamed')
+        self.assertEqual((post.approved_comment_count, post.last_comment_at), (1, comment.created_at))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ScheduledPostTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.post = create_post(
+            self.author, Category.objects.create(name='c', slug='c'), 'p',
+            is_published=True, published_at=timezone.now() + timedelta(days=1),
+        )
+        self.url = f'/api/blog/posts/{self.post.pk}/'
+
+    def test_scheduled_post_is_hidden_from_readers(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_author_and_staff_can_edit_a_scheduled_post(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(self.url, {'title': 'edited'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(self.url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Post.objects.exists())
+
+    def test_other_users_cannot_edit_a_scheduled_post(self):
+        self.client.force_authenticate(User.objects.create_user('bob', 'bob@example.com', 'pw'))
+        response = self.client.patch(self.url, {'title': 'edited'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, COMMENT_MAX_DEPTH=2)
+class CommentThreadTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.post = create_post(self.user, Category.objects.create(name='c', slug='c'), 'p', is_published=True)
+        self.url = f'/api/blog/posts/{self.post.pk}/comments/'
+        self.client.force_authenticate(self.user)
+
+    def reply(self, parent):
+        return self.client.post(self.url, {'content': 'hi', 'parent': parent}, format='json')
+
+    def test_replies_stop_at_the_maximum_depth(self):
+        parent = None
+        for depth in range(3):
+            response = self.reply(parent)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data['depth'], depth)
+            parent = response.data['id']
+        response = self.reply(parent)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('parent', response.data)
+
+    def test_a_comment_cannot_move_under_its_reply(self):
+        comment = Comment.objects.create(post=self.post, user=self.user, content='a')
+        reply = Comment.objects.create(post=self.post, user=self.user, content='b', parent=comment)
+        comment.parent = reply
+        with self.assertRaisesMessage(ValidationError, 'A comment cannot be moved under itself'):
+            comment.save()
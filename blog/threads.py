@@ -0,0 +1,33 @@
+from api.tree import path_upper_bound
+from .models import Comment
+
+
+def attach_replies(roots):
+    """
+    Load the approved replies of ``roots`` (comments of one post) in one
+    query and nest them as ``thread_replies``, oldest first. The page's
+    threads lie between its smallest and largest root path; replies under
+    an unapproved comment are left out with it.
+    """
+    roots = list(roots)
+    for root in roots:
+        root.thread_replies = []
+    if not roots:
+        return roots
+
+    paths = [root.path for root in roots]
+    replies = Comment.objects.filter(
+        post_id=roots[0].post_id, is_approved=True, parent__isnull=False,
+        path__gt=min(paths), path__lt=path_upper_bound(max(paths)),
+    ).select_related('user').order_by('path')
+
+    by_id = {root.pk: root for root in roots}
+    for reply in replies:
+        # Ordered by path, so a reachable parent is always seen before its replies
+        parent = by_id.get(reply.parent_id)
+        if parent is None:
+            continue
+        reply.thread_replies = []
+        parent.thread_replies.append(reply)
+        by_id[reply.pk] = reply
+    return roots
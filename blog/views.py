@@ -1,17 +1,32 @@
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, filters
-from django_filters.rest_framework import DjangoFilterBackend, FilterSet, CharFilter
+from rest_framework.response import Response
+from django_filters.rest_framework import DjangoFilterBackend, FilterSet, CharFilter, NumberFilter
 from .models import Post, Category, PostMeta, Comment
 from .serializers import (
-    PostSerializer, CategorySerializer, PostMetaSerializer,
-    CommentSerializer
+    PostSerializer, PostListSerializer, CategorySerializer,
+    PostMetaSerializer, CommentSerializer
 )
+from api.mixins import SparseFieldsetMixin, TreeMixin
+from api.cache import CachedResponseMixin, ConditionalGetMixin
+from api.filters import FullTextSearchFilter
+from api.pagination import KeysetPagination
+from api.tree import subtree_filter
+from .threads import attach_replies
 
 class PostFilter(FilterSet):
     tags = CharFilter(method='filter_tags')
+    category__descendants = NumberFilter(method='filter_category_descendants')
     
     def filter_tags(self, queryset, name, value):
         return queryset.filter(tags__name__in=[value])
     
+    def filter_category_descendants(self, queryset, name, value):
+        path = Category.objects.filter(pk=value).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        return queryset.filter(**subtree_filter(path, prefix='category__path'))
+    
     class Meta:
         model = Post
         fields = {
@@ -21,47 +36,95 @@ class PostFilter(FilterSet):
             'created_at': ['gte', 'lte'],
             'updated_at': ['gte', 'lte'],
             'published_at': ['gte', 'lte'],
+            'approved_comment_count': ['gte', 'lte'],
+            'last_comment_at': ['gte', 'lte'],
         }
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.filter(is_published=True)
+class PostViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.all()
     serializer_class = PostSerializer
+    list_serializer_class = PostListSerializer
+    pagination_class = KeysetPagination
+    cache_tags = ['blog.category']
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'author', 'tags']
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = PostFilter
     search_fields = ['title', 'content', 'summary']
-    ordering_fields = ['published_at', 'created_at', 'updated_at']
+    ordering_fields = ['published_at', 'created_at', 'updated_at', 'approved_comment_count', 'last_comment_at']
+    # count + page + tags, rendered content, meta + session/user
+    query_budgets = {'list': 6, 'retrieve': 6}
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [permissions.AllowAny()]
         return [permissions.IsAuthenticated()]
     
+    def get_queryset(self):
+        queryset = Post.objects.all()
+        user = self.request.user
+        if user.is_staff:
+            return queryset
+        # Evaluated per request: scheduled posts stay hidden until published_at
+        published = queryset.published()
+        if self.request.method in permissions.SAFE_METHODS:
+            return published
+        # Authors can still edit and delete their drafts and scheduled posts
+        return published | queryset.filter(author_id=user.pk)
+    
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, TreeMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_actions = ('list', 'retrieve', 'tree', 'descendants', 'ancestors', 'breadcrumb')
+    cache_tags = ['blog.category']
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name']
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'tree', 'descendants', 'ancestors', 'breadcrumb']:
             return [permissions.AllowAny()]
         return [permissions.IsAuthenticated()]
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    """
+    A post's discussion as threads: the list pages through top-level
+    comments, each with its approved replies nested (see blog.threads).
+    """
     serializer_class = CommentSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['post', 'user', 'is_approved']
+    filterset_fields = ['user']
     ordering_fields = ['created_at', 'updated_at']
     
     def get_queryset(self):
-        return Comment.objects.filter(is_approved=True)
+        return Comment.objects.filter(post_id=self.kwargs['post_pk'], is_approved=True).select_related('user')
+    
+    def get_cache_tags(self):
+        return [f'blog.post:{self.kwargs["post_pk"]}']
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['post_id'] = self.kwargs.get('post_pk')
+        return context
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).filter(parent__isnull=True)
+        page = self.paginate_queryset(queryset)
+        threads = attach_replies(page if page is not None else queryset)
+        serializer = self.get_serializer(threads, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        comment, = attach_replies([self.get_object()])
+        return Response(self.get_serializer(comment).data)
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user) 
\ No newline at end of file
+        post = get_object_or_404(Post.objects.published(), pk=self.kwargs['post_pk'])
+        serializer.save(user=self.request.user, post=post)
@@ -162,6 +162,31 @@ CACHES = {
     }
 }
 
+# Response cache for read-only API endpoints (see api.cache)
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 60 * 5
+
+# Minutes checkout holds stock for a pending order (see shop.inventory)
+STOCK_RESERVATION_MINUTES = 15
+
+# Anonymous carts live in the cache until login or checkout (see shop.cart_storage);
+# CART_STORAGE may name a BaseCartStorage subclass, otherwise Redis is used when the cache is Redis
+SESSION_CART_TTL = 60 * 60 * 24 * 7
+
+# Deepest reply level of blog comments; top-level comments are level 0 (see blog.serializers)
+COMMENT_MAX_DEPTH = 8
+
+# Editor HTML longer than this many characters is rendered by `manage.py render_content` (see api.content)
+CONTENT_RENDER_INLINE_LIMIT = 100000
+CONTENT_WORDS_PER_MINUTE = 200
+CONTENT_EXCERPT_LENGTH = 300
+
+# Image renditions (see api.images): a (width, height) pair is a cropped thumbnail, a number a responsive width
+# Encoded by `manage.py build_image_renditions --loop`, in IMAGE_RENDITION_WORKERS processes
+IMAGE_RENDITIONS = {'thumb': (320, 320), '480w': 480, '960w': 960, '1600w': 1600}
+IMAGE_RENDITION_FORMATS = ['avif', 'webp', 'jpeg']
+IMAGE_RENDITION_WORKERS = os.cpu_count()
+
 # CKEditor settings
 CKEDITOR_UPLOAD_PATH = 'uploads/'
 CKEDITOR_CONFIGS = {
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class SettingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'settings'
+
+    def ready(self):
+        from api.cache import register_invalidation
+        from api.images import image_pipeline
+        from .models import SiteSettings
+
+        register_invalidation(SiteSettings)
+        image_pipeline.register(SiteSettings, 'logo')
@@ -6,6 +6,7 @@ class SiteSettings(ModelMeta, models.Model):
     site_name = models.CharField(max_length=100)
     site_description = models.TextField()
     logo = models.ImageField(upload_to='site/')
+    logo_renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     # Contact Information
     contact_mobile = models.CharField(max_length=11, blank=True)
@@ -1,10 +1,13 @@
 from rest_framework import serializers
+from api.serializers import ImageRenditionsField
 from .models import SiteSettings
 
 class SiteSettingsSerializer(serializers.ModelSerializer):
+    logo_renditions = ImageRenditionsField()
+    
     class Meta:
         model = SiteSettings
-        fields = ('id', 'site_name', 'site_description', 'logo',
+        fields = ('id', 'site_name', 'site_description', 'logo', 'logo_renditions',
                  'contact_mobile', 'contact_email', 'contact_address',
                  'telegram_link', 'whatsapp_link', 'instagram_link',
                  'twitter_link', 'facebook_link',
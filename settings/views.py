@@ -1,8 +1,9 @@
 from rest_framework import viewsets, permissions
+from api.cache import CachedResponseMixin
 from .models import SiteSettings
 from .serializers import SiteSettingsSerializer
 
-class SiteSettingsViewSet(viewsets.ModelViewSet):
+class SiteSettingsViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = SiteSettings.objects.all()
     serializer_class = SiteSettingsSerializer
     permission_classes = [permissions.IsAdminUser]
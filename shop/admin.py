@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
 from unfold.admin import ModelAdmin
 from django.utils.translation import gettext_lazy as _
 from .models import (
@@ -7,6 +8,7 @@ from .models import (
     Order, OrderItem, Payment, Cart, CartItem, Review,
     Chapter, Lesson, UserProgress, DiscountCode, DiscountUsage
 )
+from .catalog import WRITERS, export_records
 
 @admin.register(Category)
 class CategoryAdmin(ModelAdmin):
@@ -44,6 +46,7 @@ class ProductAdmin(ModelAdmin):
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
     inlines = [ProductAttributeValueInline, ProductImageInline, ChapterInline]
+    actions = ['export_jsonl', 'export_csv']
     
     fieldsets = (
         (None, {
@@ -54,6 +57,20 @@ class ProductAdmin(ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def _export(self, queryset, feed_format, content_type):
+        # Streamed in primary key chunks; the feed can be fed back to manage.py import_catalog
+        response = StreamingHttpResponse(WRITERS[feed_format](export_records(queryset)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{feed_format}"'
+        return response
+    
+    @admin.action(description=_('Export selected products as JSONL'))
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl', 'application/x-ndjson')
+    
+    @admin.action(description=_('Export selected products as CSV'))
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv', 'text/csv')
 
 @admin.register(ProductImage)
 class ProductImageAdmin(ModelAdmin):
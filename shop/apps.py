@@ -4,3 +4,34 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        from api.cache import register_invalidation
+        from api.content import content_pipeline
+        from api.images import image_pipeline
+        from api.search import search_index
+        from .models import (
+            Category, Chapter, DiscountCode, Lesson, Product, ProductAttribute, ProductAttributeValue,
+            ProductImage, ProductVariant, Review, ShippingMethod, ShippingZone
+        )
+        from . import signals  # noqa: F401
+
+        search_index.register(Product, title='name', body=['description'])
+        content_pipeline.register(Product, 'description')
+        content_pipeline.register(Lesson, 'content')
+        image_pipeline.register(ProductImage, 'image')
+
+        register_invalidation(Product)
+        register_invalidation(Category)
+        register_invalidation(ShippingMethod)
+        register_invalidation(ShippingZone)
+        register_invalidation(DiscountCode)
+        register_invalidation(ProductImage, lambda image: ['shop.product', f'shop.product:{image.product_id}'])
+        register_invalidation(ProductVariant, lambda variant: [f'shop.product:{variant.product_id}'])
+        # Attribute values feed the ?attr[...] filters and facets of product lists
+        register_invalidation(ProductAttribute, lambda attribute: ['shop.product'])
+        register_invalidation(ProductAttributeValue, lambda value: ['shop.product', f'shop.product:{value.product_id}'])
+        register_invalidation(Chapter, lambda chapter: [f'shop.product:{chapter.product_id}'])
+        register_invalidation(Lesson, lambda lesson: [f'shop.product:{lesson.chapter.product_id}'])
+        # Reviews move the rating aggregates shown on product lists
+        register_invalidation(Review, lambda review: ['shop.product', f'shop.product:{review.product_id}'])
@@ -0,0 +1,170 @@
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Cart, CartItem
+from .pricing import get_item_lines
+
+CART_PREFIX = 'cart:session:'
+TOKEN_HEADER = 'HTTP_X_CART_TOKEN'
+_TOKEN_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _field(product_id, variant_id):
+    return f'{product_id}:{variant_id or 0}'
+
+
+def _parse(field):
+    product_id, variant_id = (int(part) for part in field.split(':'))
+    return product_id, variant_id or None
+
+
+class BaseCartStorage:
+    """
+    Anonymous cart kept outside the database as ``{(product_id, variant_id): quantity}``.
+    Every mutation refreshes the TTL; carts nobody touches simply expire.
+    """
+
+    def __init__(self, token):
+        self.key = CART_PREFIX + token
+        self.timeout = getattr(settings, 'SESSION_CART_TTL', 60 * 60 * 24 * 7)
+
+    def items(self):
+        raise NotImplementedError
+
+    def add(self, product_id, variant_id, quantity):
+        raise NotImplementedError
+
+    def set(self, product_id, variant_id, quantity):
+        """Set the quantity of a line; zero removes it."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class RedisCartStorage(BaseCartStorage):
+    """A Redis hash per cart; each mutation is one pipelined round-trip."""
+
+    def __init__(self, token):
+        from django_redis import get_redis_connection
+
+        super().__init__(token)
+        self.redis = get_redis_connection(getattr(settings, 'API_CACHE_ALIAS', 'default'))
+
+    def items(self):
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.key)
+        pipe.expire(self.key, self.timeout)
+        fields = pipe.execute()[0]
+        return {_parse(field.decode()): int(quantity) for field, quantity in fields.items()}
+
+    def add(self, product_id, variant_id, quantity):
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.key, _field(product_id, variant_id), quantity)
+        pipe.expire(self.key, self.timeout)
+        return pipe.execute()[0]
+
+    def set(self, product_id, variant_id, quantity):
+        pipe = self.redis.pipeline()
+        if quantity > 0:
+            pipe.hset(self.key, _field(product_id, variant_id), quantity)
+        else:
+            pipe.hdel(self.key, _field(product_id, variant_id))
+        pipe.expire(self.key, self.timeout)
+        pipe.execute()
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+class CacheCartStorage(BaseCartStorage):
+    """Fallback on any Django cache backend (local development); read-modify-write."""
+
+    def __init__(self, token):
+        super().__init__(token)
+        self.cache = caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+    def items(self):
+        return {_parse(field): quantity for field, quantity in self.cache.get(self.key, {}).items()}
+
+    def _write(self, product_id, variant_id, update):
+        fields = self.cache.get(self.key, {})
+        field = _field(product_id, variant_id)
+        quantity = update(fields.get(field, 0))
+        if quantity > 0:
+            fields[field] = quantity
+        else:
+            fields.pop(field, None)
+        self.cache.set(self.key, fields, self.timeout)
+        return quantity
+
+    def add(self, product_id, variant_id, quantity):
+        return self._write(product_id, variant_id, lambda current: current + quantity)
+
+    def set(self, product_id, variant_id, quantity):
+        self._write(product_id, variant_id, lambda current: quantity)
+
+    def clear(self):
+        self.cache.delete(self.key)
+
+
+def get_cart_storage(token):
+    path = getattr(settings, 'CART_STORAGE', None)
+    if path:
+        return import_string(path)(token)
+    backend = settings.CACHES[getattr(settings, 'API_CACHE_ALIAS', 'default')]['BACKEND']
+    if backend.startswith('django_redis.'):
+        return RedisCartStorage(token)
+    return CacheCartStorage(token)
+
+
+def get_cart_token(request, create=False):
+    """The anonymous cart token from the ``X-Cart-Token`` header or the session."""
+    token = request.META.get(TOKEN_HEADER) or request.session.get('cart_token')
+    if token and _TOKEN_RE.match(token):
+        return token
+    if not create:
+        return None
+    token = uuid.uuid4().hex
+    request.session['cart_token'] = token
+    return token
+
+
+def merge_session_cart(token, user):
+    """
+    Flush the anonymous cart into the user's database cart, adding up
+    quantities of lines present in both, then drop it. Lines pointing at
+    missing or inactive products are discarded.
+    """
+    storage = get_cart_storage(token)
+    items = storage.items()
+    if not items:
+        return None
+
+    items = {(line.product_id, line.variant_id): line.quantity for line in get_item_lines(items)}
+
+    with transaction.atomic():
+        cart = Cart.objects.filter(user=user).order_by('-updated_at').first() or Cart.objects.create(user=user)
+        existing = {
+            (item.product_id, item.variant_id): item
+            for item in CartItem.objects.select_for_update().filter(cart=cart)
+        }
+        changed, created = [], []
+        for (product_id, variant_id), quantity in items.items():
+            item = existing.get((product_id, variant_id))
+            if item is not None:
+                item.quantity += quantity
+                changed.append(item)
+            else:
+                created.append(CartItem(cart=cart, product_id=product_id, variant_id=variant_id, quantity=quantity))
+        CartItem.objects.bulk_update(changed, ['quantity'])
+        CartItem.objects.bulk_create(created)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+    storage.clear()
+    return cart
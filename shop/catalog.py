@@ -0,0 +1,416 @@
+import csv
+import json
+import os
+import urllib.request
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import groupby, islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from taggit.models import Tag, TaggedItem
+
+from api.cache import bump_tags
+from api.content import content_pipeline
+from api.search import search_index
+from .models import (
+    Category, Product, ProductAttribute, ProductAttributeValue, ProductImage, ProductType, ProductVariant
+)
+
+PRODUCT_FIELDS = ['slug', 'name', 'description', 'price', 'product_type', 'category', 'is_active']
+VARIANT_FIELDS = ['sku', 'variant_price', 'sale_price', 'stock']
+ATTRIBUTE_PREFIX = 'attr:'
+LIST_SEPARATOR = '|'
+IMAGE_DIR = 'products/gallery/'
+
+
+class FeedError(Exception):
+    pass
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _decimal(value, name):
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise FeedError(f'{name}: invalid number {value!r}')
+    return number
+
+
+def _stock(value):
+    try:
+        stock = int(value or 0)
+    except (TypeError, ValueError):
+        raise FeedError(f'stock: invalid number {value!r}')
+    if stock < 0:
+        raise FeedError(f'stock: negative value {stock}')
+    return stock
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(LIST_SEPARATOR) if part.strip()]
+
+
+def read_jsonl(stream):
+    """
+    Records of a JSONL feed: one product per line, variants nested. A line
+    that is not valid JSON yields a ``FeedError`` in its place, so the
+    importer reports it with its line number and carries on.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield FeedError(f'invalid JSON: {e.msg} (column {e.colno})')
+
+
+def read_csv(stream):
+    """
+    Records of a CSV feed: one row per variant, consecutive rows with the same
+    slug form one product whose fields come from its first row. List columns
+    (tags, images) are ``|``-separated, attributes are ``attr:<name>`` columns.
+    """
+    rows = csv.DictReader(stream)
+    for slug, group in groupby(rows, key=lambda row: row['slug'].strip()):
+        group = list(group)
+        first = group[0]
+        record = {name: first[name] for name in PRODUCT_FIELDS if first.get(name)}
+        record['slug'] = slug
+        for name in ('tags', 'images'):
+            if name in first:
+                record[name] = _split(first[name])
+        record['attributes'] = {
+            column[len(ATTRIBUTE_PREFIX):]: value.strip()
+            for column, value in first.items() if column.startswith(ATTRIBUTE_PREFIX) and value and value.strip()
+        }
+        record['variants'] = [
+            {
+                'sku': row['sku'].strip(),
+                'price': row.get('variant_price') or None,
+                'sale_price': row.get('sale_price') or None,
+                'stock': row.get('stock') or 0,
+            }
+            for row in group if (row.get('sku') or '').strip()
+        ]
+        yield record
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+class CatalogImporter:
+    """
+    Upsert product feed records in chunks, one transaction per chunk.
+
+    Categories (by slug), attributes and tags (by name) are resolved through
+    in-memory maps loaded once; unknown attributes and tags are created,
+    unknown categories reject the record. Products, variants and attribute
+    values are upserted on their natural keys; a record that lists ``tags``
+    or ``images`` replaces that product's tags or images. Bulk writes skip
+    model signals, so the search index and response cache are refreshed
+    explicitly per chunk.
+    """
+
+    def __init__(self, chunk_size=1000, download_images=True):
+        self.chunk_size = chunk_size
+        self.download_images = download_images
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.attributes = dict(ProductAttribute.objects.values_list('name', 'pk'))
+        self.tags = dict(Tag.objects.values_list('name', 'pk'))
+        self.images = {}
+        self.content_type = ContentType.objects.get_for_model(Product)
+        self.stats = Counter()
+        self.errors = []
+
+    def run(self, records):
+        records = enumerate(records, 1)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return self.stats
+            self.import_chunk(chunk)
+
+    def build_product(self, record):
+        try:
+            slug = record['slug'].strip()
+            category = record['category']
+        except KeyError as e:
+            raise FeedError(f'missing {e.args[0]}')
+        if not slug:
+            raise FeedError('missing slug')
+        if category not in self.categories:
+            raise FeedError(f'unknown category {category!r}')
+        product_type = record.get('product_type') or ProductType.PHYSICAL
+        if product_type not in ProductType.values:
+            raise FeedError(f'unknown product_type {product_type!r}')
+        return Product(
+            slug=slug,
+            name=record.get('name') or slug,
+            description=record.get('description') or '',
+            price=_decimal(record.get('price', 0), 'price'),
+            product_type=product_type,
+            category_id=self.categories[category],
+            is_active=_bool(record.get('is_active', True)),
+        )
+
+    def check_skus(self, slug, variants, owners, seen):
+        """
+        Reject SKUs owned by another product (importing them would move the
+        variant, its stock, holds and order lines) and SKUs already listed
+        earlier in the chunk.
+        """
+        listed = set()
+        for variant in variants:
+            owner = owners.get(variant.sku, slug)
+            if owner != slug:
+                raise FeedError(f'sku {variant.sku!r} belongs to product {owner!r}')
+            if variant.sku in listed or variant.sku in seen:
+                line = seen.get(variant.sku)
+                raise FeedError(f'duplicate sku {variant.sku!r}' + (f' (line {line})' if line else ''))
+            listed.add(variant.sku)
+
+    def import_chunk(self, chunk):
+        parsed = []
+        for number, record in chunk:
+            try:
+                if isinstance(record, FeedError):
+                    raise record
+                product = self.build_product(record)
+                variants = [
+                    ProductVariant(
+                        sku=variant['sku'],
+                        price=_decimal(variant.get('price') or product.price, 'variant price'),
+                        sale_price=_decimal(variant['sale_price'], 'sale_price') if variant.get('sale_price') else None,
+                        stock=_stock(variant.get('stock')),
+                    )
+                    for variant in record.get('variants') or []
+                ]
+            except (FeedError, AttributeError, KeyError, TypeError, ValueError) as e:
+                self.errors.append((number, str(e)))
+                self.stats['rejected'] += 1
+                continue
+            parsed.append((number, product, record, variants))
+
+        skus = {variant.sku for _, _, _, variants in parsed for variant in variants}
+        owners = dict(ProductVariant.objects.filter(sku__in=skus).values_list('sku', 'product__slug')) if skus else {}
+        products, records, seen = {}, {}, {}
+        for number, product, record, variants in parsed:
+            try:
+                self.check_skus(product.slug, variants, owners, seen)
+            except FeedError as e:
+                self.errors.append((number, str(e)))
+                self.stats['rejected'] += 1
+                continue
+            seen.update((variant.sku, number) for variant in variants)
+            products[product.slug] = product
+            records[product.slug] = (record, variants)
+        if not products:
+            return
+
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                list(products.values()),
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=['name', 'description', 'price', 'product_type', 'category', 'is_active', 'updated_at'],
+            )
+            for slug, pk in Product.objects.filter(slug__in=products).values_list('slug', 'pk'):
+                products[slug].pk = pk
+            self.stats['products'] += len(products)
+
+            self.import_attributes(products, records)
+            self.import_variants(products, records)
+            self.import_tags(products, records)
+            self.import_images(products, records)
+
+            search_index.bulk_update(list(products.values()))
+            content_pipeline.bulk_update(list(products.values()), defer=True)
+            tags = ['shop.product'] + [f'shop.product:{product.pk}' for product in products.values()]
+            transaction.on_commit(lambda: bump_tags(tags))
+
+    def import_attributes(self, products, records):
+        names = {name for record, _ in records.values() for name in (record.get('attributes') or {})}
+        missing = names - set(self.attributes)
+        if missing:
+            ProductAttribute.objects.bulk_create([ProductAttribute(name=name) for name in sorted(missing)])
+            self.attributes.update(ProductAttribute.objects.filter(name__in=missing).values_list('name', 'pk'))
+        values = [
+            ProductAttributeValue(product_id=products[slug].pk, attribute_id=self.attributes[name], value=str(value))
+            for slug, (record, _) in records.items()
+            for name, value in (record.get('attributes') or {}).items()
+        ]
+        ProductAttributeValue.objects.bulk_create(
+            values, update_conflicts=True, unique_fields=['product', 'attribute'], update_fields=['value']
+        )
+        self.stats['attribute values'] += len(values)
+
+    def import_variants(self, products, records):
+        variants = {}
+        for slug, (_, rows) in records.items():
+            for variant in rows:
+                variant.product_id = products[slug].pk
+                variants[variant.sku] = variant
+        ProductVariant.objects.bulk_create(
+            list(variants.values()),
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=['price', 'sale_price', 'stock'],
+        )
+        self.stats['variants'] += len(variants)
+
+    def import_tags(self, products, records):
+        tagged = {slug: record['tags'] for slug, (record, _) in records.items() if 'tags' in record}
+        if not tagged:
+            return
+        for name in {name for names in tagged.values() for name in names} - set(self.tags):
+            self.tags[name] = Tag.objects.get_or_create(name=name)[0].pk
+        TaggedItem.objects.filter(
+            content_type=self.content_type, object_id__in=[products[slug].pk for slug in tagged]
+        ).delete()
+        items = [
+            TaggedItem(tag_id=self.tags[name], content_type=self.content_type, object_id=products[slug].pk)
+            for slug, names in tagged.items() for name in dict.fromkeys(names)
+        ]
+        TaggedItem.objects.bulk_create(items)
+        self.stats['tags'] += len(items)
+
+    def import_images(self, products, records):
+        listed = {slug: record['images'] for slug, (record, _) in records.items() if 'images' in record}
+        if not listed:
+            return
+        # Rows whose file is listed again are kept: deleting them would let django-cleanup remove the file
+        existing = {
+            (product_id, name): pk for pk, product_id, name in ProductImage.objects.filter(
+                product_id__in=[products[slug].pk for slug in listed]
+            ).values_list('pk', 'product_id', 'image')
+        }
+        kept, images = [], []
+        for slug, sources in listed.items():
+            product_id = products[slug].pk
+            for order, source in enumerate(sources):
+                try:
+                    name = self.store_image(source)
+                except (OSError, ValueError) as e:
+                    self.errors.append((slug, f'image {source}: {e}'))
+                    continue
+                pk = existing.pop((product_id, name), None)
+                image = ProductImage(pk=pk, product_id=product_id, image=name, order=order)
+                (images if pk is None else kept).append(image)
+        ProductImage.objects.filter(pk__in=existing.values()).delete()
+        ProductImage.objects.bulk_update(kept, ['order'])
+        ProductImage.objects.bulk_create(images)
+        images += kept
+        self.stats['images'] += len(images)
+
+    def store_image(self, source):
+        """Storage name for an image given as a URL, a storage path or a local file."""
+        if source in self.images:
+            return self.images[source]
+        if source.startswith(('http://', 'https://')):
+            if not self.download_images:
+                raise ValueError('downloads are disabled')
+            with urllib.request.urlopen(source, timeout=10) as response:
+                data = response.read()
+            name = default_storage.save(IMAGE_DIR + os.path.basename(source.split('?')[0]), ContentFile(data))
+        elif os.path.isfile(source):
+            with open(source, 'rb') as f:
+                name = default_storage.save(IMAGE_DIR + os.path.basename(source), ContentFile(f.read()))
+        elif not os.path.isabs(source) and default_storage.exists(source):
+            name = source
+        else:
+            raise ValueError('file not found')
+        self.images[source] = name
+        return name
+
+
+def export_records(queryset=None, chunk_size=1000):
+    """
+    Feed records for ``queryset`` (default: every product), read in primary
+    key chunks with four flat queries per chunk, so memory stays constant.
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    queryset = queryset.order_by('pk')
+    content_type = ContentType.objects.get_for_model(Product)
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).values(
+            'pk', 'slug', 'name', 'description', 'price', 'product_type', 'category__slug', 'is_active'
+        )[:chunk_size])
+        if not rows:
+            return
+        ids = [row['pk'] for row in rows]
+        variants, attributes, tags, images = defaultdict(list), defaultdict(dict), defaultdict(list), defaultdict(list)
+        for product_id, sku, price, sale_price, stock in ProductVariant.objects.filter(
+            product_id__in=ids
+        ).order_by('pk').values_list('product_id', 'sku', 'price', 'sale_price', 'stock'):
+            variants[product_id].append({'sku': sku, 'price': price, 'sale_price': sale_price, 'stock': stock})
+        for product_id, name, value in ProductAttributeValue.objects.filter(
+            product_id__in=ids
+        ).order_by('pk').values_list('product_id', 'attribute__name', 'value'):
+            attributes[product_id][name] = value
+        for product_id, name in TaggedItem.objects.filter(
+            content_type=content_type, object_id__in=ids
+        ).order_by('pk').values_list('object_id', 'tag__name'):
+            tags[product_id].append(name)
+        for product_id, image in ProductImage.objects.filter(
+            product_id__in=ids
+        ).order_by('product_id', 'order', 'pk').values_list('product_id', 'image'):
+            images[product_id].append(image)
+
+        for row in rows:
+            pk = row.pop('pk')
+            row['category'] = row.pop('category__slug')
+            yield {
+                **row,
+                'tags': tags[pk],
+                'images': images[pk],
+                'attributes': attributes[pk],
+                'variants': variants[pk],
+            }
+        last_pk = ids[-1]
+
+
+def write_jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def write_csv(records):
+    """CSV lines in the layout ``read_csv`` expects: one row per variant."""
+    attributes = sorted(set(ProductAttribute.objects.values_list('name', flat=True)))
+    writer = csv.writer(_Echo())
+    yield writer.writerow(PRODUCT_FIELDS + ['tags', 'images'] + VARIANT_FIELDS + [ATTRIBUTE_PREFIX + a for a in attributes])
+    for record in records:
+        product = [record[name] for name in PRODUCT_FIELDS] + [
+            LIST_SEPARATOR.join(record['tags']), LIST_SEPARATOR.join(record['images'])
+        ]
+        values = [record['attributes'].get(name, '') for name in attributes]
+        for variant in record['variants'] or [None]:
+            if variant is None:
+                yield writer.writerow(product + [''] * len(VARIANT_FIELDS) + values)
+            else:
+                yield writer.writerow(product + [
+                    variant['sku'], variant['price'],
+                    '' if variant['sale_price'] is None else variant['sale_price'], variant['stock'],
+                ] + values)
+
+
+WRITERS = {'jsonl': write_jsonl, 'csv': write_csv}
@@ -0,0 +1,86 @@
+import uuid
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .discounts import DiscountError, redeem_discount
+from .inventory import InsufficientStock, hold_stock
+from .models import Cart, CartItem, DiscountCode, Order, OrderItem
+from .pricing import price_cart
+
+
+class CheckoutError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def generate_order_number():
+    return f'{timezone.now():%Y%m%d}-{uuid.uuid4().hex[:10].upper()}'
+
+
+def checkout(user, cart, shipping_address, shipping_method=None, discount_code=None, notes=''):
+    """
+    Turn ``cart`` into an Order. Inside one transaction the cart row is
+    locked, so a double submit or a concurrent checkout of the same cart
+    waits and then finds the lines gone. Prices, shipping and the discount
+    are computed under that lock; the order and its items are written with
+    bulk inserts, the variants' stock is held for the payment window (see
+    ``shop.inventory``), the discount is redeemed and the checked-out cart
+    lines are removed.
+    Raises ``CheckoutError`` with a user-facing message.
+    """
+    discount = None
+    if discount_code:
+        discount = DiscountCode.objects.filter(code=discount_code).first()
+        if discount is None:
+            raise CheckoutError('کد تخفیف نامعتبر است')
+
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().get(pk=cart.pk)
+        pricing = price_cart(cart, user, shipping_method, discount, use_cache=False)
+        lines = pricing.lines
+        if not lines:
+            raise CheckoutError('سبد خرید شما خالی است')
+        if pricing.discount_error:
+            raise CheckoutError(pricing.discount_error)
+
+        quantities = Counter()
+        for line in lines:
+            if line.variant_id:
+                quantities[line.variant_id] += line.quantity
+
+        order = Order.objects.create(
+            user=user,
+            order_number=generate_order_number(),
+            shipping_address=shipping_address,
+            shipping_method=shipping_method,
+            shipping_cost=pricing.shipping_cost,
+            subtotal=pricing.subtotal,
+            discount_amount=pricing.discount_amount,
+            total=pricing.total,
+            notes=notes,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product_id=line.product_id, variant_id=line.variant_id,
+                quantity=line.quantity, price=line.unit_price, total=line.total,
+            )
+            for line in lines
+        ])
+        try:
+            hold_stock(order, quantities)
+        except InsufficientStock as e:
+            raise CheckoutError(f'موجودی کالای {e.sku} کافی نیست' if e.sku else 'موجودی برخی از کالاها کافی نیست')
+        deleted, _ = CartItem.objects.filter(pk__in=[line.item_id for line in lines]).delete()
+        if deleted != len(lines):
+            # Only possible where the cart lock is not honoured: never check the same lines out twice
+            raise CheckoutError('سبد خرید شما تغییر کرده است؛ دوباره تلاش کنید')
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        if discount:
+            try:
+                redeem_discount(discount, user, order)
+            except DiscountError as e:
+                raise CheckoutError(e.message)
+    return order
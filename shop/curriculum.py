@@ -0,0 +1,80 @@
+from django.conf import settings
+
+from api.cache import get_cache, get_tag_versions
+from .models import Chapter, Lesson, UserProgress
+
+CURRICULUM_PREFIX = 'curriculum:'
+
+
+def build_curriculum(product_id):
+    """Chapters and their lessons (without content) of ``product_id``, in two queries."""
+    chapters = [
+        {'id': pk, 'title': title, 'order': order, 'lessons': []}
+        for pk, title, order in Chapter.objects.filter(product_id=product_id).values_list('pk', 'title', 'order')
+    ]
+    by_id = {chapter['id']: chapter for chapter in chapters}
+    lessons = Lesson.objects.filter(chapter__product_id=product_id).values_list(
+        'pk', 'chapter_id', 'title', 'content_type', 'duration', 'order', 'is_free',
+    )
+    for pk, chapter_id, title, content_type, duration, order, is_free in lessons:
+        by_id[chapter_id]['lessons'].append({
+            'id': pk, 'title': title, 'content_type': content_type, 'order': order, 'is_free': is_free,
+            'duration': None if duration is None else int(duration.total_seconds()),
+        })
+    return chapters
+
+
+def get_curriculum(product_id):
+    """The curriculum of ``product_id``, cached until one of its chapters or lessons changes."""
+    version = get_tag_versions([f'shop.product:{product_id}'])[0]
+    key = f'{CURRICULUM_PREFIX}{product_id}:{version}'
+    cache = get_cache()
+    chapters = cache.get(key)
+    if chapters is None:
+        chapters = build_curriculum(product_id)
+        # Versioned keys are never read again once the tag moves; let them expire
+        cache.set(key, chapters, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    return chapters
+
+
+def _percentage(values):
+    return round(sum(values) / len(values)) if values else 0
+
+
+def with_progress(chapters, user):
+    """
+    A copy of ``chapters`` with ``user``'s progress on every lesson (one
+    query) and completion percentages per chapter and for the course. A
+    completed lesson counts as 100%; anonymous users get no progress.
+    """
+    progress = {}
+    if user.is_authenticated:
+        lesson_ids = [lesson['id'] for chapter in chapters for lesson in chapter['lessons']]
+        rows = UserProgress.objects.filter(user=user, lesson_id__in=lesson_ids).values_list(
+            'lesson_id', 'is_completed', 'progress_percentage', 'last_position',
+        )
+        for lesson_id, is_completed, percentage, last_position in rows:
+            progress[lesson_id] = {
+                'is_completed': is_completed,
+                'progress_percentage': 100 if is_completed else min(percentage, 100),
+                'last_position': None if last_position is None else int(last_position.total_seconds()),
+            }
+
+    tree, course = [], []
+    for chapter in chapters:
+        lessons = [{**lesson, 'progress': progress.get(lesson['id'])} for lesson in chapter['lessons']]
+        values = [lesson['progress']['progress_percentage'] if lesson['progress'] else 0 for lesson in lessons]
+        course.extend(values)
+        tree.append({
+            **chapter,
+            'lessons': lessons,
+            'completed_lessons': sum(1 for lesson in lessons if lesson['progress'] and lesson['progress']['is_completed']),
+            'completion': _percentage(values),
+        })
+    return {
+        'chapters': tree,
+        'lessons': len(course),
+        'completed_lessons': sum(chapter['completed_lessons'] for chapter in tree),
+        'duration': sum(lesson['duration'] or 0 for chapter in chapters for lesson in chapter['lessons']),
+        'completion': _percentage(course),
+    }
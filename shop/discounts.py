@@ -0,0 +1,154 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.cache import get_cache, get_tag_versions
+from .models import DiscountCode, DiscountUsage, DiscountUserUsage
+
+RULES_PREFIX = 'discount:rules:'
+
+
+class DiscountError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+@dataclass(frozen=True)
+class DiscountRules:
+    """A code's product/category restrictions as frozensets of ids."""
+    products: frozenset = frozenset()
+    excluded_products: frozenset = frozenset()
+    categories: frozenset = frozenset()
+    excluded_categories: frozenset = frozenset()
+
+    @classmethod
+    def load(cls, discount):
+        rules = {}
+        for name in ('products', 'excluded_products', 'categories', 'excluded_categories'):
+            relation = DiscountCode._meta.get_field(name)
+            through = relation.remote_field.through
+            column = relation.m2m_reverse_field_name() + '_id'
+            ids = through.objects.filter(**{relation.m2m_field_name(): discount.pk}).values_list(column, flat=True)
+            rules[name] = frozenset(ids)
+        return cls(**rules)
+
+    def applies_to(self, line):
+        """``line.category_ids`` holds the category and its ancestors, so rules cover subcategories."""
+        if self.products and line.product_id not in self.products:
+            return False
+        if line.product_id in self.excluded_products:
+            return False
+        if self.categories and self.categories.isdisjoint(line.category_ids):
+            return False
+        return self.excluded_categories.isdisjoint(line.category_ids)
+
+
+def get_rules(discount):
+    """Rules for ``discount``, cached until the code or its relations change."""
+    tags = ['shop.discountcode', f'shop.discountcode:{discount.pk}']
+    versions = '.'.join(str(version) for version in get_tag_versions(tags))
+    key = f'{RULES_PREFIX}{discount.pk}:{versions}'
+    cache = get_cache()
+    rules = cache.get(key)
+    if rules is None:
+        rules = DiscountRules.load(discount)
+        cache.set(key, rules, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    return rules
+
+
+@dataclass
+class DiscountResult:
+    discount: DiscountCode
+    subtotal: Decimal
+    amount: Decimal
+    eligible_lines: list = field(default_factory=list)
+
+    @property
+    def free_shipping(self):
+        return self.discount.free_shipping
+
+
+def evaluate_discount(discount, user, lines):
+    """
+    Validate ``discount`` for ``user`` and price it against ``lines`` in a
+    single pass. Raises ``DiscountError`` with a user-facing message.
+    """
+    if not discount.is_valid():
+        raise DiscountError('کد تخفیف منقضی شده یا غیرفعال است')
+
+    if discount.usage_limit_per_user > 0:
+        user_usage_count = DiscountUserUsage.objects.filter(
+            discount_code=discount, user=user
+        ).values_list('times_used', flat=True).first() or 0
+        if user_usage_count >= discount.usage_limit_per_user:
+            raise DiscountError('شما بیش از حد مجاز از این کد تخفیف استفاده کرده‌اید')
+
+    if discount.allowed_emails and user.email not in set(discount.get_allowed_emails_list()):
+        raise DiscountError('این کد تخفیف برای ایمیل شما معتبر نیست')
+
+    subtotal = sum((line.total for line in lines), Decimal('0'))
+    if discount.min_amount and subtotal < discount.min_amount:
+        raise DiscountError(f'حداقل مبلغ خرید برای استفاده از این کد تخفیف {discount.min_amount} است')
+    if discount.max_amount and subtotal > discount.max_amount:
+        raise DiscountError(f'حداکثر مبلغ خرید برای استفاده از این کد تخفیف {discount.max_amount} است')
+
+    eligible = []
+    if discount.discount_type == 'fixed_product':
+        rules = get_rules(discount)
+        eligible = [
+            line for line in lines
+            if rules.applies_to(line) and not (discount.exclude_sale_items and line.on_sale)
+        ]
+
+    amount = Decimal('0')
+    if discount.discount_type == 'percentage':
+        amount = subtotal * discount.discount_value / 100
+    elif discount.discount_type == 'fixed_cart':
+        amount = discount.discount_value
+    elif discount.discount_type == 'fixed_product':
+        amount = sum((min(discount.discount_value, line.unit_price) * line.quantity for line in eligible), Decimal('0'))
+
+    amount = min(amount, subtotal).quantize(Decimal('0.01'))
+    return DiscountResult(discount=discount, subtotal=subtotal, amount=amount, eligible_lines=eligible)
+
+
+def redeem_discount(discount, user, order):
+    """
+    Consume one use of ``discount`` for ``order``.
+
+    Each counter is moved by a conditional UPDATE that re-checks its limit in
+    the same statement, so concurrent redemptions cannot oversell and no
+    count() is needed. The shared code row is updated last to keep its row
+    lock short; call this at the end of the checkout transaction.
+    """
+    with transaction.atomic():
+        DiscountUserUsage.objects.get_or_create(discount_code=discount, user=user)
+        user_usage = DiscountUserUsage.objects.filter(discount_code=discount, user=user)
+        if discount.usage_limit_per_user:
+            user_usage = user_usage.filter(times_used__lt=discount.usage_limit_per_user)
+        if not user_usage.update(times_used=F('times_used') + 1):
+            raise DiscountError('شما بیش از حد مجاز از این کد تخفیف استفاده کرده‌اید')
+
+        redeemed = DiscountCode.objects.filter(
+            Q(usage_limit=0) | Q(times_used__lt=F('usage_limit')),
+            pk=discount.pk, is_active=True, expiry_date__gte=timezone.now(),
+        ).update(times_used=F('times_used') + 1)
+        if not redeemed:
+            raise DiscountError('کد تخفیف منقضی شده یا غیرفعال است')
+
+        return DiscountUsage.objects.create(discount_code=discount, user=user, order=order)
+
+
+def release_discount(usage):
+    """Give back a redemption, e.g. when its order is cancelled."""
+    with transaction.atomic():
+        DiscountUserUsage.objects.filter(
+            discount_code_id=usage.discount_code_id, user_id=usage.user_id, times_used__gt=0
+        ).update(times_used=F('times_used') - 1)
+        DiscountCode.objects.filter(pk=usage.discount_code_id, times_used__gt=0).update(times_used=F('times_used') - 1)
+        usage.delete()
@@ -0,0 +1,102 @@
+import re
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Exists, Max, Min, OuterRef
+from taggit.models import TaggedItem
+
+from .models import Product, ProductAttribute, ProductAttributeValue
+
+ATTRIBUTE_PARAM = re.compile(r'^attr\[(.+)\]$')
+
+
+def parse_attribute_params(params):
+    """``?attr[color]=red,blue&attr[size]=L`` as ``{'color': ['red', 'blue'], 'size': ['L']}``."""
+    selected = {}
+    for key in params:
+        match = ATTRIBUTE_PARAM.match(key)
+        if match is None:
+            continue
+        values = [value.strip() for raw in params.getlist(key) for value in raw.split(',') if value.strip()]
+        if values:
+            selected[match.group(1).strip().casefold()] = values
+    return selected
+
+
+def attribute_ids_by_name():
+    ids = defaultdict(list)
+    for pk, name in ProductAttribute.objects.values_list('pk', 'name'):
+        ids[name.casefold()].append(pk)
+    return ids
+
+
+def filter_attributes(queryset, selected, attribute_ids, exclude=None):
+    """Products having one of the values of every selected attribute (but ``exclude``)."""
+    for name, values in selected.items():
+        if name == exclude:
+            continue
+        queryset = queryset.filter(Exists(ProductAttributeValue.objects.filter(
+            product=OuterRef('pk'), attribute_id__in=attribute_ids.get(name, []), value__in=values,
+        )))
+    return queryset
+
+
+def filter_tags(queryset, names):
+    """Products carrying any of ``names``; an EXISTS keeps rows unique without DISTINCT."""
+    return queryset.filter(Exists(TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Product), object_id=OuterRef('pk'), tag__name__in=names,
+    )))
+
+
+def _value_counts(queryset, attribute_ids=None, exclude_ids=()):
+    rows = ProductAttributeValue.objects.filter(product__in=queryset.order_by().values('pk'))
+    if attribute_ids is not None:
+        rows = rows.filter(attribute_id__in=attribute_ids)
+    if exclude_ids:
+        rows = rows.exclude(attribute_id__in=exclude_ids)
+    return rows.values_list('attribute_id', 'attribute__name', 'value').annotate(count=Count('pk')).order_by()
+
+
+def _money(value):
+    return None if value is None else str(Decimal(str(value)).quantize(Decimal('0.01')))
+
+
+def product_facets(queryset, selected, attribute_ids):
+    """
+    Facet counts for a filtered product list, one grouped query per facet.
+
+    ``queryset`` has every filter applied except the attribute ones in
+    ``selected``. Attribute counts are disjunctive: a selected attribute is
+    counted with every filter except its own, so its other values still show
+    how many products they would add.
+    """
+    results = filter_attributes(queryset, selected, attribute_ids)
+    selected_ids = {pk for name in selected for pk in attribute_ids.get(name, [])}
+
+    rows = list(_value_counts(results, exclude_ids=selected_ids))
+    for name in selected:
+        if attribute_ids.get(name):
+            others = filter_attributes(queryset, selected, attribute_ids, exclude=name)
+            rows.extend(_value_counts(others, attribute_ids=attribute_ids[name]))
+
+    attributes = {}
+    for attribute_id, attribute_name, value, count in rows:
+        facet = attributes.setdefault(attribute_id, {'id': attribute_id, 'name': attribute_name, 'values': []})
+        chosen = selected.get(attribute_name.casefold(), ())
+        facet['values'].append({'value': value, 'count': count, 'selected': value in chosen})
+    for facet in attributes.values():
+        facet['values'].sort(key=lambda item: (-item['count'], item['value']))
+
+    tags = TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Product),
+        object_id__in=results.order_by().values('pk'),
+    ).values_list('tag__name').annotate(count=Count('pk')).order_by('-count', 'tag__name')
+
+    summary = results.order_by().aggregate(count=Count('pk'), min_price=Min('price'), max_price=Max('price'))
+    return {
+        'count': summary['count'],
+        'price': {'min': _money(summary['min_price']), 'max': _money(summary['max_price'])},
+        'attributes': sorted(attributes.values(), key=lambda facet: facet['name']),
+        'tags': [{'name': name, 'count': count} for name, count in tags],
+    }
@@ -0,0 +1,144 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from api.cache import bump_tags
+from .discounts import release_discount
+from .models import DiscountUsage, Order, ProductVariant, StockReservation
+from .variants import stock_tag
+
+# Orders in these states have sold their held stock; holds of any other order are released
+FULFILLED_STATUSES = ('processing', 'shipped', 'delivered')
+
+
+class InsufficientStock(Exception):
+    def __init__(self, sku):
+        super().__init__(sku)
+        self.sku = sku
+
+
+def _invalidate_stock(variant_ids):
+    """Stock moves with bulk UPDATEs, which send no signals: bump the products' stock tags on commit."""
+    product_ids = set(ProductVariant.objects.filter(pk__in=variant_ids).values_list('product_id', flat=True))
+    tags = [stock_tag(pk) for pk in product_ids]
+    transaction.on_commit(lambda: bump_tags(tags))
+
+
+def _adjust(quantities, *fields):
+    """
+    Subtract ``{variant_id: quantity}`` from the named counters of all
+    variants in one UPDATE, e.g. ``_adjust(q, 'stock', 'reserved')``. Counters
+    are clamped at zero in case stock was lowered by hand below the holds.
+    """
+    variant_ids = sorted(quantities)
+    updates = {
+        name: Case(
+            *(When(pk=pk, then=Greatest(F(name) - quantities[pk], Value(0))) for pk in variant_ids),
+            default=F(name),
+            output_field=PositiveIntegerField(),
+        )
+        for name in fields
+    }
+    _invalidate_stock(variant_ids)
+    return ProductVariant.objects.filter(pk__in=variant_ids).update(**updates)
+
+
+def hold_stock(order, quantities, minutes=None):
+    """
+    Hold ``{variant_id: quantity}`` for ``order`` for ``minutes``. Variants are
+    locked in primary key order and ``reserved`` grows in one conditional
+    UPDATE, so concurrent checkouts can neither oversell nor deadlock.
+    Raises ``InsufficientStock``. Must run inside a transaction.
+    """
+    if not quantities:
+        return []
+    variant_ids = sorted(quantities)
+    rows = (
+        ProductVariant.objects.select_for_update()
+        .filter(pk__in=variant_ids).order_by('pk').values_list('pk', 'sku', 'stock', 'reserved')
+    )
+    for pk, sku, stock, reserved in rows:
+        if stock - reserved < quantities[pk]:
+            raise InsufficientStock(sku)
+
+    enough = Q()
+    for pk in variant_ids:
+        enough |= Q(pk=pk, stock__gte=F('reserved') + quantities[pk])
+    updated = ProductVariant.objects.filter(enough).update(reserved=Case(
+        *(When(pk=pk, then=F('reserved') + quantities[pk]) for pk in variant_ids),
+        default=F('reserved'),
+        output_field=PositiveIntegerField(),
+    ))
+    if updated != len(variant_ids):
+        raise InsufficientStock(None)
+    _invalidate_stock(variant_ids)
+
+    minutes = minutes or getattr(settings, 'STOCK_RESERVATION_MINUTES', 15)
+    expires_at = timezone.now() + timedelta(minutes=minutes)
+    return StockReservation.objects.bulk_create([
+        StockReservation(variant_id=pk, order=order, quantity=quantities[pk], expires_at=expires_at)
+        for pk in variant_ids
+    ])
+
+
+def _settle(reservations, fulfil):
+    """Turn locked reservations into sold stock (``fulfil``) or free them again."""
+    rows = list(reservations.values_list('pk', 'variant_id', 'quantity'))
+    if not rows:
+        return 0
+    quantities = Counter()
+    for _, variant_id, quantity in rows:
+        quantities[variant_id] += quantity
+    _adjust(quantities, 'stock', 'reserved') if fulfil else _adjust(quantities, 'reserved')
+    StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return len(rows)
+
+
+def fulfil_holds(order):
+    """The order was paid or confirmed: the held quantity leaves the stock."""
+    with transaction.atomic():
+        return _settle(StockReservation.objects.select_for_update().filter(order=order).order_by('variant_id'), True)
+
+
+def release_holds(order):
+    """The order was cancelled or deleted: the held quantity becomes available again."""
+    with transaction.atomic():
+        return _settle(StockReservation.objects.select_for_update().filter(order=order).order_by('variant_id'), False)
+
+
+def sweep_expired_holds(batch_size=500, now=None):
+    """
+    Settle one batch of expired reservations; returns how many were processed.
+
+    Holds of orders that are still pending are released and those orders are
+    cancelled (their discount redemptions are given back); so are holds of
+    orders cancelled or refunded meanwhile. Holds of orders confirmed without
+    being fulfilled, e.g. set to processing by hand, are fulfilled so their
+    stock is not sold twice. Rows another worker holds are skipped, so
+    several sweepers can run at once.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        batch = list(
+            StockReservation.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(expires_at__lte=now).order_by('expires_at')
+            .values_list('pk', 'order_id', 'order__status')[:batch_size]
+        )
+        if not batch:
+            return 0
+        pending_orders = {order_id for _, order_id, status in batch if status == 'pending'}
+        sold_orders = {order_id for _, order_id, status in batch if status in FULFILLED_STATUSES}
+        expired = StockReservation.objects.filter(pk__in=[pk for pk, _, _ in batch])
+        _settle(expired.filter(order_id__in=sold_orders), True)
+        _settle(expired.exclude(order_id__in=sold_orders), False)
+
+        if pending_orders:
+            Order.objects.filter(pk__in=pending_orders, status='pending').update(status='cancelled', updated_at=now)
+            for usage in DiscountUsage.objects.filter(order_id__in=pending_orders):
+                release_discount(usage)
+    return len(batch)
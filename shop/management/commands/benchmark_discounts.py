@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.cache import bump_tags
+from shop.discounts import evaluate_discount
+from shop.pricing import get_cart_lines
+from shop.models import Cart, CartItem, Category, DiscountCode, Product
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time fixed_product discount evaluation for carts of different sizes (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 50, 500])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['lines'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, repeat):
+        user = get_user_model().objects.create_user(username='discount-benchmark', email='bench@example.com')
+        root = Category.objects.create(name='bench', slug='discount-benchmark')
+        child = Category.objects.create(name='bench child', slug='discount-benchmark-child', parent=root)
+        products = Product.objects.bulk_create([
+            Product(name=f'bench {i}', slug=f'discount-benchmark-{i}', description='', price=100, category=child)
+            for i in range(max(sizes))
+        ])
+        discount = DiscountCode.objects.create(
+            code='DISCOUNT-BENCHMARK', discount_type='fixed_product', discount_value=10,
+            expiry_date=timezone.now() + timedelta(days=1),
+        )
+        discount.categories.add(root)
+        discount.excluded_products.add(*products[::10])
+
+        self.stdout.write(f'{"lines":>6} {"queries":>8} {"cold ms":>9} {"warm ms":>9}')
+        for size in sizes:
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=p, quantity=2) for p in products[:size]])
+            bump_tags([f'shop.discountcode:{discount.pk}'])  # first run loads the rules
+
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                evaluate_discount(discount, user, get_cart_lines(cart))
+                cold = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                evaluate_discount(discount, user, get_cart_lines(cart))
+            warm = (time.perf_counter() - start) * 1000 / repeat
+            self.stdout.write(f'{size:>6} {len(queries):>8} {cold:>9.2f} {warm:>9.2f}')
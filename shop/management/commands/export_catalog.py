@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shop.catalog import WRITERS, export_records
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalog as a CSV or JSONL feed that import_catalog can read back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl')
+        parser.add_argument('--output', help='File to write, defaults to stdout')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        lines = WRITERS[options['format']](export_records(chunk_size=options['chunk_size']))
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog import READERS, CatalogImporter
+
+
+class Command(BaseCommand):
+    help = 'Upsert products, variants, attribute values, tags and images from a CSV or JSONL feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' for stdin")
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--no-download', action='store_true', help='Reject image URLs instead of fetching them')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if feed_format not in READERS:
+            raise CommandError('Pass --format csv or --format jsonl')
+
+        importer = CatalogImporter(chunk_size=options['chunk_size'], download_images=not options['no_download'])
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            stats = importer.run(READERS[feed_format](stream))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for where, message in importer.errors:
+            self.stderr.write(f'{where}: {message}')
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in stats.items()) or 'Nothing imported')
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.inventory import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Release or fulfil expired stock reservations in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping instead of exiting when done')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds to sleep between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                swept = sweep_expired_holds(batch_size=options['batch_size'])
+                total += swept
+                if swept < options['batch_size']:
+                    break
+            if total or not options['loop']:
+                self.stdout.write(f'Settled {total} expired reservations')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,90 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from shop.discounts import DiscountError, redeem_discount
+from shop.models import DiscountCode, DiscountUsage, DiscountUserUsage, Order
+
+
+class Command(BaseCommand):
+    help = (
+        'Redeem one hot discount code from many threads and check that neither the '
+        'global nor the per-user limit oversells. Creates and deletes its own data; '
+        'run it against PostgreSQL for meaningful contention.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=500, help='usage_limit of the code')
+        parser.add_argument('--per-user', type=int, default=2, help='usage_limit_per_user of the code')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        User = get_user_model()
+        User.objects.bulk_create([
+            User(username=f'stress-{tag}-{i}', email=f'stress-{tag}-{i}@example.com')
+            for i in range(options['users'])
+        ])
+        users = list(User.objects.filter(username__startswith=f'stress-{tag}-').order_by('pk'))
+        discount = DiscountCode.objects.create(
+            code=f'STRESS-{tag}', discount_type='fixed_cart', discount_value=1,
+            expiry_date=timezone.now() + timedelta(days=1),
+            usage_limit=options['limit'], usage_limit_per_user=options['per_user'],
+        )
+        Order.objects.bulk_create([
+            Order(
+                user=users[i % len(users)], order_number=f'STRESS-{tag}-{i}',
+                shipping_address='-', shipping_cost=0, subtotal=0, total=0,
+            )
+            for i in range(options['attempts'])
+        ])
+        orders = list(Order.objects.filter(order_number__startswith=f'STRESS-{tag}-').select_related('user'))
+
+        def redeem(order):
+            try:
+                redeem_discount(discount, order.user, order)
+                return 'redeemed'
+            except DiscountError:
+                return 'rejected'
+            except OperationalError:
+                return 'error'
+            finally:
+                connection.close()
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                outcomes = list(executor.map(redeem, orders))
+            elapsed = time.perf_counter() - start
+
+            discount.refresh_from_db()
+            redeemed = outcomes.count('redeemed')
+            usages = DiscountUsage.objects.filter(discount_code=discount).count()
+            max_per_user = max(
+                DiscountUserUsage.objects.filter(discount_code=discount).values_list('times_used', flat=True),
+                default=0,
+            )
+            self.stdout.write(
+                f'{len(orders)} attempts in {elapsed:.2f}s ({len(orders) / elapsed:.0f}/s): '
+                f'{redeemed} redeemed, {outcomes.count("rejected")} rejected, {outcomes.count("error")} errors'
+            )
+            self.stdout.write(f'times_used={discount.times_used} usages={usages} max per user={max_per_user}')
+
+            expected = min(options['limit'], options['per_user'] * len(users), len(orders))
+            if not (discount.times_used == usages == redeemed) or max_per_user > options['per_user'] \
+                    or redeemed > options['limit']:
+                raise CommandError('Counters disagree or a limit was oversold')
+            if redeemed != expected and not outcomes.count('error'):
+                raise CommandError(f'Expected {expected} redemptions, got {redeemed}')
+            self.stdout.write(self.style.SUCCESS('No oversell'))
+        finally:
+            discount.delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
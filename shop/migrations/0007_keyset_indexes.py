@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_alter_discountcode_options_and_more'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='discountcode',
+            name='discount_type',
+            field=models.CharField(choices=[('percentage', 'percentage'), ('fixed_cart', 'fixed_cart'), ('fixed_product', 'fixed_product')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='discountcode',
+            name='max_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='shop_order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='shop_product_created_idx'),
+        ),
+    ]
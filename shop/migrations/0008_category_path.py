@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+from api.tree import rebuild_tree_paths
+
+
+def populate_paths(apps, schema_editor):
+    rebuild_tree_paths(apps.get_model('shop', 'Category'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_user_usages(apps, schema_editor):
+    DiscountUsage = apps.get_model('shop', 'DiscountUsage')
+    DiscountUserUsage = apps.get_model('shop', 'DiscountUserUsage')
+    rows = DiscountUsage.objects.order_by().values('discount_code_id', 'user_id').annotate(times_used=Count('pk'))
+    DiscountUserUsage.objects.bulk_create([DiscountUserUsage(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountUserUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('times_used', models.PositiveIntegerField(default=0)),
+                ('discount_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_usages', to='shop.discountcode')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discount_user_usages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'discount user usage',
+                'verbose_name_plural': 'discount user usages',
+                'unique_together': {('discount_code', 'user')},
+            },
+        ),
+        migrations.RunPython(populate_user_usages, migrations.RunPython.noop),
+    ]
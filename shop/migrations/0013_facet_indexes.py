@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_stock_reservations'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='shop_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productattributevalue',
+            index=models.Index(fields=['attribute', 'value', 'product'], name='shop_attr_value_facet_idx'),
+        ),
+    ]
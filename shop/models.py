@@ -1,14 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.fields import GenericRelation
 from taggit.managers import TaggableManager
 from meta.models import ModelMeta
+from api.models import DenormalizedFieldsMixin
+from api.tree import TreeNode
 from ckeditor.fields import RichTextField
 from django.utils import timezone
 
 User = get_user_model()
 
-class Category(models.Model):
+class Category(TreeNode):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
@@ -41,6 +46,10 @@ class ProductAttributeValue(models.Model):
         verbose_name = _('product attribute value')
         verbose_name_plural = _('product attribute values')
         unique_together = ('product', 'attribute')
+        indexes = [
+            # Covers the EXISTS of ?attr[...] filters and the facet GROUP BY
+            models.Index(fields=['attribute', 'value', 'product'], name='shop_attr_value_facet_idx'),
+        ]
         
     def __str__(self):
         return f"{self.product.name} - {self.attribute.name}: {self.value}"
@@ -55,7 +64,7 @@ class ContentType(models.TextChoices):
     IMAGE = 'image', _('Image')
     AUDIO = 'audio', _('Audio')
 
-class Product(ModelMeta, models.Model):
+class Product(ModelMeta, DenormalizedFieldsMixin, models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
@@ -68,10 +77,25 @@ class Product(ModelMeta, models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     attributes = models.ManyToManyField(ProductAttribute, through='ProductAttributeValue')
     tags = TaggableManager()
+    rendered_content = GenericRelation('api.RenderedContent')
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Approved review aggregates, maintained by Product.apply_rating()
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    denormalized_fields = (
+        'rating_count', 'rating_sum', 'rating_avg',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
+    
     # SEO Fields
     _meta_title = models.CharField(max_length=200, blank=True)
     _meta_description = models.TextField(blank=True)
@@ -81,13 +105,59 @@ class Product(ModelMeta, models.Model):
         verbose_name = _('product')
         verbose_name_plural = _('products')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='shop_product_created_idx'),
+            models.Index(fields=['-rating_avg', '-id'], name='shop_product_rating_idx'),
+            models.Index(fields=['price', 'id'], name='shop_product_price_idx'),
+        ]
         
     def __str__(self):
         return self.name
+    
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in Review.RATINGS}
+    
+    @classmethod
+    def apply_rating(cls, product_id, rating, delta):
+        """
+        Add (``delta=1``) or remove (``delta=-1``) one approved ``rating`` in a
+        single UPDATE, so concurrent reviews never lose increments.
+        """
+        count = F('rating_count') + delta
+        total = F('rating_sum') + rating * delta
+        return cls.objects.filter(pk=product_id).update(**{
+            'rating_count': count,
+            'rating_sum': total,
+            'rating_avg': Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0)),
+            f'rating_{rating}_count': F(f'rating_{rating}_count') + delta,
+        })
+    
+    @classmethod
+    def rebuild_ratings(cls, queryset=None):
+        """Recompute the aggregates from approved reviews, e.g. after bulk edits."""
+        queryset = cls.objects.all() if queryset is None else queryset
+        approved = Q(reviews__is_approved=True)
+        aggregates = {
+            'count': Count('reviews', filter=approved),
+            'total': Sum('reviews__rating', filter=approved),
+            **{f'star_{star}': Count('reviews', filter=approved & Q(reviews__rating=star)) for star in Review.RATINGS},
+        }
+        products = []
+        for row in queryset.order_by().values('pk').annotate(**aggregates):
+            product = cls(pk=row['pk'], rating_count=row['count'], rating_sum=row['total'] or 0)
+            product.rating_avg = product.rating_sum / product.rating_count if product.rating_count else 0
+            for star in Review.RATINGS:
+                setattr(product, f'rating_{star}_count', row[f'star_{star}'])
+            products.append(product)
+        fields = ['rating_count', 'rating_sum', 'rating_avg'] + [f'rating_{star}_count' for star in Review.RATINGS]
+        cls.objects.bulk_update(products, fields, batch_size=500)
+        return len(products)
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/gallery/')
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     order = models.PositiveIntegerField(default=0)
     
     class Meta:
@@ -98,13 +168,16 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"{self.product.name} - Image {self.order}"
 
-class ProductVariant(models.Model):
+class ProductVariant(DenormalizedFieldsMixin, models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
     attributes = models.ManyToManyField(ProductAttributeValue, related_name='variants')
     sku = models.CharField(max_length=100, unique=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     stock = models.PositiveIntegerField(default=0)
+    # Sum of active StockReservation quantities, maintained by shop.inventory
+    reserved = models.PositiveIntegerField(default=0, editable=False)
+    denormalized_fields = ('reserved',)
     
     class Meta:
         verbose_name = _('product variant')
@@ -112,6 +185,10 @@ class ProductVariant(models.Model):
         
     def __str__(self):
         return f"{self.product.name} - {self.sku}"
+    
+    @property
+    def available_stock(self):
+        return max(self.stock - self.reserved, 0)
 
 class ShippingMethod(models.Model):
     name = models.CharField(max_length=100)
@@ -157,6 +234,7 @@ class Order(models.Model):
     shipping_method = models.ForeignKey(ShippingMethod, on_delete=models.SET_NULL, null=True)
     shipping_cost = models.DecimalField(max_digits=10, decimal_places=2)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -166,10 +244,28 @@ class Order(models.Model):
         verbose_name = _('order')
         verbose_name_plural = _('orders')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='shop_order_user_created_idx'),
+        ]
         
     def __str__(self):
         return self.order_number
 
+class StockReservation(models.Model):
+    """Quantity of a variant held for a pending order until ``expires_at``."""
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('stock reservation')
+        verbose_name_plural = _('stock reservations')
+        
+    def __str__(self):
+        return f"{self.order.order_number} - {self.variant.sku} x {self.quantity}"
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -240,11 +336,23 @@ class CartItem(models.Model):
         
     def __str__(self):
         return f"{self.cart.id} - {self.product.name}"
+    
+    # Touch the cart so cached pricing snapshots keyed on its updated_at expire
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Cart.objects.filter(pk=self.cart_id).update(updated_at=timezone.now())
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Cart.objects.filter(pk=self.cart_id).update(updated_at=timezone.now())
+        return result
 
 class Review(models.Model):
+    RATINGS = range(1, 6)
+    
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
-    rating = models.PositiveSmallIntegerField()
+    rating = models.PositiveSmallIntegerField(choices=[(star, str(star)) for star in RATINGS])
     title = models.CharField(max_length=200)
     content = models.TextField()
     is_approved = models.BooleanField(default=False)
@@ -257,6 +365,25 @@ class Review(models.Model):
         
     def __str__(self):
         return f"{self.product.name} - {self.user.username}"
+    
+    def save(self, *args, **kwargs):
+        # Deletes (including cascades) are handled by the post_delete receiver in shop.signals
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = (
+                    Review.objects.select_for_update()
+                    .filter(pk=self.pk, is_approved=True)
+                    .values_list('product_id', 'rating')
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            current = (self.product_id, self.rating) if self.is_approved else None
+            if previous != current:
+                if previous:
+                    Product.apply_rating(*previous, -1)
+                if current:
+                    Product.apply_rating(*current, 1)
 
 class Chapter(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='chapters')
@@ -289,6 +416,7 @@ class Lesson(models.Model):
     duration = models.DurationField(null=True, blank=True)  # For video/audio content
     order = models.PositiveIntegerField(default=0)
     is_free = models.BooleanField(default=False)
+    rendered_content = GenericRelation('api.RenderedContent')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -318,7 +446,7 @@ class UserProgress(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.lesson.title}"
 
-class DiscountCode(models.Model):
+class DiscountCode(DenormalizedFieldsMixin, models.Model):
     DISCOUNT_TYPES = (
         ('percentage', 'percentage'),
         ('fixed_cart', 'fixed_cart'),
@@ -335,7 +463,9 @@ class DiscountCode(models.Model):
     # Usage limits
     usage_limit = models.PositiveIntegerField(default=0)
     usage_limit_per_user = models.PositiveIntegerField(default=0)
+    # Maintained by shop.discounts with conditional UPDATEs
     times_used = models.PositiveIntegerField(default=0)
+    denormalized_fields = ('times_used',)
     
     # Restrictions
     min_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -387,3 +517,17 @@ class DiscountUsage(models.Model):
 
     def __str__(self):
         return f"{self.discount_code.code} - {self.user.email} - {self.used_at}"
+
+class DiscountUserUsage(models.Model):
+    """Per-user redemption counter, so usage_limit_per_user is a unique-key lookup."""
+    discount_code = models.ForeignKey(DiscountCode, on_delete=models.CASCADE, related_name='user_usages')
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='discount_user_usages')
+    times_used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'discount user usage'
+        verbose_name_plural = 'discount user usages'
+        unique_together = ['discount_code', 'user']
+
+    def __str__(self):
+        return f"{self.discount_code.code} - {self.user.email} - {self.times_used}"
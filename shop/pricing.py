@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+
+from api.cache import get_cache, get_tag_versions
+from api.tree import decode_segment, STEP
+from .discounts import DiscountError, evaluate_discount
+from .models import CartItem, Product, ProductVariant
+
+SNAPSHOT_PREFIX = 'cart:pricing:'
+
+
+@dataclass(frozen=True)
+class CartLine:
+    product_id: int
+    category_ids: frozenset
+    unit_price: Decimal
+    quantity: int
+    on_sale: bool = False
+    variant_id: int = None
+    item_id: int = None
+    name: str = ''
+    slug: str = ''
+    sku: str = ''
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
+
+
+def _make_line(product_id, name, slug, product_price, path, variant_id, sku, variant_price, sale_price, quantity,
+               item_id=None):
+    price = variant_price if variant_price is not None else product_price
+    return CartLine(
+        product_id=product_id,
+        category_ids=frozenset(decode_segment(path[i:i + STEP]) for i in range(0, len(path), STEP)),
+        unit_price=sale_price if sale_price is not None else price,
+        quantity=quantity,
+        on_sale=sale_price is not None and sale_price < price,
+        variant_id=variant_id,
+        item_id=item_id,
+        name=name,
+        slug=slug,
+        sku=sku or '',
+    )
+
+
+def get_cart_lines(cart):
+    """
+    Every line of ``cart`` priced from the database in one query: the variant
+    sale price, else the variant price, else the product price. Lines carry
+    their category ancestry (decoded from the materialized path) for discount
+    rules. Like ``get_item_lines``, lines of inactive products and variants
+    of other products are dropped.
+    """
+    rows = CartItem.objects.filter(cart=cart, product__is_active=True).order_by('pk').values_list(
+        'pk', 'variant__product_id', 'product_id', 'product__name', 'product__slug', 'product__price',
+        'product__category__path', 'variant_id', 'variant__sku', 'variant__price', 'variant__sale_price', 'quantity',
+    )
+    return [
+        _make_line(*row[2:], item_id=row[0]) for row in rows
+        if row[7] is None or row[1] == row[2]
+    ]
+
+
+def get_item_lines(items):
+    """
+    Lines for ``{(product_id, variant_id): quantity}`` as kept by the session
+    cart storage, priced like ``get_cart_lines``. Unknown or inactive
+    products and variants of other products are dropped.
+    """
+    products = {
+        row[0]: row[1:] for row in Product.objects.filter(pk__in={p for p, _ in items}, is_active=True)
+        .values_list('pk', 'name', 'slug', 'price', 'category__path')
+    }
+    variants = {
+        row[0]: row[1:] for row in ProductVariant.objects.filter(pk__in={v for _, v in items if v})
+        .values_list('pk', 'product_id', 'sku', 'price', 'sale_price')
+    }
+    lines = []
+    for (product_id, variant_id), quantity in sorted(items.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        if product_id not in products:
+            continue
+        sku = variant_price = sale_price = None
+        if variant_id is not None:
+            if variants.get(variant_id, (None,))[0] != product_id:
+                continue
+            sku, variant_price, sale_price = variants[variant_id][1:]
+        lines.append(_make_line(product_id, *products[product_id], variant_id, sku, variant_price, sale_price, quantity))
+    return lines
+
+
+def get_cached_cart_lines(cart):
+    """
+    ``get_cart_lines`` through a snapshot keyed on the cart's ``updated_at``
+    (touched whenever an item changes). The snapshot also remembers the tag
+    versions of its products and of the category tree and is discarded when
+    any of them moved, e.g. after a price change.
+    """
+    cache = get_cache()
+    key = f'{SNAPSHOT_PREFIX}{cart.pk}:{cart.updated_at.timestamp()}'
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        lines, tags, versions = snapshot
+        if get_tag_versions(tags) == versions:
+            return lines
+
+    product_ids = CartItem.objects.filter(cart=cart).values_list('product_id', flat=True)
+    tags = ['shop.category'] + [f'shop.product:{pk}' for pk in sorted(set(product_ids))]
+    # Versions are read before the lines so a concurrent bump can only make the snapshot look older
+    versions = get_tag_versions(tags)
+    lines = get_cart_lines(cart)
+    cache.set(key, (lines, tags, versions), getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    return lines
+
+
+@dataclass
+class CartPricing:
+    lines: list
+    subtotal: Decimal
+    shipping_method: object = None
+    shipping_cost: Decimal = Decimal('0')
+    discount: object = None
+    discount_amount: Decimal = Decimal('0')
+    discount_error: str = None
+
+    @property
+    def total(self):
+        return self.subtotal - self.discount_amount + self.shipping_cost
+
+
+def price_cart(cart, user, shipping_method=None, discount=None, use_cache=True):
+    """
+    Price ``cart`` for ``user``: line prices, subtotal, the discount (an
+    invalid code is reported in ``discount_error`` and not applied) and the
+    shipping cost, waived by free-shipping codes.
+    """
+    lines = get_cached_cart_lines(cart) if use_cache else get_cart_lines(cart)
+    return price_lines(lines, user, shipping_method, discount)
+
+
+def price_lines(lines, user, shipping_method=None, discount=None):
+    """``price_cart`` for lines that do not come from a database cart."""
+    pricing = CartPricing(lines=lines, subtotal=sum((line.total for line in lines), Decimal('0')))
+
+    if discount is not None:
+        try:
+            result = evaluate_discount(discount, user, lines)
+        except DiscountError as e:
+            pricing.discount_error = e.message
+        else:
+            pricing.discount = discount
+            pricing.discount_amount = result.amount
+
+    if shipping_method is not None:
+        pricing.shipping_method = shipping_method
+        if not (pricing.discount and pricing.discount.free_shipping):
+            pricing.shipping_cost = shipping_method.price
+    return pricing
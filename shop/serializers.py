@@ -1,15 +1,20 @@
 from rest_framework import serializers
+from taggit.serializers import TagListSerializerField, TaggitSerializer
+from api.serializers import ImageRenditionsField, RenderedContentField, SparseFieldsetSerializerMixin
 from .models import (
     Category, Product, ProductImage, ProductVariant,
     ProductAttribute, ProductAttributeValue, ShippingMethod,
     ShippingZone, Order, OrderItem, Payment, Cart, CartItem,
     Review, Chapter, Lesson, UserProgress, DiscountCode, DiscountUsage
 )
+from .variants import get_variant_matrix, get_variant_stock
 
 class CategorySerializer(serializers.ModelSerializer):
+    depth = serializers.IntegerField(read_only=True)
+    
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'parent', 'description']
+        fields = ['id', 'name', 'slug', 'parent', 'depth', 'description']
 
 class ProductAttributeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -24,23 +29,28 @@ class ProductAttributeValueSerializer(serializers.ModelSerializer):
         fields = ['id', 'attribute', 'attribute_name', 'value']
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    renditions = ImageRenditionsField(source='image_renditions')
+    
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'order']
+        fields = ['id', 'image', 'renditions', 'order']
 
 class ProductVariantSerializer(serializers.ModelSerializer):
     attributes = ProductAttributeValueSerializer(many=True, read_only=True)
+    available_stock = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = ProductVariant
-        fields = ['id', 'attributes', 'sku', 'price', 'sale_price', 'stock']
+        fields = ['id', 'attributes', 'sku', 'price', 'sale_price', 'stock', 'available_stock']
 
 class LessonSerializer(serializers.ModelSerializer):
+    content_rendered = RenderedContentField('content')
+    
     class Meta:
         model = Lesson
         fields = [
             'id', 'title', 'description', 'content_type',
-            'content', 'media_file', 'duration', 'order',
+            'content', 'content_rendered', 'media_file', 'duration', 'order',
             'is_free', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
@@ -56,27 +66,58 @@ class ChapterSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetSerializerMixin, TaggitSerializer, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
         source='category',
         write_only=True
     )
-    attributes = ProductAttributeValueSerializer(many=True, read_only=True)
+    attributes = ProductAttributeValueSerializer(source='attribute_values', many=True, read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     chapters = ChapterSerializer(many=True, read_only=True)
+    tags = TagListSerializerField(required=False)
+    rating_histogram = serializers.SerializerMethodField()
+    description_rendered = RenderedContentField('description')
     
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'slug', 'description', 'price',
+            'id', 'name', 'slug', 'description', 'description_rendered', 'price',
             'product_type', 'category', 'category_id',
             'attributes', 'images', 'chapters', 'tags',
+            'rating_count', 'rating_avg', 'rating_histogram',
             'is_active', 'created_at', 'updated_at',
             '_meta_title', '_meta_description', '_meta_keywords'
         ]
-        read_only_fields = ['slug', 'created_at', 'updated_at']
+        read_only_fields = ['slug', 'rating_count', 'rating_avg', 'created_at', 'updated_at']
+        expandable_fields = ['chapters']
+    
+    def get_rating_histogram(self, obj):
+        return obj.rating_histogram
+
+class ProductDetailSerializer(ProductSerializer):
+    variant_matrix = serializers.SerializerMethodField()
+    
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['variant_matrix']
+    
+    def get_variant_matrix(self, obj):
+        return get_variant_matrix(obj.pk).as_dict(get_variant_stock(obj.pk))
+
+class ProductListSerializer(SparseFieldsetSerializerMixin, TaggitSerializer, serializers.ModelSerializer):
+    category = CategorySerializer(read_only=True)
+    images = ProductImageSerializer(many=True, read_only=True)
+    tags = TagListSerializerField(read_only=True)
+    
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'slug', 'price', 'product_type',
+            'category', 'images', 'tags', 'rating_count', 'rating_avg',
+            'is_active', 'created_at'
+        ]
+        read_only_fields = fields
 
 class ShippingMethodSerializer(serializers.ModelSerializer):
     class Meta:
@@ -93,7 +134,7 @@ class ShippingZoneSerializer(serializers.ModelSerializer):
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(),
+        queryset=Product.objects.filter(is_active=True),
         write_only=True,
         source='product'
     )
@@ -137,15 +178,29 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'order_number', 'status', 'shipping_address',
             'shipping_method', 'shipping_method_id', 'shipping_cost',
-            'subtotal', 'total', 'notes', 'items', 'payments',
+            'subtotal', 'discount_amount', 'total', 'notes', 'items', 'payments',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['order_number', 'created_at', 'updated_at']
+        read_only_fields = [
+            'order_number', 'status', 'shipping_cost', 'subtotal',
+            'discount_amount', 'total', 'created_at', 'updated_at'
+        ]
+
+class CheckoutSerializer(serializers.Serializer):
+    shipping_address = serializers.CharField()
+    shipping_method_id = serializers.PrimaryKeyRelatedField(
+        queryset=ShippingMethod.objects.filter(is_active=True),
+        source='shipping_method',
+        required=False,
+        allow_null=True
+    )
+    discount_code = serializers.CharField(required=False, allow_blank=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
 
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(),
+        queryset=Product.objects.filter(is_active=True),
         write_only=True,
         source='product'
     )
@@ -165,6 +220,13 @@ class CartItemSerializer(serializers.ModelSerializer):
             'quantity', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+    
+    def validate(self, attrs):
+        product = attrs.get('product', getattr(self.instance, 'product', None))
+        variant = attrs.get('variant', getattr(self.instance, 'variant', None))
+        if variant is not None and product is not None and variant.product_id != product.pk:
+            raise serializers.ValidationError({'variant_id': 'این تنوع متعلق به محصول انتخاب‌شده نیست'})
+        return attrs
 
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
@@ -174,6 +236,69 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'items', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
+class CartLineSerializer(serializers.Serializer):
+    id = serializers.IntegerField(source='item_id')
+    product = serializers.IntegerField(source='product_id')
+    name = serializers.CharField()
+    slug = serializers.CharField()
+    variant = serializers.IntegerField(source='variant_id', allow_null=True)
+    sku = serializers.CharField()
+    quantity = serializers.IntegerField()
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    on_sale = serializers.BooleanField()
+
+class CartSummarySerializer(serializers.Serializer):
+    items = CartLineSerializer(source='lines', many=True)
+    item_count = serializers.SerializerMethodField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+    discount_code = serializers.CharField(source='discount.code', default=None)
+    discount_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    discount_error = serializers.CharField(allow_null=True)
+    shipping_method = serializers.IntegerField(source='shipping_method.pk', default=None)
+    shipping_cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    
+    def get_item_count(self, obj):
+        return sum(line.quantity for line in obj.lines)
+
+class ShippingQuoteParamsSerializer(serializers.Serializer):
+    country = serializers.CharField(max_length=10)
+    state = serializers.CharField(required=False, allow_blank=True)
+    city = serializers.CharField(required=False, allow_blank=True)
+    discount_code = serializers.CharField(required=False, allow_blank=True)
+
+class ShippingQuoteSerializer(serializers.Serializer):
+    shipping_method = serializers.IntegerField(source='shipping_method.pk')
+    name = serializers.CharField(source='shipping_method.name')
+    shipping_cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class ShippingQuotesSerializer(serializers.Serializer):
+    zone = serializers.IntegerField(source='zone.pk')
+    zone_name = serializers.CharField(source='zone.name')
+    item_count = serializers.SerializerMethodField()
+    subtotal = serializers.DecimalField(source='pricing.subtotal', max_digits=12, decimal_places=2)
+    discount_code = serializers.CharField(source='pricing.discount.code', default=None)
+    discount_amount = serializers.DecimalField(source='pricing.discount_amount', max_digits=12, decimal_places=2)
+    discount_error = serializers.CharField(source='pricing.discount_error', allow_null=True)
+    methods = ShippingQuoteSerializer(source='quotes', many=True)
+    
+    def get_item_count(self, obj):
+        return sum(line.quantity for line in obj['pricing'].lines)
+
+class SessionCartItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    variant_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=0, max_value=1000, default=1)
+
+class CartSummaryParamsSerializer(serializers.Serializer):
+    shipping_method = serializers.PrimaryKeyRelatedField(
+        queryset=ShippingMethod.objects.filter(is_active=True),
+        required=False
+    )
+    discount_code = serializers.CharField(required=False, allow_blank=True)
+
 class ReviewSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     
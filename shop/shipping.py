@@ -0,0 +1,79 @@
+from dataclasses import dataclass, field
+
+from api.cache import get_tag_versions
+from .models import ShippingMethod, ShippingZone
+
+TABLE_TAGS = ['shop.shippingzone', 'shop.shippingmethod']
+
+_table = None
+
+
+def _split(value, normalize):
+    return [normalize(part) for part in value.split(',') if part.strip()]
+
+
+def _country(value):
+    return value.strip().upper()
+
+
+def _state(value):
+    return value.strip().upper()
+
+
+def _city(value):
+    return ' '.join(value.split()).casefold()
+
+
+@dataclass
+class ZoneTable:
+    """
+    Every zone exploded into ``(country, state, city)`` keys, an empty part
+    meaning "any". Built once per change of zones or methods.
+    """
+    versions: list
+    zones: dict = field(default_factory=dict)
+    methods: dict = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, versions):
+        table = cls(versions)
+        active = {method.pk: method for method in ShippingMethod.objects.filter(is_active=True).order_by('price', 'pk')}
+        through = ShippingZone.shipping_methods.through
+        zone_methods = {}
+        for zone_id, method_id in through.objects.values_list('shippingzone_id', 'shippingmethod_id'):
+            if method_id in active:
+                zone_methods.setdefault(zone_id, []).append(active[method_id])
+
+        for zone in ShippingZone.objects.order_by('pk'):
+            table.methods[zone.pk] = (zone, sorted(zone_methods.get(zone.pk, []), key=lambda m: (m.price, m.pk)))
+            for country in _split(zone.countries, _country):
+                for state in _split(zone.states, _state) or ['']:
+                    for city in _split(zone.cities, _city) or ['']:
+                        # The lowest id wins when two zones claim the same key
+                        table.zones.setdefault((country, state, city), zone.pk)
+        return table
+
+    def resolve(self, country, state='', city=''):
+        country, state, city = _country(country or ''), _state(state or ''), _city(city or '')
+        for key in ((country, state, city), (country, '', city), (country, state, ''), (country, '', '')):
+            zone_id = self.zones.get(key)
+            if zone_id is not None:
+                return self.methods[zone_id]
+        return None, []
+
+
+def get_zone_table():
+    """
+    The zone table of this process, rebuilt (two queries) when a zone, its
+    methods or a shipping method changed anywhere.
+    """
+    global _table
+    versions = get_tag_versions(TABLE_TAGS)
+    if _table is None or _table.versions != versions:
+        _table = ZoneTable.build(versions)
+    return _table
+
+
+def resolve_shipping(country, state='', city=''):
+    """``(zone, active methods by price)`` for the most specific zone of an address, or ``(None, [])``."""
+    return get_zone_table().resolve(country, state, city)
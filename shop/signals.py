@@ -0,0 +1,83 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.cache import bump_tags
+from .cart_storage import get_cart_token, merge_session_cart
+from .discounts import release_discount
+from .inventory import fulfil_holds, release_holds
+from .models import DiscountCode, DiscountUsage, Order, Payment, Product, ProductVariant, Review, ShippingZone
+
+
+@receiver(post_delete, sender=Review, dispatch_uid='shop_review_rating_delete')
+def remove_review_rating(sender, instance, **kwargs):
+    if instance.is_approved:
+        Product.apply_rating(instance.product_id, instance.rating, -1)
+
+
+def invalidate_discount_rules(sender, instance, action, reverse, **kwargs):
+    # Cached DiscountRules are keyed on these tags (see shop.discounts.get_rules)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    tags = ['shop.discountcode'] if reverse else [f'shop.discountcode:{instance.pk}']
+    transaction.on_commit(lambda: bump_tags(tags))
+
+
+for name in ('products', 'excluded_products', 'categories', 'excluded_categories'):
+    m2m_changed.connect(
+        invalidate_discount_rules,
+        sender=getattr(DiscountCode, name).through,
+        dispatch_uid=f'shop_discount_rules_{name}',
+    )
+
+
+@receiver(m2m_changed, sender=ProductVariant.attributes.through, dispatch_uid='shop_variant_attributes')
+def invalidate_variant_matrix(sender, instance, action, reverse, pk_set, **kwargs):
+    # Variant matrices (shop.variants) are keyed on the product tag
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    product_ids = {instance.product_id}
+    if reverse and pk_set:
+        product_ids |= set(ProductVariant.objects.filter(pk__in=pk_set).values_list('product_id', flat=True))
+    tags = [f'shop.product:{pk}' for pk in product_ids]
+    transaction.on_commit(lambda: bump_tags(tags))
+
+
+@receiver(m2m_changed, sender=ShippingZone.shipping_methods.through, dispatch_uid='shop_shipping_zone_methods')
+def invalidate_zone_table(sender, action, **kwargs):
+    # The zone table of shop.shipping is keyed on this tag
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_tags(['shop.shippingzone']))
+
+
+@receiver(post_save, sender=Payment, dispatch_uid='shop_payment_fulfil_holds')
+def fulfil_paid_order(sender, instance, raw=False, **kwargs):
+    if raw or instance.status != 'completed':
+        return
+    fulfil_holds(instance.order)
+    Order.objects.filter(pk=instance.order_id, status='pending').update(status='processing')
+
+
+@receiver(post_save, sender=Order, dispatch_uid='shop_order_cancel_release_holds')
+def release_cancelled_order(sender, instance, raw=False, **kwargs):
+    if not raw and instance.status in ('cancelled', 'refunded'):
+        release_holds(instance)
+        # release_discount deletes the usage, so saving the order again is a no-op
+        for usage in DiscountUsage.objects.filter(order=instance):
+            release_discount(usage)
+
+
+@receiver(pre_delete, sender=Order, dispatch_uid='shop_order_release_holds')
+def release_deleted_order(sender, instance, **kwargs):
+    release_holds(instance)
+
+
+@receiver(user_logged_in, dispatch_uid='shop_merge_session_cart')
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+    token = get_cart_token(request)
+    if token:
+        merge_session_cart(token, user)
+        request.session.pop('cart_token', None)
@@ -1,3 +1,802 @@
-from django.test import TestCase
+import io
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.cache import get_cache
+from api.tree import encode_segment
+from users.models import User
+from .cart_storage import get_cart_storage, merge_session_cart
+from .catalog import CatalogImporter, read_jsonl
+from .checkout import CheckoutError, checkout
+from .discounts import DiscountError, evaluate_discount, get_rules, redeem_discount
+from .inventory import hold_stock, sweep_expired_holds
+from .pricing import get_cart_lines, get_item_lines, price_lines
+from .shipping import resolve_shipping
+from .models import (
+    Cart, CartItem, Category, Chapter, DiscountCode, DiscountUsage, DiscountUserUsage, Lesson, Order, Product,
+    ProductImage, ProductVariant, ProductAttribute, ProductAttributeValue, Review, ShippingMethod, ShippingZone,
+    StockReservation, UserProgress,
+)
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_product(category, slug, **kwargs):
+    return Product.objects.create(
+        name=kwargs.pop('name', slug), slug=slug, description='<p>description</p>', price=kwargs.pop('price', 10),
+        category=category, **kwargs
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, API_QUERY_BUDGET_RAISE=True)
+class ProductQueryCountTests(APITestCase):
+    """Query counts stay flat however many products, images, tags and variants a page holds."""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='c', slug='c')
+        self.color = ProductAttribute.objects.create(name='color')
+        self.add_products(3)
+
+    def add_products(self, count):
+        for _ in range(count):
+            product = create_product(self.category, f'p{Product.objects.count()}')
+            product.tags.add('a', 'b')
+            ProductImage.objects.create(product=product, image='products/gallery/a.png')
+            value = ProductAttributeValue.objects.create(product=product, attribute=self.color, value='red')
+            ProductVariant.objects.create(product=product, sku=product.slug, price=10, stock=1).attributes.add(value)
+        get_cache().clear()
+        return product
+
+    def assertQueriesStayFlat(self, url, expected):
+        for _ in range(2):
+            path = url(self.add_products(3))
+            with self.assertNumQueries(expected):
+                self.assertEqual(self.client.get(path).status_code, status.HTTP_200_OK)
+
+    def test_list(self):
+        self.assertQueriesStayFlat(lambda product: '/api/shop/products/', 3)
+        self.assertQueriesStayFlat(lambda product: '/api/shop/products/?count=true', 4)
+
+    def test_retrieve(self):
+        self.assertQueriesStayFlat(lambda product: f'/api/shop/products/{product.pk}/', 8)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CurriculumTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.product = create_product(Category.objects.create(name='c', slug='c'), 'course')
+        first = Chapter.objects.create(product=self.product, title='one', order=1)
+        second = Chapter.objects.create(product=self.product, title='two', order=2)
+        self.lessons = [
+            Lesson.objects.create(chapter=chapter, title=title, content='<p>c</p>', order=order,
+                                  duration=timedelta(minutes=minutes))
+            for chapter, title, order, minutes in [(first, 'a', 1, 10), (first, 'b', 2, 5), (second, 'c', 1, 1)]
+        ]
+        UserProgress.objects.create(user=self.user, lesson=self.lessons[0], is_completed=True, progress_percentage=40)
+        UserProgress.objects.create(user=self.user, lesson=self.lessons[1], progress_percentage=50)
+        self.url = f'/api/shop/products/{self.product.pk}/curriculum/'
+
+    def test_progress_overlay(self):
+        self.client.force_authenticate(self.user)
+        data = self.client.get(self.url).data
+        self.assertEqual((data['lessons'], data['completed_lessons'], data['duration'], data['completion']), (3, 1, 960, 50))
+        first, second = data['chapters']
+        self.assertEqual((first['completed_lessons'], first['completion'], second['completion']), (1, 75, 0))
+        self.assertEqual([lesson['progress']['progress_percentage'] for lesson in first['lessons']], [100, 50])
+        self.assertIsNone(second['lessons'][0]['progress'])
+
+    def test_anonymous_users_get_no_progress(self):
+        data = self.client.get(self.url).data
+        self.assertEqual((data['completed_lessons'], data['completion']), (0, 0))
+        self.assertIsNone(data['chapters'][0]['lessons'][0]['progress'])
+
+    def test_inactive_products_are_hidden(self):
+        Product.objects.filter(pk=self.product.pk).update(is_active=False)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/api/shop/products/{self.product.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UserResourceTests(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.product = create_product(Category.objects.create(name='c', slug='c'), 'p')
+        self.cart = Cart.objects.create(user=self.alice)
+        self.item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+
+    def test_other_users_cart_is_forbidden(self):
+        self.client.force_authenticate(self.bob)
+        base = f'/api/shop/users/{self.alice.pk}'
+        self.assertEqual(self.client.get(f'{base}/cart/').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(f'{base}/orders/').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.delete(f'{base}/cart/items/{self.item.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.delete(f'{base}/cart/items/bulk/', [self.item.pk], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(CartItem.objects.filter(pk=self.item.pk).exists())
+
+    def test_owner_and_staff_reach_the_cart(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get(f'/api/shop/users/{self.alice.pk}/cart/').status_code, status.HTTP_200_OK)
+        self.bob.is_staff = True
+        self.bob.save()
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.get(f'/api/shop/users/{self.alice.pk}/cart/').status_code, status.HTTP_200_OK)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartVariantTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        category = Category.objects.create(name='c', slug='c')
+        self.expensive = create_product(category, 'expensive', price=1000)
+        self.cheap_variant = ProductVariant.objects.create(
+            product=create_product(category, 'cheap'), sku='cheap', price=1, stock=5,
+        )
+        self.cart = Cart.objects.create(user=self.user)
+        self.url = f'/api/shop/users/{self.user.pk}/cart/items/'
+        self.client.force_authenticate(self.user)
+
+    def test_variant_of_another_product_is_rejected(self):
+        payload = {'product_id': self.expensive.pk, 'variant_id': self.cheap_variant.pk, 'quantity': 1}
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('variant_id', response.data)
+        response = self.client.post(f'{self.url}bulk/', [payload], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_mismatched_and_inactive_lines_are_not_checked_out(self):
+        CartItem.objects.create(cart=self.cart, product=self.expensive, variant=self.cheap_variant, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=create_product(self.expensive.category, 'off', is_active=False), quantity=1)
+        response = self.client.post(
+            f'/api/shop/users/{self.user.pk}/orders/', {'shipping_address': 'Tehran'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogWriteTests(APITestCase):
+    def setUp(self):
+        self.product = create_product(Category.objects.create(name='c', slug='c'), 'p')
+        self.attribute = ProductAttribute.objects.create(name='color')
+        self.url = f'/api/shop/products/{self.product.pk}/attribute-values/bulk/'
+        self.payload = [{'attribute': self.attribute.pk, 'value': 'red'}]
+
+    def test_customers_cannot_write_attribute_values(self):
+        self.client.force_authenticate(User.objects.create_user('bob', 'bob@example.com', 'pw'))
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(ProductAttributeValue.objects.exists())
+        listing = self.client.get(f'/api/shop/products/{self.product.pk}/attribute-values/')
+        self.assertEqual(listing.status_code, status.HTTP_200_OK)
+
+    def test_staff_can_write_attribute_values(self):
+        self.client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True))
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.product.attribute_values.get().value, 'red')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CheckoutTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        product = create_product(Category.objects.create(name='c', slug='c'), 'p')
+        self.variant = ProductVariant.objects.create(product=product, sku='sku', price=10, stock=5)
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=product, variant=self.variant, quantity=2)
+        self.discount = DiscountCode.objects.create(
+            code='ONCE', discount_type='fixed_cart', discount_value=1, expiry_date=timezone.now() + timedelta(days=1),
+        )
+        self.client.force_authenticate(self.user)
+
+    def submit(self):
+        return self.client.post(
+            f'/api/shop/users/{self.user.pk}/orders/', {'shipping_address': 'Tehran', 'discount_code': 'ONCE'},
+            format='json',
+        )
+
+    def assertCheckedOutOnce(self):
+        self.variant.refresh_from_db()
+        self.discount.refresh_from_db()
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual((self.variant.reserved, self.discount.times_used), (2, 1))
+
+    def test_double_submit_checks_out_once(self):
+        self.assertEqual(self.submit().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.submit().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertCheckedOutOnce()
+
+    def test_lines_checked_out_meanwhile_roll_the_order_back(self):
+        stale_lines = get_cart_lines(self.cart)
+        self.assertEqual(self.submit().status_code, status.HTTP_201_CREATED)
+        CartItem.objects.create(cart=self.cart, product=self.variant.product, variant=self.variant, quantity=2)
+        # Priced from lines another checkout has already removed
+        with mock.patch('shop.checkout.price_cart', lambda *args, **kwargs: price_lines(stale_lines, self.user)):
+            with self.assertRaisesMessage(CheckoutError, 'دوباره تلاش کنید'):
+                checkout(self.user, self.cart, 'Tehran', discount_code='ONCE')
+        self.assertCheckedOutOnce()
+        self.assertEqual(self.cart.items.count(), 1)
+
+    def test_checkout_returns_the_order_whatever_the_list_filters(self):
+        response = self.client.post(
+            f'/api/shop/users/{self.user.pk}/orders/?status=shipped', {'shipping_address': 'Tehran'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual((response.data['id'], response.data['status']), (order.pk, 'pending'))
+        self.assertEqual(len(response.data['items']), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='c', slug='c')
+        for i in range(3):
+            create_product(category, f'p{i}')
+
+    def test_cached_list_revalidates_without_queries(self):
+        response = self.client.get('/api/shop/products/')
+        etag = response['ETag']
+        self.client.get('/api/shop/products/')  # warm
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/shop/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/shop/products/')['X-Cache'], 'HIT')
+
+    def test_etag_changes_with_the_data(self):
+        etag = self.client.get('/api/shop/products/')['ETag']
+        product = Product.objects.get(slug='p0')
+        product.name = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.client.get('/api/shop/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.product = create_product(Category.objects.create(name='c', slug='c'), 'p')
+
+    def test_saving_a_stale_product_keeps_the_ratings(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Review.objects.create(product=self.product, user=self.user, rating=4, title='t', content='c', is_approved=True)
+        stale.name = 'renamed'
+        stale.save()
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.name, 'renamed')
+        self.assertEqual((product.rating_count, product.rating_avg, product.rating_4_count), (1, 4.0, 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StockHoldTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        product = create_product(Category.objects.create(name='c', slug='c'), 'p')
+        self.variant = ProductVariant.objects.create(product=product, sku='sku', price=10, stock=20)
+
+    def place_order(self, number, status='pending'):
+        order = Order.objects.create(
+            user=self.user, order_number=number, shipping_address='-', shipping_cost=0, subtotal=0, total=0,
+        )
+        hold_stock(order, {self.variant.pk: 3}, minutes=-1)
+        Order.objects.filter(pk=order.pk).update(status=status)
+        return order
+
+    def stock(self):
+        self.variant.refresh_from_db()
+        return self.variant.stock, self.variant.reserved
+
+    def test_sweeper_fulfils_only_confirmed_orders(self):
+        self.place_order('pending')
+        for status in ('cancelled', 'refunded', 'processing'):
+            self.place_order(status, status)
+        self.assertEqual(self.stock(), (20, 12))
+        self.assertEqual(sweep_expired_holds(), 4)
+        self.assertEqual(self.stock(), (17, 0))
+        self.assertEqual(Order.objects.get(order_number='pending').status, 'cancelled')
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_cancelling_an_order_releases_its_holds(self):
+        order = self.place_order('order')
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(self.stock(), (20, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_saving_a_stale_variant_keeps_the_holds(self):
+        stale = ProductVariant.objects.get(pk=self.variant.pk)
+        self.place_order('order')
+        stale.price = 12
+        stale.save()
+        self.assertEqual(self.stock(), (20, 3))
+
+    def test_inactive_products_cannot_be_resolved(self):
+        url = f'/api/shop/products/{self.variant.product_id}/variants/resolve/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        Product.objects.filter(pk=self.variant.product_id).update(is_active=False)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_product_detail_follows_holds(self):
+        url = f'/api/shop/products/{self.variant.product_id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.data['variant_matrix']['variants'][0]['available_stock'], 20)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place_order('order')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['variant_matrix']['variants'][0]['available_stock'], 17)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogImportTests(APITestCase):
+    def test_invalid_lines_are_reported_and_skipped(self):
+        Category.objects.create(name='c', slug='c')
+        feed = io.StringIO('\n'.join([
+            '{"slug": "broken", ',
+            '{"slug": "negative", "category": "c", "variants": [{"sku": "n-1", "stock": -2}]}',
+            '{"slug": "ok", "category": "c", "price": "5", "variants": [{"sku": "ok-1", "stock": 3}]}',
+        ]))
+        importer = CatalogImporter(download_images=False)
+        stats = importer.run(read_jsonl(feed))
+        self.assertEqual([number for number, _ in importer.errors], [1, 2])
+        self.assertEqual((stats['products'], stats['rejected']), (1, 2))
+        self.assertEqual(list(ProductVariant.objects.values_list('sku', 'stock')), [('ok-1', 3)])
+
+    def test_skus_of_other_products_and_repeated_skus_are_rejected(self):
+        category = Category.objects.create(name='c', slug='c')
+        ProductVariant.objects.create(product=create_product(category, 'owner'), sku='taken', price=1, stock=7)
+        feed = io.StringIO('\n'.join([
+            '{"slug": "thief", "category": "c", "variants": [{"sku": "taken", "stock": 0}]}',
+            '{"slug": "first", "category": "c", "variants": [{"sku": "new", "stock": 1}]}',
+            '{"slug": "second", "category": "c", "variants": [{"sku": "new", "stock": 2}]}',
+            '{"slug": "twice", "category": "c", "variants": [{"sku": "dup", "stock": 1}, {"sku": "dup", "stock": 2}]}',
+            '{"slug": "owner", "category": "c", "variants": [{"sku": "taken", "stock": 4}]}',
+        ]))
+        importer = CatalogImporter(download_images=False)
+        stats = importer.run(read_jsonl(feed))
+        self.assertEqual([number for number, _ in importer.errors], [1, 3, 4])
+        self.assertIn("belongs to product 'owner'", importer.errors[0][1])
+        self.assertIn('(line 2)', importer.errors[1][1])
+        self.assertEqual((stats['products'], stats['rejected']), (2, 3))
+        self.assertEqual(
+            sorted(ProductVariant.objects.values_list('sku', 'product__slug', 'stock')),
+            [('new', 'first', 1), ('taken', 'owner', 4)],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DiscountUsageTests(APITestCase):
+    def test_saving_a_stale_code_keeps_its_redemptions(self):
+        user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        discount = DiscountCode.objects.create(
+            code='HOT', discount_type='fixed_cart', discount_value=1, usage_limit=1,
+            expiry_date=timezone.now() + timedelta(days=1),
+        )
+        stale = DiscountCode.objects.get(pk=discount.pk)
+        order = Order.objects.create(
+            user=user, order_number='ORDER', shipping_address='-', shipping_cost=0, subtotal=0, total=0,
+        )
+        redeem_discount(discount, user, order)
+        stale.description = 'flash sale'
+        stale.save()
+        discount.refresh_from_db()
+        self.assertEqual((discount.description, discount.times_used), ('flash sale', 1))
+
+    def test_cancelling_an_order_gives_back_its_redemption(self):
+        user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        discount = DiscountCode.objects.create(
+            code='HOT', discount_type='fixed_cart', discount_value=1, usage_limit=1, usage_limit_per_user=1,
+            expiry_date=timezone.now() + timedelta(days=1),
+        )
+        order = Order.objects.create(
+            user=user, order_number='ORDER', shipping_address='-', shipping_cost=0, subtotal=0, total=0,
+        )
+        redeem_discount(discount, user, order)
+        for _ in range(2):
+            order.status = 'cancelled'
+            order.save()
+            discount.refresh_from_db()
+            self.assertEqual(discount.times_used, 0)
+            self.assertFalse(DiscountUsage.objects.filter(order=order).exists())
+            self.assertEqual(DiscountUserUsage.objects.get(discount_code=discount, user=user).times_used, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SessionCartTests(APITestCase):
+    token = 'a' * 32
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        category = Category.objects.create(name='c', slug='c')
+        self.a = create_product(category, 'a')
+        self.b = create_product(category, 'b')
+        self.inactive = create_product(category, 'inactive', is_active=False)
+        self.variant = ProductVariant.objects.create(product=self.b, sku='b-1', price=5, stock=1)
+
+    def fill(self, token=None):
+        storage = get_cart_storage(token or self.token)
+        storage.add(self.a.pk, None, 3)
+        storage.add(self.b.pk, self.variant.pk, 1)
+        storage.add(self.inactive.pk, None, 1)
+        storage.add(self.a.pk, self.variant.pk, 1)  # variant of another product
+        storage.add(999, None, 1)
+        return storage
+
+    def cart_items(self):
+        return sorted(CartItem.objects.filter(cart__user=self.user).values_list('product__slug', 'variant__sku', 'quantity'))
+
+    def test_merge_sums_existing_lines_and_drops_invalid_ones(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.a, quantity=2)
+        storage = self.fill()
+        self.assertEqual(merge_session_cart(self.token, self.user), cart)
+        self.assertEqual(self.cart_items(), [('a', None, 5), ('b', 'b-1', 1)])
+        self.assertEqual(storage.items(), {})
+        self.assertIsNone(merge_session_cart(self.token, self.user))
+
+    def test_token_header(self):
+        response = self.client.post(
+            '/api/shop/session-cart/', {'product_id': self.a.pk, 'quantity': 2}, HTTP_X_CART_TOKEN=self.token,
+        )
+        self.assertEqual((response.status_code, response.data['token']), (status.HTTP_201_CREATED, self.token))
+        response = self.client.get('/api/shop/session-cart/', HTTP_X_CART_TOKEN=self.token)
+        self.assertEqual((response.data['item_count'], response.data['subtotal']), (2, '20.00'))
+        # Malformed tokens are ignored rather than used as cache keys
+        response = self.client.get('/api/shop/session-cart/', HTTP_X_CART_TOKEN='../other')
+        self.assertEqual((response.data['token'], response.data['item_count']), (None, 0))
+
+    def test_merge_endpoint(self):
+        self.fill()
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/shop/session-cart/merge/', HTTP_X_CART_TOKEN=self.token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(item['quantity'] for item in response.data['items']), [1, 3])
+        response = self.client.post('/api/shop/session-cart/merge/', HTTP_X_CART_TOKEN=self.token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_login_merges_the_session_cart(self):
+        response = self.client.post('/api/shop/session-cart/', {'product_id': self.a.pk, 'quantity': 2})
+        token = response.data['token']
+        self.assertTrue(self.client.login(username='alice', password='pw'))
+        self.assertEqual(self.cart_items(), [('a', None, 2)])
+        self.assertEqual(get_cart_storage(token).items(), {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ShippingZoneTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.post = ShippingMethod.objects.create(name='post', price=5)
+        self.express = ShippingMethod.objects.create(name='express', price=20)
+        disabled = ShippingMethod.objects.create(name='disabled', price=1, is_active=False)
+        self.country = self.create_zone('country', 'IR', methods=[self.express, self.post, disabled])
+        self.shadowed = self.create_zone('shadowed', 'ir', methods=[self.post])
+        self.state = self.create_zone('state', 'IR', states='TEH, ALB', methods=[self.express])
+        self.city = self.create_zone('city', 'IR', cities='Tehran', methods=[self.post])
+
+    def create_zone(self, name, countries, methods, **kwargs):
+        zone = ShippingZone.objects.create(name=name, countries=countries, **kwargs)
+        with self.captureOnCommitCallbacks(execute=True):
+            zone.shipping_methods.set(methods)
+        return zone
+
+    def assertResolves(self, address, zone, methods):
+        self.assertEqual(resolve_shipping(*address), (zone, methods))
+
+    def test_most_specific_zone_wins(self):
+        self.assertResolves(('ir', 'teh', '  TEHRAN '), self.city, [self.post])
+        self.assertResolves(('IR', 'alb', 'Karaj'), self.state, [self.express])
+        # Both country zones claim IR; the lowest id wins and inactive methods are dropped
+        self.assertResolves(('IR', 'ISF', ''), self.country, [self.post, self.express])
+        self.assertResolves(('US', '', ''), None, [])
+
+    def test_table_is_rebuilt_when_zones_or_methods_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.state.shipping_methods.add(self.post)
+        self.assertResolves(('IR', 'TEH', ''), self.state, [self.post, self.express])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.express.is_active = False
+            self.express.save()
+        self.assertResolves(('IR', 'TEH', ''), self.state, [self.post])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.state.states = 'ALB'
+            self.state.save()
+        self.assertResolves(('IR', 'TEH', ''), self.country, [self.post])
+
+    def test_quote_endpoint(self):
+        product = create_product(Category.objects.create(name='c', slug='c'), 'p', price=10)
+        token = 'b' * 32
+        get_cart_storage(token).add(product.pk, None, 2)
+        response = self.client.get(
+            '/api/shop/shipping-quote/', {'country': 'IR', 'state': 'TEH', 'city': 'Karaj'}, HTTP_X_CART_TOKEN=token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['zone'], response.data['item_count']), (self.state.pk, 2))
+        self.assertEqual(
+            [(method['name'], method['shipping_cost'], method['total']) for method in response.data['methods']],
+            [('express', '20.00', '40.00')],
+        )
+        response = self.client.get('/api/shop/shipping-quote/', {'country': 'US'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductFacetTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        category = Category.objects.create(name='c', slug='c')
+        attributes = {name: ProductAttribute.objects.create(name=name) for name in ('Color', 'Size', 'Material')}
+        rows = [
+            ('red', 'L', 'cotton'), ('red', 'M', None), ('blue', 'L', 'wool'),
+            ('blue', 'M', None), ('green', 'L', None), ('red', 'L', 'cotton'),
+        ]
+        for i, values in enumerate(rows, 1):
+            product = create_product(category, f'p{i}', price=i * 10)
+            for attribute, value in zip(attributes.values(), values):
+                if value:
+                    ProductAttributeValue.objects.create(product=product, attribute=attribute, value=value)
+        create_product(category, 'hidden', is_active=False)
+
+    def test_counts_are_disjunctive_for_selected_attributes(self):
+        response = self.client.get('/api/shop/products/facets/', {'attr[color]': 'red', 'attr[Size]': 'L'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['price'], {'min': '10.00', 'max': '60.00'})
+        facets = {
+            facet['name']: [(item['value'], item['count'], item['selected']) for item in facet['values']]
+            for facet in response.data['attributes']
+        }
+        self.assertEqual(facets, {
+            # Counted with the size filter only, so the other colours show what they would add
+            'Color': [('red', 2, True), ('blue', 1, False), ('green', 1, False)],
+            'Size': [('L', 2, True), ('M', 1, False)],
+            'Material': [('cotton', 2, False)],
+        })
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CategoryTreeTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.a = Category.objects.create(name='a', slug='a')
+        self.b = Category.objects.create(name='b', slug='b', parent=self.a)
+        self.c = Category.objects.create(name='c', slug='c', parent=self.b)
+        self.d = Category.objects.create(name='d', slug='d')
+        for category in (self.a, self.b, self.c, self.d):
+            create_product(category, f'in-{category.slug}')
+
+    def slugs(self, queryset):
+        return [category.slug for category in queryset]
+
+    def test_moving_a_node_rewrites_its_subtree(self):
+        self.b.parent = self.d
+        self.b.save()
+        self.c.refresh_from_db()
+        self.assertEqual(self.b.path, encode_segment(self.d.pk) + encode_segment(self.b.pk))
+        self.assertEqual(self.c.path, self.b.path + encode_segment(self.c.pk))
+        self.assertEqual((self.b.depth, self.c.depth), (1, 2))
+        self.assertEqual(self.slugs(self.d.descendants()), ['b', 'c'])
+        self.assertEqual(self.slugs(self.a.descendants(include_self=True)), ['a'])
+        self.assertEqual(self.slugs(self.c.breadcrumb()), ['d', 'b', 'c'])
+
+        self.b.parent = None
+        self.b.save()
+        self.c.refresh_from_db()
+        self.assertEqual(self.c.path, encode_segment(self.b.pk) + encode_segment(self.c.pk))
+
+    def test_a_node_cannot_move_under_itself_or_a_descendant(self):
+        for parent in (self.a, self.c):
+            self.a.parent = parent
+            with self.assertRaisesMessage(ValidationError, 'cannot be moved under itself or its descendants'):
+                self.a.save()
+        self.assertEqual(Category.objects.get(pk=self.a.pk).parent_id, None)
+
+    def test_products_filter_on_a_category_subtree(self):
+        def slugs(category):
+            response = self.client.get('/api/shop/products/', {'category__descendants': category.pk})
+            return sorted(product['slug'] for product in response.data['results'])
+
+        self.assertEqual(slugs(self.b), ['in-b', 'in-c'])
+        self.assertEqual(slugs(self.a), ['in-a', 'in-b', 'in-c'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b.parent = self.d
+            self.b.save()
+        self.assertEqual(slugs(self.a), ['in-a'])
+        self.assertEqual(slugs(self.d), ['in-b', 'in-c', 'in-d'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        category = Category.objects.create(name='c', slug='c')
+        for i in range(3):
+            product = create_product(category, f'p{i}')
+            chapter = Chapter.objects.create(product=product, title='one', order=1)
+            Lesson.objects.create(chapter=chapter, title='a', content='<p>c</p>', order=1, duration=timedelta(minutes=1))
+        self.product = product
+
+    def get(self, url, queries, **params):
+        get_cache().clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_list(self):
+        data = self.get('/api/shop/products/', 3)
+        self.assertIn('images', data['results'][0])
+        # Unused relations are neither serialized nor prefetched
+        data = self.get('/api/shop/products/', 1, fields='id,name')
+        self.assertEqual([sorted(product) for product in data['results']], [['id', 'name']] * 3)
+
+    def test_retrieve_expand(self):
+        url = f'/api/shop/products/{self.product.pk}/'
+        self.assertNotIn('chapters', self.get(url, 8))
+        data = self.get(url, 4, fields='id,name', expand='chapters')
+        self.assertEqual(sorted(data), ['chapters', 'id', 'name'])
+        self.assertEqual([lesson['title'] for lesson in data['chapters'][0]['lessons']], ['a'])
+        self.assertEqual(sorted(self.get(url, 1, fields='id,slug,bogus')), ['id', 'slug'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DiscountRuleTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        root = Category.objects.create(name='root', slug='root')
+        self.child = Category.objects.create(name='child', slug='child', parent=root)
+        self.other = Category.objects.create(name='other', slug='other')
+        self.root = root
+        self.a = create_product(self.child, 'a', price=10)
+        self.b = create_product(self.child, 'b', price=20)
+        self.c = create_product(self.other, 'c', price=2)
+        self.lines = get_item_lines({(self.a.pk, None): 1, (self.b.pk, None): 1, (self.c.pk, None): 2})
+
+    def create_discount(self, discount_type='fixed_product', discount_value=3, **kwargs):
+        return DiscountCode.objects.create(
+            code='CODE', discount_type=discount_type, discount_value=discount_value,
+            expiry_date=timezone.now() + timedelta(days=1), **kwargs
+        )
+
+    def eligible(self, discount):
+        result = evaluate_discount(discount, self.user, self.lines)
+        return sorted(line.slug for line in result.eligible_lines), result.amount
+
+    def test_product_and_category_rules_follow_relation_changes(self):
+        discount = self.create_discount()
+        self.assertEqual(self.eligible(discount), (['a', 'b', 'c'], Decimal('10.00')))
+        steps = [
+            (lambda: discount.categories.add(self.root), (['a', 'b'], Decimal('6.00'))),
+            (lambda: discount.excluded_products.add(self.b), (['a'], Decimal('3.00'))),
+            (lambda: (discount.categories.clear(), discount.products.add(self.c)), (['c'], Decimal('4.00'))),
+            (lambda: discount.excluded_categories.add(self.other), ([], Decimal('0.00'))),
+        ]
+        for change, expected in steps:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertEqual(self.eligible(discount), expected)
+            # The rules are served from the cache until the next change
+            with self.assertNumQueries(0):
+                get_rules(discount)
+
+    def test_sale_items_can_be_excluded(self):
+        self.lines = get_item_lines({(self.a.pk, None): 1})
+        variant = ProductVariant.objects.create(product=self.b, sku='b-1', price=20, sale_price=15, stock=1)
+        self.lines += get_item_lines({(self.b.pk, variant.pk): 1})
+        self.assertEqual(self.eligible(self.create_discount(exclude_sale_items=True)), (['a'], Decimal('3.00')))
+
+    def test_min_and_max_amount(self):
+        discount = self.create_discount('percentage', 10, min_amount=50)
+        with self.assertRaisesMessage(DiscountError, 'حداقل مبلغ خرید'):
+            evaluate_discount(discount, self.user, self.lines)
+        discount.min_amount, discount.max_amount = 34, 35
+        self.assertEqual(evaluate_discount(discount, self.user, self.lines).amount, Decimal('3.40'))
+        discount.max_amount = 30
+        with self.assertRaisesMessage(DiscountError, 'حداکثر مبلغ خرید'):
+            evaluate_discount(discount, self.user, self.lines)
+
+    def test_per_user_limit(self):
+        discount = self.create_discount('fixed_cart', Decimal('5'), usage_limit_per_user=1)
+        order = Order.objects.create(
+            user=self.user, order_number='ORDER', shipping_address='-', shipping_cost=0, subtotal=0, total=0,
+        )
+        redeem_discount(discount, self.user, order)
+        with self.assertRaisesMessage(DiscountError, 'بیش از حد مجاز'):
+            evaluate_discount(discount, self.user, self.lines)
+        other = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.assertEqual(evaluate_discount(discount, other, self.lines).amount, Decimal('5.00'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DiscountRedemptionConcurrencyTests(TransactionTestCase):
+    """Many threads redeem one code at once; the conditional UPDATEs must not oversell it."""
+
+    def redeem_concurrently(self, discount, orders):
+        barrier = threading.Barrier(len(orders))
+        outcomes = []
+
+        def redeem(order):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        redeem_discount(discount, order.user, order)
+                        outcomes.append('redeemed')
+                        return
+                    except DiscountError:
+                        outcomes.append('rejected')
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting; the transaction rolled back
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=redeem, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def create_orders(self, users, count):
+        Order.objects.bulk_create([
+            Order(
+                user=users[i % len(users)], order_number=f'ORDER-{i}',
+                shipping_address='-', shipping_cost=0, subtotal=0, total=0,
+            )
+            for i in range(count)
+        ])
+        return list(Order.objects.select_related('user').order_by('pk'))
+
+    def create_discount(self, **kwargs):
+        return DiscountCode.objects.create(
+            code='HOT', discount_type='fixed_cart', discount_value=1,
+            expiry_date=timezone.now() + timedelta(days=1), **kwargs,
+        )
+
+    def test_usage_limit_is_never_oversold(self):
+        users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw') for i in range(12)]
+        discount = self.create_discount(usage_limit=5)
+        outcomes = self.redeem_concurrently(discount, self.create_orders(users, 12))
+
+        discount.refresh_from_db()
+        self.assertEqual(outcomes.count('redeemed'), 5)
+        self.assertEqual(outcomes.count('rejected'), 7)
+        self.assertEqual(discount.times_used, 5)
+        self.assertEqual(DiscountUsage.objects.filter(discount_code=discount).count(), 5)
+
+    def test_per_user_limit_is_never_oversold(self):
+        user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        discount = self.create_discount(usage_limit=0, usage_limit_per_user=2)
+        outcomes = self.redeem_concurrently(discount, self.create_orders([user], 8))
+
+        discount.refresh_from_db()
+        self.assertEqual(outcomes.count('redeemed'), 2)
+        self.assertEqual(discount.times_used, 2)
+        self.assertEqual(DiscountUserUsage.objects.get(discount_code=discount, user=user).times_used, 2)
@@ -15,6 +15,7 @@ shop_router.register(r'discount-codes', views.DiscountCodeViewSet, basename='dis
 # Nested routers for product-related resources
 products_router = routers.NestedDefaultRouter(shop_router, r'products', lookup='product')
 products_router.register(r'variants', views.ProductVariantViewSet, basename='product-variants')
+products_router.register(r'attribute-values', views.ProductAttributeValueViewSet, basename='product-attribute-values')
 products_router.register(r'chapters', views.ChapterViewSet, basename='product-chapters')
 products_router.register(r'reviews', views.ReviewViewSet, basename='product-reviews')
 
@@ -30,7 +31,9 @@ class UserResourceRouter(DefaultRouter):
             path('users/<int:user_pk>/orders/', views.OrderViewSet.as_view({'get': 'list', 'post': 'create'}), name='user-orders'),
             path('users/<int:user_pk>/orders/<int:pk>/', views.OrderViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='user-orders-detail'),
             path('users/<int:user_pk>/cart/', views.CartViewSet.as_view({'get': 'retrieve', 'post': 'create'}), name='user-cart'),
+            path('users/<int:user_pk>/cart/summary/', views.CartViewSet.as_view({'get': 'summary'}), name='user-cart-summary'),
             path('users/<int:user_pk>/cart/items/', views.CartItemViewSet.as_view({'get': 'list', 'post': 'create'}), name='user-cart-items'),
+            path('users/<int:user_pk>/cart/items/bulk/', views.CartItemViewSet.as_view({'post': 'bulk', 'patch': 'bulk', 'delete': 'bulk'}), name='user-cart-items-bulk'),
             path('users/<int:user_pk>/cart/items/<int:pk>/', views.CartItemViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='user-cart-items-detail'),
         ] + urls
 
@@ -39,4 +42,7 @@ user_router = UserResourceRouter()
 # Combine all URL patterns
 urlpatterns = shop_router.urls + products_router.urls + chapters_router.urls + user_router.urls + [
     path('validate-discount-code/', views.ValidateDiscountCodeView.as_view(), name='validate-discount-code'),
+    path('shipping-quote/', views.ShippingQuoteView.as_view(), name='shipping-quote'),
+    path('session-cart/', views.SessionCartView.as_view(), name='session-cart'),
+    path('session-cart/merge/', views.SessionCartMergeView.as_view(), name='session-cart-merge'),
 ]
\ No newline at end of file
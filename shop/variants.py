@@ -0,0 +1,141 @@
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from api.cache import get_cache, get_tag_versions
+from .models import ProductVariant
+
+MATRIX_PREFIX = 'variants:matrix:'
+
+
+def stock_tag(product_id):
+    """Bumped by ``shop.inventory`` whenever a variant's available stock moves."""
+    return f'shop.product:{product_id}:stock'
+
+
+@dataclass(frozen=True)
+class VariantMatrix:
+    """
+    A product's variants as a grid: ``axes`` are ``(attribute_id, name,
+    values)`` and each row is ``(variant_id, sku, price, sale_price,
+    options)`` where ``options`` holds one index into each axis' values
+    (-1 when the variant does not set that attribute). ``index`` maps a
+    complete options tuple to its row.
+    """
+    axes: tuple = ()
+    rows: tuple = ()
+    index: dict = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, product_id):
+        variants = list(
+            ProductVariant.objects.filter(product_id=product_id).order_by('pk')
+            .values_list('pk', 'sku', 'price', 'sale_price')
+        )
+        links = ProductVariant.attributes.through.objects.filter(
+            productvariant__product_id=product_id
+        ).values_list(
+            'productvariant_id', 'productattributevalue__attribute_id',
+            'productattributevalue__attribute__name', 'productattributevalue__value',
+        )
+        names, values, chosen = {}, {}, {}
+        for variant_id, attribute_id, name, value in links:
+            names[attribute_id] = name
+            values.setdefault(attribute_id, set()).add(value)
+            chosen.setdefault(variant_id, {})[attribute_id] = value
+
+        axes = tuple((pk, names[pk], tuple(sorted(values[pk]))) for pk in sorted(names))
+        rows, index = [], {}
+        for pk, sku, price, sale_price in variants:
+            options = tuple(
+                axis_values.index(chosen[pk][attribute_id]) if attribute_id in chosen.get(pk, {}) else -1
+                for attribute_id, _, axis_values in axes
+            )
+            index.setdefault(options, len(rows))
+            rows.append((pk, sku, price, sale_price, options))
+        return cls(axes=axes, rows=tuple(rows), index=index)
+
+    def parse(self, selected):
+        """``{attribute name (casefolded): [value, ...]}`` as ``{axis: value index}``; unknown values map to None."""
+        selection = {}
+        for position, (_, name, values) in enumerate(self.axes):
+            chosen = selected.get(name.casefold())
+            if chosen:
+                selection[position] = values.index(chosen[0]) if chosen[0] in values else None
+        return selection
+
+    def matching(self, selection):
+        return [
+            row for row in self.rows
+            if all(row[4][axis] == value for axis, value in selection.items())
+        ]
+
+    def resolve(self, selection):
+        """The row of a complete selection, or None."""
+        if len(selection) != len(self.axes) or None in selection.values():
+            return None
+        position = self.index.get(tuple(selection[axis] for axis in range(len(self.axes))))
+        return None if position is None else self.rows[position]
+
+    def options(self, selection, stock):
+        """
+        For every axis, which values still lead to an in-stock variant when
+        combined with the rest of ``selection``.
+        """
+        result = []
+        for axis, (attribute_id, name, values) in enumerate(self.axes):
+            others = {other: value for other, value in selection.items() if other != axis}
+            candidates = self.matching(others)
+            result.append({
+                'id': attribute_id,
+                'name': name,
+                'values': [
+                    {
+                        'value': value,
+                        'selected': selection.get(axis) == position,
+                        'available': any(row[4][axis] == position and stock.get(row[0], 0) > 0 for row in candidates),
+                    }
+                    for position, value in enumerate(values)
+                ],
+            })
+        return result
+
+    @staticmethod
+    def row_dict(row, stock):
+        pk, sku, price, sale_price, options = row
+        return {
+            'id': pk, 'sku': sku, 'price': str(price),
+            'sale_price': None if sale_price is None else str(sale_price),
+            'available_stock': stock.get(pk, 0), 'options': list(options),
+        }
+
+    def as_dict(self, stock):
+        return {
+            'attributes': [{'id': pk, 'name': name, 'values': list(values)} for pk, name, values in self.axes],
+            'variants': [self.row_dict(row, stock) for row in self.rows],
+        }
+
+
+def get_variant_matrix(product_id):
+    """The matrix of ``product_id``, cached until one of its variants or values changes."""
+    versions = '.'.join(str(version) for version in get_tag_versions([f'shop.product:{product_id}']))
+    key = f'{MATRIX_PREFIX}{product_id}:{versions}'
+    cache = get_cache()
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = VariantMatrix.build(product_id)
+        # Versioned keys are never read again once the tag moves; let them expire
+        cache.set(key, matrix, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    return matrix
+
+
+def get_variant_stock(product_id):
+    """
+    Available stock per variant, read live. Holds and sales bump
+    ``stock_tag(product_id)`` rather than the product tag, so cached product
+    details are refreshed without rebuilding the matrix.
+    """
+    return {
+        pk: max(stock - reserved, 0)
+        for pk, stock, reserved in ProductVariant.objects.filter(product_id=product_id).values_list('pk', 'stock', 'reserved')
+    }
@@ -1,8 +1,14 @@
+from dataclasses import replace
+from decimal import Decimal
+
 from django.shortcuts import render, get_object_or_404
+from django.http import Http404
+from django.utils import timezone
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django_filters.rest_framework import DjangoFilterBackend, FilterSet, CharFilter
+from django_filters.rest_framework import DjangoFilterBackend, FilterSet, CharFilter, NumberFilter
 from .models import (
     Category, Product, ProductImage, ProductVariant,
     ProductAttribute, ProductAttributeValue, ShippingMethod,
@@ -10,21 +16,53 @@ from .models import (
     Review, Chapter, Lesson, UserProgress, DiscountCode, DiscountUsage
 )
 from .serializers import (
-    CategorySerializer, ProductSerializer, ProductImageSerializer,
+    CategorySerializer, ProductSerializer, ProductDetailSerializer, ProductListSerializer, ProductImageSerializer,
     ProductVariantSerializer, ProductAttributeSerializer,
     ProductAttributeValueSerializer, ShippingMethodSerializer,
     ShippingZoneSerializer, OrderSerializer, OrderItemSerializer,
     PaymentSerializer, CartSerializer, CartItemSerializer,
     ReviewSerializer, ChapterSerializer, LessonSerializer,
-    UserProgressSerializer, DiscountCodeSerializer
+    UserProgressSerializer, DiscountCodeSerializer, CheckoutSerializer,
+    CartSummaryParamsSerializer, CartSummarySerializer, SessionCartItemSerializer,
+    ShippingQuoteParamsSerializer, ShippingQuotesSerializer
 )
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from api.mixins import BulkWriteMixin, QueryPlanMixin, SparseFieldsetMixin, TreeMixin
+from api.cache import CachedResponseMixin, ConditionalGetMixin
+from api.filters import FullTextSearchFilter
+from api.pagination import KeysetPagination
+from api.tree import subtree_filter
+from .cart_storage import get_cart_storage, get_cart_token, merge_session_cart
+from . import facets
+from .checkout import CheckoutError, checkout
+from .curriculum import get_curriculum, with_progress
+from .pricing import get_cached_cart_lines, get_item_lines, price_cart, price_lines
+from .shipping import resolve_shipping
+from .variants import get_variant_matrix, get_variant_stock, stock_tag
 
 # Create your views here.
 
+class IsUserResourceOwner(permissions.BasePermission):
+    """Resources nested under users/<user_pk>/ belong to that user; only they and staff may reach them."""
+
+    def has_permission(self, request, view):
+        user_pk = view.kwargs.get('user_pk')
+        return user_pk is None or request.user.is_staff or str(request.user.pk) == str(user_pk)
+
+class IsAdminUserOrReadOnly(permissions.BasePermission):
+    """Catalog data: anyone may read, only staff may write."""
+
+    def has_permission(self, request, view):
+        return request.method in permissions.SAFE_METHODS or bool(request.user and request.user.is_staff)
+
 class ProductFilter(FilterSet):
+    """Also filters on ``?attr[<attribute name>]=value1,value2`` (see shop.facets)."""
     tags = CharFilter(method='filter_tags')
+    category__descendants = NumberFilter(method='filter_category_descendants')
+    min_rating = NumberFilter(field_name='rating_avg', lookup_expr='gte')
+    min_price = NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = NumberFilter(field_name='price', lookup_expr='lte')
     
     class Meta:
         model = Product
@@ -34,11 +72,33 @@ class ProductFilter(FilterSet):
         }
     
     def filter_tags(self, queryset, name, value):
-        return queryset.filter(tags__name__in=[value])
+        names = [tag.strip() for tag in value.split(',') if tag.strip()]
+        return facets.filter_tags(queryset, names) if names else queryset
+    
+    def split_queryset(self, queryset):
+        """
+        ``(queryset, selected, attribute_ids)``: ``queryset`` with every filter
+        but the attribute ones, which are returned parsed so facet counts can
+        leave them out one at a time. Call after ``is_valid()``.
+        """
+        selected = facets.parse_attribute_params(self.data)
+        attribute_ids = facets.attribute_ids_by_name() if selected else {}
+        return super().filter_queryset(queryset), selected, attribute_ids
+    
+    def filter_queryset(self, queryset):
+        return facets.filter_attributes(*self.split_queryset(queryset))
+    
+    def filter_category_descendants(self, queryset, name, value):
+        path = Category.objects.filter(pk=value).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        return queryset.filter(**subtree_filter(path, prefix='category__path'))
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, TreeMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_actions = ('list', 'retrieve', 'tree', 'descendants', 'ancestors', 'breadcrumb')
+    cache_tags = ['shop.category']
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
@@ -51,25 +111,103 @@ class ProductAttributeViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'description']
 
-class ProductViewSet(viewsets.ModelViewSet):
+def visible_products(user):
+    """Inactive products are only served to staff."""
+    if user.is_staff:
+        return Product.objects.all()
+    return Product.objects.filter(is_active=True)
+
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    list_serializer_class = ProductListSerializer
+    pagination_class = KeysetPagination
+    cache_tags = ['shop.category']
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_class = ProductFilter
     search_fields = ['name', 'description']
-    ordering_fields = ['price', 'created_at', 'updated_at']
+    ordering_fields = ['price', 'created_at', 'updated_at', 'rating_avg', 'rating_count']
+    cache_actions = ('list', 'retrieve', 'facets')
+    # count + page + attribute values, images, chapters, lessons, tags, rendered content + session/user (+ variant stock)
+    query_budgets = {'list': 10, 'retrieve': 12, 'facets': 10, 'curriculum': 6}
+    
+    def get_queryset(self):
+        return visible_products(self.request.user)
+    
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return ProductDetailSerializer
+        return super().get_serializer_class()
+    
+    def get_cache_tags(self):
+        tags = super().get_cache_tags()
+        if self.action == 'retrieve':
+            # variant_matrix carries live stock
+            tags.append(stock_tag(self.kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        return tags
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Attribute value, tag and price facets of the list filtered by the same query parameters."""
+        queryset = FullTextSearchFilter().filter_queryset(request, self.get_queryset(), self)
+        filterset = ProductFilter(request.query_params, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return Response(facets.product_facets(*filterset.split_queryset(filterset.queryset)))
+    
+    @action(detail=True, methods=['get'])
+    def curriculum(self, request, pk=None):
+        """Chapters and lessons without content, with the current user's progress on top."""
+        product = get_object_or_404(self.get_queryset(), pk=pk)
+        return Response(with_progress(get_curriculum(product.pk), request.user))
 
-class ProductVariantViewSet(viewsets.ModelViewSet):
+class ProductVariantViewSet(BulkWriteMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ProductVariantSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAdminUserOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['sku']
 
     def get_queryset(self):
         return ProductVariant.objects.filter(product_id=self.kwargs['product_pk'])
+    
+    @action(detail=False, methods=['get'])
+    def resolve(self, request, product_pk=None):
+        """
+        ``?attr[color]=red&attr[size]=M``: the variant of a complete selection
+        and, per attribute, which values still have stock next to the others.
+        """
+        product_pk = get_object_or_404(visible_products(request.user), pk=product_pk).pk
+        matrix = get_variant_matrix(product_pk)
+        stock = get_variant_stock(product_pk)
+        selection = matrix.parse(facets.parse_attribute_params(request.query_params))
+        row = matrix.resolve(selection)
+        return Response({
+            'variant': None if row is None else matrix.row_dict(row, stock),
+            'matches': len(matrix.matching(selection)) if None not in selection.values() else 0,
+            'options': matrix.options(selection, stock),
+        })
+    
+    def get_bulk_save_kwargs(self):
+        return {'product': get_object_or_404(Product, id=self.kwargs['product_pk'])}
+    
+    def perform_create(self, serializer):
+        serializer.save(**self.get_bulk_save_kwargs())
+
+class ProductAttributeValueViewSet(BulkWriteMixin, QueryPlanMixin, viewsets.ModelViewSet):
+    serializer_class = ProductAttributeValueSerializer
+    permission_classes = [IsAdminUserOrReadOnly]
+
+    def get_queryset(self):
+        return ProductAttributeValue.objects.filter(product_id=self.kwargs['product_pk']).order_by('pk')
+    
+    def get_bulk_save_kwargs(self):
+        return {'product': get_object_or_404(Product, id=self.kwargs['product_pk'])}
+    
+    def perform_create(self, serializer):
+        serializer.save(**self.get_bulk_save_kwargs())
 
-class ShippingMethodViewSet(viewsets.ModelViewSet):
+class ShippingMethodViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = ShippingMethod.objects.filter(is_active=True)
     serializer_class = ShippingMethodSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -82,10 +220,22 @@ class ShippingZoneViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'countries', 'states', 'cities']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        country = self.request.query_params.get('country')
+        if country:
+            # ?country=&state=&city= narrows to the zone serving that address
+            zone, _ = resolve_shipping(
+                country, self.request.query_params.get('state', ''), self.request.query_params.get('city', '')
+            )
+            queryset = queryset.filter(pk=zone.pk if zone else None)
+        return queryset
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    permission_classes = [permissions.IsAuthenticated, IsUserResourceOwner]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status']
     ordering_fields = ['created_at', 'updated_at']
@@ -96,10 +246,22 @@ class OrderViewSet(viewsets.ModelViewSet):
             return Order.objects.filter(user_id=user_pk)
         return Order.objects.filter(user=self.request.user)
     
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+    def create(self, request, *args, **kwargs):
+        # Orders are only created by checking out the user's cart; totals are computed server-side
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = Cart.objects.filter(user=request.user).order_by('-updated_at').first()
+        if cart is None:
+            return Response({'error': 'سبد خرید شما خالی است'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order = checkout(request.user, cart, **serializer.validated_data)
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        # Not through the list queryset: its URL user and filters need not match the new order
+        order = self.get_query_plan().apply(Order.objects.all(), defer=False).get(pk=order.pk)
+        return Response(self.get_serializer(order).data, status=status.HTTP_201_CREATED)
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+class OrderItemViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -113,9 +275,10 @@ class PaymentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Payment.objects.filter(order_id=self.kwargs['order_pk'])
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = CartSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsUserResourceOwner]
+    conditional_related = ['items', 'items__product']
     
     def get_queryset(self):
         user_pk = self.kwargs.get('user_pk')
@@ -123,12 +286,39 @@ class CartViewSet(viewsets.ModelViewSet):
             return Cart.objects.filter(user_id=user_pk)
         return Cart.objects.filter(user=self.request.user)
     
+    def get_object(self):
+        # users/<user_pk>/cart/ has no pk: serve the user's most recent cart
+        if self.lookup_field not in self.kwargs:
+            queryset = self.filter_queryset(self.get_queryset()).order_by('-updated_at')
+            cart = queryset.first()
+            if cart is None:
+                raise Http404
+            self.check_object_permissions(self.request, cart)
+            return cart
+        return super().get_object()
+    
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request, user_pk=None):
+        # Compact priced view of the cart; skips the nested product documents of CartSerializer
+        cart = self.get_queryset().order_by('-updated_at').first()
+        if cart is None:
+            raise Http404
+        params = CartSummaryParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        code = params.validated_data.get('discount_code')
+        discount = DiscountCode.objects.filter(code=code).first() if code else None
+        pricing = price_cart(cart, request.user, params.validated_data.get('shipping_method'), discount)
+        if code and discount is None:
+            pricing.discount_error = 'کد تخفیف نامعتبر است'
+        return Response(CartSummarySerializer(pricing).data)
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(ConditionalGetMixin, BulkWriteMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsUserResourceOwner]
+    conditional_related = ['product']
     
     def get_queryset(self):
         user_pk = self.kwargs.get('user_pk')
@@ -136,12 +326,30 @@ class CartItemViewSet(viewsets.ModelViewSet):
             return CartItem.objects.filter(cart__user_id=user_pk)
         return CartItem.objects.filter(cart__user=self.request.user)
     
+    def get_cart(self):
+        user_pk = self.kwargs.get('user_pk', self.request.user.pk)
+        cart = Cart.objects.filter(user_id=user_pk).order_by('-updated_at').first()
+        if cart is None:
+            cart = Cart.objects.create(user_id=user_pk)
+        return cart
+    
     def perform_create(self, serializer):
-        user_pk = self.kwargs.get('user_pk')
-        cart = Cart.objects.get_or_create(user_id=user_pk)[0]
-        serializer.save(cart=cart)
+        serializer.save(cart=self.get_cart())
+    
+    def get_bulk_save_kwargs(self):
+        return {'cart': self.get_cart()}
+    
+    def bulk_saved(self, instances):
+        # Bulk writes bypass CartItem.save(), which keeps the pricing snapshot key fresh
+        super().bulk_saved(instances)
+        Cart.objects.filter(pk__in={item.cart_id for item in instances}).update(updated_at=timezone.now())
+    
+    def perform_bulk_destroy(self, queryset):
+        cart_ids = set(queryset.values_list('cart_id', flat=True))
+        super().perform_bulk_destroy(queryset)
+        Cart.objects.filter(pk__in=cart_ids).update(updated_at=timezone.now())
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
@@ -160,27 +368,36 @@ class ReviewViewSet(viewsets.ModelViewSet):
         else:
             serializer.save(user=self.request.user)
 
-class ChapterViewSet(viewsets.ModelViewSet):
+class ChapterViewSet(ConditionalGetMixin, BulkWriteMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ChapterSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAdminUserOrReadOnly]
+    conditional_related = ['lessons']
     
     def get_queryset(self):
         return Chapter.objects.filter(product_id=self.kwargs['product_pk'])
     
+    def get_bulk_save_kwargs(self):
+        return {'product': get_object_or_404(Product, id=self.kwargs['product_pk'])}
+    
     def perform_create(self, serializer):
-        product = get_object_or_404(Product, id=self.kwargs['product_pk'])
-        serializer.save(product=product)
+        serializer.save(**self.get_bulk_save_kwargs())
 
-class LessonViewSet(viewsets.ModelViewSet):
+class LessonViewSet(ConditionalGetMixin, BulkWriteMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = LessonSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAdminUserOrReadOnly]
     
     def get_queryset(self):
         return Lesson.objects.filter(chapter_id=self.kwargs['chapter_pk'])
     
+    def get_bulk_queryset(self):
+        # The cache tags of a lesson need its chapter's product
+        return self.get_queryset().select_related('chapter')
+    
+    def get_bulk_save_kwargs(self):
+        return {'chapter': get_object_or_404(Chapter, id=self.kwargs['chapter_pk'])}
+    
     def perform_create(self, serializer):
-        chapter = get_object_or_404(Chapter, id=self.kwargs['chapter_pk'])
-        serializer.save(chapter=chapter)
+        serializer.save(**self.get_bulk_save_kwargs())
 
 class UserProgressViewSet(viewsets.ModelViewSet):
     serializer_class = UserProgressSerializer
@@ -229,66 +446,112 @@ class ValidateDiscountCodeView(APIView):
         except DiscountCode.DoesNotExist:
             return Response({'error': 'کد تخفیف نامعتبر است'}, status=status.HTTP_404_NOT_FOUND)
 
-        if not discount.is_valid():
-            return Response({'error': 'کد تخفیف منقضی شده یا غیرفعال است'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Check user usage limit
-        if discount.usage_limit_per_user > 0:
-            user_usage_count = DiscountUsage.objects.filter(
-                discount_code=discount,
-                user=request.user
-            ).count()
-            if user_usage_count >= discount.usage_limit_per_user:
-                return Response(
-                    {'error': 'شما بیش از حد مجاز از این کد تخفیف استفاده کرده‌اید'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-        # Check allowed emails
-        if discount.allowed_emails:
-            allowed_emails = discount.get_allowed_emails_list()
-            if request.user.email not in allowed_emails:
-                return Response(
-                    {'error': 'این کد تخفیف برای ایمیل شما معتبر نیست'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-        # Get cart total for min/max amount validation
-        cart = Cart.objects.get_or_create(user=request.user)[0]
-        cart_total = cart.get_total_price()
-
-        if discount.min_amount and cart_total < discount.min_amount:
-            return Response(
-                {'error': f'حداقل مبلغ خرید برای استفاده از این کد تخفیف {discount.min_amount} است'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if discount.max_amount and cart_total > discount.max_amount:
-            return Response(
-                {'error': f'حداکثر مبلغ خرید برای استفاده از این کد تخفیف {discount.max_amount} است'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Calculate discount amount
-        discount_amount = 0
-        if discount.discount_type == 'percentage':
-            discount_amount = (cart_total * discount.discount_value) / 100
-        elif discount.discount_type == 'fixed_cart':
-            discount_amount = discount.discount_value
-        elif discount.discount_type == 'fixed_product':
-            # Calculate for each eligible product
-            for item in cart.items.all():
-                if (not discount.products.exists() or item.product in discount.products.all()) and \
-                   (not discount.excluded_products.exists() or item.product not in discount.excluded_products.all()) and \
-                   (not discount.categories.exists() or item.product.category in discount.categories.all()) and \
-                   (not discount.excluded_categories.exists() or item.product.category not in discount.excluded_categories.all()) and \
-                   (not discount.exclude_sale_items or not item.product.is_on_sale):
-                    discount_amount += discount.discount_value * item.quantity
+        cart = Cart.objects.filter(user=request.user).order_by('-updated_at').first()
+        if cart is None:
+            cart = Cart.objects.create(user=request.user)
+        pricing = price_cart(cart, request.user, discount=discount)
+        if pricing.discount_error:
+            return Response({'error': pricing.discount_error}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             'code': discount.code,
             'discount_type': discount.discount_type,
             'discount_value': discount.discount_value,
-            'discount_amount': discount_amount,
+            'discount_amount': pricing.discount_amount,
             'free_shipping': discount.free_shipping
         })
+
+class SessionCartView(APIView):
+    """
+    Cart of an anonymous visitor, kept in the cache under a token from the
+    session or the X-Cart-Token header. It becomes a database cart on login.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        token = get_cart_token(request)
+        items = get_cart_storage(token).items() if token else {}
+        params = CartSummaryParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        pricing = price_lines(get_item_lines(items) if items else [], None, params.validated_data.get('shipping_method'))
+        return Response({'token': token, **CartSummarySerializer(pricing).data})
+
+    def post(self, request):
+        serializer = SessionCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        token = get_cart_token(request, create=True)
+        quantity = get_cart_storage(token).add(data['product_id'], data.get('variant_id'), data['quantity'])
+        return Response({
+            'token': token,
+            'product_id': data['product_id'],
+            'variant_id': data.get('variant_id'),
+            'quantity': quantity,
+        }, status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        serializer = SessionCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        token = get_cart_token(request, create=True)
+        get_cart_storage(token).set(data['product_id'], data.get('variant_id'), data['quantity'])
+        return Response({'token': token, **data})
+
+    def delete(self, request):
+        token = get_cart_token(request)
+        if token:
+            get_cart_storage(token).clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class SessionCartMergeView(APIView):
+    """Move the anonymous cart into the signed-in user's cart (for clients not using session login)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        token = get_cart_token(request)
+        cart = merge_session_cart(token, request.user) if token else None
+        request.session.pop('cart_token', None)
+        if cart is None:
+            return Response({'error': 'سبد خرید مهمان خالی است'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CartSerializer(cart, context={'request': request}).data)
+
+class ShippingQuoteView(APIView):
+    """
+    Price the visitor's cart (the latest cart when signed in, else the
+    session cart) with every active method of the address's zone.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        params = ShippingQuoteParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        zone, methods = resolve_shipping(data['country'], data.get('state', ''), data.get('city', ''))
+        if zone is None:
+            return Response({'error': 'ارسال به این آدرس امکان‌پذیر نیست'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.user.is_authenticated:
+            cart = Cart.objects.filter(user=request.user).order_by('-updated_at').first()
+            lines = get_cached_cart_lines(cart) if cart else []
+        else:
+            token = get_cart_token(request)
+            items = get_cart_storage(token).items() if token else {}
+            lines = get_item_lines(items) if items else []
+
+        user = request.user if request.user.is_authenticated else None
+        code = data.get('discount_code')
+        discount = DiscountCode.objects.filter(code=code).first() if code else None
+        error = None
+        if code and discount is None:
+            error = 'کد تخفیف نامعتبر است'
+        elif discount and user is None:
+            discount, error = None, 'برای استفاده از کد تخفیف وارد شوید'
+        pricing = price_lines(lines, user, discount=discount)
+        pricing.discount_error = pricing.discount_error or error
+
+        free = pricing.discount is not None and pricing.discount.free_shipping
+        quotes = [
+            replace(pricing, shipping_method=method, shipping_cost=Decimal('0') if free else method.price)
+            for method in methods
+        ]
+        return Response(ShippingQuotesSerializer({'zone': zone, 'pricing': pricing, 'quotes': quotes}).data)